@@ -0,0 +1,50 @@
+# Perfil de produção do servidor (gunicorn)
+#
+# WSGI (workers síncronos):
+#   gunicorn -c gunicorn.conf.py toolcare_api.wsgi:application
+# ASGI (workers uvicorn, rotas /api/async/):
+#   SERVIDOR_ASGI=true gunicorn -c gunicorn.conf.py toolcare_api.asgi:application
+#
+# Com ASGI, ative também o pool de conexões (DB_POOL=true, ver settings.py).
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# WEB_CONCURRENCY: número de processos. Padrão: 2 x CPUs + 1 (WSGI) ou 1 por CPU (ASGI)
+asgi = os.environ.get('SERVIDOR_ASGI', 'false').lower() == 'true'
+worker_class = 'uvicorn_worker.UvicornWorker' if asgi else 'sync'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * (1 if asgi else 2) + (0 if asgi else 1)))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recicla os workers periodicamente (evita crescimento de memória em processos longos)
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+# Métricas (METRICAS=true, ver toolcare_api/metricas.py): os workers gravam os valores em arquivos
+# numa pasta compartilhada, e o /metrics de qualquer um deles soma todos.
+# A variável precisa existir antes de os workers importarem o prometheus_client, por isso é definida aqui.
+metricas = os.environ.get('METRICAS', 'false').lower() == 'true'
+if metricas:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/toolcare_metricas')
+
+
+def on_starting(server):
+    # Contadores recomeçam a cada início do servidor: apaga os arquivos da execução anterior
+    if metricas:
+        import shutil
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+        os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def child_exit(server, worker):
+    # Worker reciclado (max_requests): os valores dele continuam somados, só os dados do processo vivo são descartados
+    if metricas:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ToolcareApiConfig(AppConfig):
+    name = 'toolcare_api'
+
+    def ready(self):
+        # Conecta os sinais que mantêm as versões das tabelas (ETag) e as lápides da sincronização
+        from . import versoes, sincronizacao # noqa: F401
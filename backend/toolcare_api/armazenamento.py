@@ -0,0 +1,68 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# --- ARMAZENAMENTO DAS FOTOS POR CONTEÚDO ---
+# O nome do arquivo gravado é o SHA-256 do conteúdo, dentro da pasta da entidade:
+#   ferramentas/3f/3fa9...e1.jpg  (as duas primeiras letras evitam milhares de arquivos numa pasta só)
+# - A mesma imagem enviada várias vezes (ou para vários cadastros) é gravada uma vez só.
+# - Um arquivo nunca muda de conteúdo sem mudar de nome, então a URL pode ser cacheada para sempre
+#   (ver servir_midia em views.py). As variantes (imagens.py) herdam o nome da foto e também são imutáveis.
+
+# Nome gerado por conteúdo: 64 dígitos hexadecimais, opcionalmente seguidos do sufixo da variante
+NOME_POR_CONTEUDO = re.compile(r'(^|/)[0-9a-f]{64}(_[a-z]+)?\.[0-9a-z]+$')
+
+
+def eh_imutavel(nome):
+    """ True se o arquivo foi nomeado pelo conteúdo (seguro para cache 'immutable') """
+    return bool(NOME_POR_CONTEUDO.search(nome))
+
+
+def hash_conteudo(arquivo):
+    """ SHA-256 (hex) do arquivo, lido em blocos """
+    sha = hashlib.sha256()
+    for bloco in arquivo.chunks():
+        sha.update(bloco)
+    return sha.hexdigest()
+
+
+@deconstructible
+class ArmazenamentoPorConteudo(FileSystemStorage):
+    """
+    FileSystemStorage que ignora o nome enviado e grava o arquivo pelo hash do conteúdo.
+    Mantém a pasta definida pelo upload_to e a extensão original (em minúsculas).
+    Se o arquivo já existir, nada é gravado: o campo só passa a apontar para ele.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # O nome final sai do conteúdo (_save): mesmo nome = mesmo arquivo, nunca um sufixo aleatório
+        return name
+
+    def nome_por_conteudo(self, nome, conteudo):
+        pasta = posixpath.dirname(nome)
+        extensao = posixpath.splitext(nome)[1].lower()
+        digest = hash_conteudo(conteudo)
+        return posixpath.join(pasta, digest[:2], f'{digest}{extensao}')
+
+    def _save(self, name, content):
+        nome = self.nome_por_conteudo(name, content)
+        if self.exists(nome):
+            return nome # Duplicata: reaproveita o arquivo existente
+        # Dois envios da mesma imagem ao mesmo tempo passam juntos pelo exists(): cada um grava
+        # num temporário e o publica com os.replace (atômico). Quem chega por último troca o arquivo
+        # por outro idêntico, e nenhum leitor vê um arquivo pela metade.
+        temporario = super()._save(posixpath.join(posixpath.dirname(nome), f'.{uuid.uuid4().hex}.tmp'), content)
+        try:
+            os.replace(self.path(temporario), self.path(nome))
+        except OSError:
+            self.delete(temporario)
+            raise
+        return nome
+
+
+armazenamento_fotos = ArmazenamentoPorConteudo()
@@ -0,0 +1,144 @@
+from functools import cached_property
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Usuario
+
+# --- AUTENTICAÇÃO JWT SEM CONSULTA AO BANCO ---
+# O token de login já carrega tipo, nome, ids das filiais e a versão do token
+# (ver CustomTokenObtainPairSerializer.get_token). A cada requisição o usuário é montado
+# a partir dessas claims; só a versão é conferida, e ela fica em cache.
+
+CLAIM_VERSAO = 'versao'
+CLAIM_FILIAIS = 'filiais'
+
+# Por quanto tempo a versão lida do banco fica no cache 'versao_token' (settings.CACHE_VERSAO_TOKEN_SEGUNDOS).
+# Com cache compartilhado (CACHE_VERSAO_TOKEN=arquivo ou Redis) a revogação vale na hora, pois a chave é
+# apagada ao revogar; com o cache em memória, os outros processos a enxergam em até esse tempo.
+TEMPO_CACHE_VERSAO = settings.CACHE_VERSAO_TOKEN_SEGUNDOS
+
+# Versão gravada no cache para usuários inativos ou inexistentes (nunca bate com um token)
+VERSAO_INVALIDA = -1
+
+
+def _consulta_versao(usuario_id):
+    return Usuario.objects.filter(pk=usuario_id, ativo=True).values_list('versao_token', flat=True)
+
+
+def versao_token_vigente(usuario_id):
+    """ Versão de token aceita para o usuário; lida do cache e, na falta, do banco (1 coluna) """
+    cache = Usuario.cache_versao_token()
+    chave = Usuario.chave_versao_token(usuario_id)
+    versao = cache.get(chave)
+    if versao is None:
+        versao = _consulta_versao(usuario_id).first()
+        if versao is None:
+            versao = VERSAO_INVALIDA
+        cache.set(chave, versao, TEMPO_CACHE_VERSAO)
+    return versao
+
+
+async def aversao_token_vigente(usuario_id):
+    """ Versão assíncrona de versao_token_vigente (usada pelas views de views_async.py) """
+    cache = Usuario.cache_versao_token()
+    chave = Usuario.chave_versao_token(usuario_id)
+    versao = await cache.aget(chave)
+    if versao is None:
+        versao = await _consulta_versao(usuario_id).afirst()
+        if versao is None:
+            versao = VERSAO_INVALIDA
+        await cache.aset(chave, versao, TEMPO_CACHE_VERSAO)
+    return versao
+
+
+class UsuarioToken(TokenUser):
+    """
+    Usuário "leve" montado a partir das claims do token, sem linha do banco.
+    Expõe o que as permissões, o escopo (escopo.py) e os serializers usam: id, tipo, nome e filial_ids.
+    """
+    ativo = True
+
+    @cached_property
+    def id(self):
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def tipo(self):
+        return self.token.get('tipo')
+
+    @cached_property
+    def nome(self):
+        return self.token.get('nome', '')
+
+    @cached_property
+    def filial_ids(self):
+        return frozenset(self.token.get(CLAIM_FILIAIS, ()))
+
+    def __str__(self):
+        return self.nome
+
+    def __eq__(self, other):
+        # Permite comparar com instâncias de Usuario (ex: "editando a si mesmo" em UsuarioPermissions)
+        if isinstance(other, Usuario):
+            return other.pk == self.id
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class JWTSemConsultaAuthentication(JWTAuthentication):
+    """
+    Igual ao JWTAuthentication do SimpleJWT, mas não carrega o Usuario do banco:
+    devolve um UsuarioToken e confere só a versão do token (desativação, troca de tipo,
+    senha ou filiais incrementam a versão e derrubam os tokens antigos).
+    Tokens emitidos antes da claim de versão seguem pelo caminho antigo (consulta ao banco).
+    """
+    def get_user(self, validated_token):
+        if CLAIM_VERSAO not in validated_token:
+            return super().get_user(validated_token)
+
+        user = UsuarioToken(validated_token)
+        return self._conferir_versao(user, versao_token_vigente(user.id))
+
+    # --- VERSÃO ASSÍNCRONA (views_async.py) ---
+
+    async def aauthenticate(self, request):
+        """ Igual a authenticate(), mas a conferência da versão usa cache e ORM assíncronos """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if CLAIM_VERSAO not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token)
+
+        user = UsuarioToken(validated_token)
+        return self._conferir_versao(user, await aversao_token_vigente(user.id))
+
+    def _conferir_versao(self, user, versao_vigente):
+        if versao_vigente != user.token[CLAIM_VERSAO]:
+            raise AuthenticationFailed('Sessão expirada. Faça login novamente.', code='token_revogado')
+        return user
+
+
+class JWTEventosAuthentication(JWTSemConsultaAuthentication):
+    """
+    Para /api/eventos/: o EventSource do navegador não envia cabeçalhos,
+    então o token de acesso também é aceito em ?token=.
+    """
+    def get_header(self, request):
+        header = super().get_header(request)
+        if header is None and request.GET.get('token'):
+            return f"{api_settings.AUTH_HEADER_TYPES[0]} {request.GET['token']}".encode()
+        return header
@@ -0,0 +1,37 @@
+from django.db import models
+from django.db.models import Func, Lookup, TextField
+from django.db.models.lookups import IContains
+
+# --- BUSCA SEM ACENTO (TRIGRAMA + UNACCENT) ---
+# 'manutencao' encontra 'Manutenção' e vice-versa.
+# No Postgres a busca vira:  f_unaccent(coluna) ILIKE f_unaccent('%valor%')
+# que é atendida pelos índices GIN (gin_trgm_ops) criados sobre f_unaccent(coluna) (ver migração 0008).
+
+class SemAcento(Func):
+    """
+    Wrapper IMMUTABLE da função unaccent() do Postgres (criado na migração 0008).
+    unaccent() é apenas STABLE e por isso não pode ser usada em expressões de índice.
+    """
+    function = 'f_unaccent'
+    arity = 1
+    output_field = TextField()
+
+
+@models.CharField.register_lookup
+@models.TextField.register_lookup
+class BuscaSemAcento(Lookup):
+    """
+    Lookup 'busca': contém o texto, ignorando maiúsculas e acentos.
+    Ex: Ferramenta.objects.filter(nome__busca='furadeira')
+    Em outros bancos (ex: SQLite) equivale a __icontains.
+    """
+    lookup_name = 'busca'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        return IContains(self.lhs, self.rhs).as_sql(compiler, connection)
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = compiler.compile(SemAcento(self.lhs))
+        padrao = f'%{connection.ops.prep_for_like_query(self.rhs)}%'
+        return f'{lhs} ILIKE f_unaccent(%s)', (*lhs_params, padrao)
@@ -0,0 +1,72 @@
+import hashlib
+import uuid
+
+from django.core.cache import caches
+
+# --- CACHE DAS LISTAGENS DE REFERÊNCIA ---
+# Filiais, depósitos, setores e cargos: tabelas pequenas, que quase não mudam e que todo
+# formulário carrega. A listagem pronta (dados + ETag) fica no cache 'referencias' (settings.CACHES),
+# com chave pelo escopo do usuário (filiais do coordenador, ou todas), pela URL (somente_ativos,
+# somente_inativos, busca, página) e pelas "gerações" das tabelas que a resposta usa.
+#
+# Invalidação na escrita: cada (tabela, filial) tem uma geração guardada no próprio cache,
+# trocada por um valor novo sempre que VersaoTabela registra uma alteração, com as mesmas chaves
+# (ver VersaoTabela._incrementar). As listagens guardadas com a geração antiga deixam de ser lidas
+# e expiram sozinhas. Trocar o valor (em vez de somar 1) dispensa incremento atômico no backend:
+# duas escritas simultâneas nunca devolvem a geração a um valor que algum leitor já usou.
+
+ALIAS_CACHE = 'referencias'
+
+# Rede de segurança: mesmo sem invalidação (ex: cache em memória com vários processos), a listagem expira
+TEMPO_CACHE_REFERENCIAS = 600
+
+# Prefixo das listagens guardadas: trocar junto com o formato do valor (ver guardar_listagem),
+# para um cache compartilhado nunca devolver uma listagem no formato antigo
+PREFIXO_LISTAGEM = 'listagem:2:'
+
+
+def _cache():
+    return caches[ALIAS_CACHE]
+
+
+def _chave_geracao(tabela, filial_id):
+    return f'geracao:{tabela}:{filial_id}'
+
+
+def invalidar(tabela, filial_ids):
+    """ Nova geração para (tabela, filial_id) de cada filial: as listagens que dependem delas são descartadas """
+    _cache().set_many({_chave_geracao(tabela, filial_id): uuid.uuid4().hex for filial_id in filial_ids}, timeout=None)
+
+
+def _geracoes(chaves):
+    cache = _cache()
+    nomes = sorted(_chave_geracao(tabela, filial_id) for tabela, filial_id in chaves)
+    geracoes = cache.get_many(nomes)
+    for nome in nomes:
+        if nome not in geracoes:
+            # Geração nunca gravada (ou descartada pelo cache): começa uma nova.
+            # add() não sobrescreve a de outro processo que tenha chegado antes.
+            cache.add(nome, uuid.uuid4().hex, timeout=None)
+            geracoes[nome] = cache.get(nome)
+    return [geracoes[nome] for nome in nomes]
+
+
+def chave_da_listagem(chaves_versoes, *partes):
+    """
+    Chave da listagem no cache: gerações de 'chaves_versoes' ((tabela, filial_id), ver
+    VersaoTabela.chaves_versoes) + o que mais distingue a resposta (escopo, URL, formato).
+    Deve ser calculada ANTES da consulta principal: uma escrita no meio do caminho troca
+    a geração e a listagem guardada com a chave antiga nunca é servida.
+    """
+    identidade = [sorted(chaves_versoes), _geracoes(chaves_versoes), *partes]
+    return PREFIXO_LISTAGEM + hashlib.sha1(repr(identidade).encode()).hexdigest()
+
+
+def obter_listagem(chave):
+    """ (etag, dados, cabeçalhos) guardados, ou None """
+    return _cache().get(chave)
+
+
+def guardar_listagem(chave, etag, dados, cabecalhos):
+    """ 'cabecalhos': os da resposta original que não são recalculados (ex: X-Resultado-Truncado da paginação) """
+    _cache().set(chave, (etag, dados, cabecalhos), TEMPO_CACHE_REFERENCIAS)
@@ -0,0 +1,76 @@
+from functools import cached_property
+
+from .models import Filial
+
+
+class EscopoUsuario:
+    """
+    Filiais que o usuário pode acessar, resolvidas uma única vez por requisição.
+
+    - Máximo/Administrador: sem restrição (restrito = False).
+    - Coordenador: apenas as filiais vinculadas a ele.
+
+    Filtros de queryset usam 'filiais' como subconsulta (não custa ida extra ao banco);
+    checagens em Python usam 'filial_ids', carregado na primeira vez que for pedido
+    e reaproveitado pelo resto da requisição (views, serializers e dashboard).
+    """
+    def __init__(self, user):
+        self.user = user
+        self.restrito = user.is_authenticated and user.tipo == 'COORDENADOR'
+
+        # Usuário autenticado pelo token (autenticacao.UsuarioToken) já traz os ids das filiais
+        ids_do_token = getattr(user, 'filial_ids', None)
+        if self.restrito and ids_do_token is not None:
+            self.filial_ids = frozenset(ids_do_token)
+
+    @property
+    def filiais(self):
+        """ Queryset das filiais permitidas (todas, se não houver restrição) """
+        if not self.restrito:
+            return Filial.objects.all()
+        if 'filial_ids' in self.__dict__:
+            return Filial.objects.filter(id__in=self.filial_ids)
+        return self.user.filiais.all()
+
+    @cached_property
+    def filial_ids(self):
+        """ frozenset com os ids das filiais permitidas (None = sem restrição) """
+        if not self.restrito:
+            return None
+        return frozenset(self.user.filiais.values_list('id', flat=True))
+
+    async def acarregar(self):
+        """
+        Carrega 'filial_ids' pelo ORM assíncrono (views de views_async.py).
+        Depois disso, nenhum método do escopo consulta o banco.
+        """
+        if self.restrito and 'filial_ids' not in self.__dict__:
+            self.filial_ids = frozenset([filial_id async for filial_id in self.user.filiais.values_list('id', flat=True)])
+
+    def _filtro_ids(self):
+        # Se os ids já foram carregados nesta requisição, usa a lista; senão, a subconsulta
+        if 'filial_ids' in self.__dict__:
+            return self.filial_ids
+        return self.user.filiais.values('id')
+
+    def permite_filial(self, filial_id):
+        return not self.restrito or filial_id in self.filial_ids
+
+    def filtrar(self, queryset, caminho_filial):
+        """
+        Restringe o queryset às filiais permitidas.
+        'caminho_filial' é o lookup até a filial (ex: 'deposito__filial', 'ferramenta__deposito__filial').
+        """
+        if not self.restrito:
+            return queryset
+        return queryset.filter(**{f'{caminho_filial}__in': self._filtro_ids()})
+
+
+def obter_escopo(request):
+    """ Escopo do usuário da requisição, criado na primeira chamada e guardado na própria requisição """
+    http_request = getattr(request, '_request', request)
+    escopo = getattr(http_request, 'escopo_usuario', None)
+    if escopo is None or escopo.user is not request.user:
+        escopo = EscopoUsuario(request.user)
+        http_request.escopo_usuario = escopo
+    return escopo
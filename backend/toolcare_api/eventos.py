@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import threading
+import weakref
+
+import psycopg
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# --- EVENTOS EM TEMPO REAL ---
+# Mudanças de estado das ferramentas (empréstimo, devolução, manutenção, desativar/reativar)
+# são publicadas após o commit (ver publicar_estado_ferramentas em models.py) e entregues
+# às conexões abertas em /api/eventos/ (Server-Sent Events, ver views_async.py), cada uma
+# filtrada pelas filiais do usuário.
+#
+# EVENTOS_BACKEND (settings) escolhe o transporte:
+#   'local' (padrão): entrega só às conexões do próprio processo. Adequado a um processo (runserver/uvicorn).
+#   'postgres': publica com NOTIFY; cada processo com conexões abertas mantém uma conexão em LISTEN
+#     e repassa os eventos às suas. Necessário com vários workers (gunicorn), sem serviço extra.
+
+CANAL_POSTGRES = 'toolcare_eventos'
+
+# Eventos guardados por conexão. Cliente lento que encher a fila recebe 'resincronizar' no lugar deles
+TAMANHO_FILA = 100
+
+# Espera antes de reconectar o LISTEN após queda do Postgres
+ESPERA_RECONEXAO = 5
+
+# Evento sem filial: vale para todos os assinantes (ex: aviso de eventos perdidos)
+EVENTO_RESINCRONIZAR = {'tipo': 'resincronizar'}
+
+
+class Assinatura:
+    """
+    Uma conexão SSE: fila asyncio no loop da conexão, alimentada de qualquer thread.
+    filial_ids=None: recebe os eventos de todas as filiais.
+    """
+    def __init__(self, broker, filial_ids):
+        self.broker = broker
+        self.filial_ids = filial_ids
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+
+    def entregar(self, evento):
+        """ Chamado pelo broker, em qualquer thread """
+        if self.filial_ids is not None and 'filial_id' in evento and evento['filial_id'] not in self.filial_ids:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._enfileirar, evento)
+        except RuntimeError:
+            pass # Loop já encerrado: a conexão está sendo fechada
+
+    def _enfileirar(self, evento):
+        try:
+            self.fila.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta a fila e pede que ele busque o estado atual (ex: ?atualizado_desde=)
+            while not self.fila.empty():
+                self.fila.get_nowait()
+            self.fila.put_nowait(EVENTO_RESINCRONIZAR)
+
+    async def proximo(self):
+        return await self.fila.get()
+
+    def cancelar(self):
+        self.broker.cancelar(self)
+
+
+class BrokerLocal:
+    """ Distribui os eventos às assinaturas deste processo """
+
+    def __init__(self):
+        self._assinaturas = set()
+        self._trava = threading.Lock()
+
+    def assinar(self, filial_ids=None):
+        """ Nova assinatura, no loop asyncio em execução. Chamar cancelar() ao fechar a conexão """
+        assinatura = Assinatura(self, filial_ids)
+        with self._trava:
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._trava:
+            self._assinaturas.discard(assinatura)
+
+    def publicar(self, evento):
+        self._distribuir(evento)
+
+    def _distribuir(self, evento):
+        with self._trava:
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            assinatura.entregar(evento)
+
+    @property
+    def total_assinaturas(self):
+        return len(self._assinaturas)
+
+
+class BrokerPostgres(BrokerLocal):
+    """
+    Entre processos pelo LISTEN/NOTIFY do próprio Postgres.
+    publicar() envia o NOTIFY pela conexão do Django; a escuta usa uma conexão assíncrona
+    separada, aberta na primeira assinatura de cada loop (um por worker ASGI).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._escutas = weakref.WeakKeyDictionary()
+
+    def assinar(self, filial_ids=None):
+        loop = asyncio.get_running_loop()
+        escuta = self._escutas.get(loop)
+        if escuta is None or escuta.done():
+            self._escutas[loop] = loop.create_task(self._escutar())
+        return super().assinar(filial_ids)
+
+    def publicar(self, evento):
+        # Chamado após o commit (autocommit): o NOTIFY é entregue na hora
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CANAL_POSTGRES, json.dumps(evento)])
+
+    async def _escutar(self):
+        primeira = True
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(**_parametros_conexao(), autocommit=True) as conexao:
+                    await conexao.execute(f'LISTEN {CANAL_POSTGRES}')
+                    if not primeira:
+                        # Eventos publicados durante a queda foram perdidos
+                        self._distribuir(EVENTO_RESINCRONIZAR)
+                    primeira = False
+                    async for notificacao in conexao.notifies():
+                        self._distribuir(json.loads(notificacao.payload))
+            except (psycopg.Error, OSError) as erro:
+                logger.warning('Escuta de eventos interrompida (%s); reconectando em %ss', erro, ESPERA_RECONEXAO)
+                await asyncio.sleep(ESPERA_RECONEXAO)
+
+
+def _parametros_conexao():
+    banco = connection.settings_dict
+    parametros = {
+        'dbname': banco['NAME'], 'user': banco['USER'], 'password': banco['PASSWORD'],
+        'host': banco['HOST'], 'port': banco['PORT'],
+    }
+    return {nome: valor for nome, valor in parametros.items() if valor}
+
+
+BACKENDS = {'local': BrokerLocal, 'postgres': BrokerPostgres}
+
+_broker = None
+_trava_broker = threading.Lock()
+
+
+def obter_broker():
+    """ Broker do processo, criado no primeiro uso conforme settings.EVENTOS_BACKEND """
+    global _broker
+    with _trava_broker:
+        if _broker is None:
+            _broker = BACKENDS[settings.EVENTOS_BACKEND]()
+        return _broker
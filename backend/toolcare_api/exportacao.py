@@ -0,0 +1,71 @@
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Quantidade de linhas buscadas por vez no cursor do banco (server-side cursor no Postgres)
+TAMANHO_LOTE = 2000
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Eco:
+    """ Pseudo-buffer: o csv.writer "escreve" aqui e recebemos a linha pronta de volta """
+    def write(self, valor):
+        return valor
+
+
+def _linhas_csv(linhas, colunas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(colunas)
+    for linha in linhas:
+        yield escritor.writerow(linha)
+
+
+def _linhas_ndjson(linhas, colunas):
+    for linha in linhas:
+        yield json.dumps(dict(zip(colunas, linha)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+async def _em_lotes(gerador):
+    """
+    Versão assíncrona do gerador, para o ASGI: com um iterador síncrono o Django lê a resposta
+    inteira para a memória (sync_to_async(list)) antes de enviar o primeiro byte.
+    Cada lote de TAMANHO_LOTE linhas é lido na thread da requisição (thread_sensitive),
+    a mesma conexão que abriu o cursor do banco.
+    """
+    proximo_lote = sync_to_async(lambda: ''.join(itertools.islice(gerador, TAMANHO_LOTE)), thread_sensitive=True)
+    try:
+        while lote := await proximo_lote():
+            yield lote
+    finally:
+        # Cliente desconectou no meio: fecha o cursor do banco na mesma thread
+        await sync_to_async(gerador.close, thread_sensitive=True)()
+
+
+def resposta_exportacao(request, queryset, colunas, formato, nome_arquivo):
+    """
+    Gera a resposta de exportação em streaming (CSV ou NDJSON).
+    As linhas são lidas do banco em lotes e enviadas conforme são geradas,
+    então a memória usada não depende do tamanho do histórico (WSGI e ASGI).
+    Retorna None se o formato não for suportado.
+    """
+    if formato not in FORMATOS:
+        return None
+
+    linhas = queryset.values_list(*colunas).iterator(chunk_size=TAMANHO_LOTE)
+    gerador = _linhas_csv(linhas, colunas) if formato == 'csv' else _linhas_ndjson(linhas, colunas)
+
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        gerador = _em_lotes(gerador)
+
+    response = StreamingHttpResponse(gerador, content_type=FORMATOS[formato])
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}.{formato}"'
+    return response
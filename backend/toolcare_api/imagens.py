@@ -0,0 +1,121 @@
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.functions import Now
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# --- VARIANTES DAS FOTOS (MINIATURA E MÉDIA) ---
+# As fotos enviadas (muitas vezes 4-8 MB, direto da câmera do celular) ficam intactas;
+# ao lado delas são geradas versões WebP reduzidas, usadas pelas listagens (miniatura)
+# e pelos modais de detalhe (média).
+# O caminho da variante é derivado do caminho da foto:
+#   ferramentas/3f/3fa9...e1.jpg -> ferramentas/3f/variantes/3fa9...e1_miniatura.webp
+# As variantes são gravadas no storage padrão (no caminho exato, sem renomear pelo conteúdo).
+# A coluna foto_variantes do cadastro diz se elas já existem: as listagens montam as URLs
+# sem consultar o disco linha a linha (marcada após a geração, ver marcar_variantes; cadastros
+# anteriores à coluna são marcados pelo comando gerar_variantes_fotos).
+
+# Nome da variante -> maior lado em pixels
+VARIANTES = {
+    'miniatura': 200,
+    'media': 800,
+}
+
+QUALIDADE_WEBP = 80
+
+
+def caminho_variante(nome_foto, variante):
+    """ Caminho (no storage) da variante de uma foto """
+    pasta, arquivo = posixpath.split(nome_foto)
+    base = posixpath.splitext(arquivo)[0]
+    return posixpath.join(pasta, 'variantes', f'{base}_{variante}.webp')
+
+
+def url_variante(foto, variante, gerada):
+    """
+    URL da variante da foto, ou da própria foto se as variantes ainda não foram geradas
+    ('gerada' = foto_variantes do cadastro; ex: foto antiga ainda não processada pelo comando 'gerar_variantes_fotos').
+    """
+    if not foto:
+        return None
+    if gerada:
+        return default_storage.url(caminho_variante(foto.name, variante))
+    return foto.url
+
+
+def variantes_existem(nome_foto):
+    """ True se todas as variantes da foto estão no storage """
+    return all(default_storage.exists(caminho_variante(nome_foto, variante)) for variante in VARIANTES)
+
+
+def marcar_variantes(cadastros):
+    """
+    Marca foto_variantes nos cadastros do queryset (Ferramenta ou Funcionario), cujas variantes já foram geradas.
+    É um update() direto (não passa pelos sinais de save): a versão da tabela é incrementada aqui.
+    """
+    from .models import VersaoTabela # models.py importa este módulo
+    if cadastros.filter(foto_variantes=False).update(foto_variantes=True, atualizado_em=Now()):
+        VersaoTabela.registrar_alteracao(cadastros.model._meta.model_name)
+
+
+def gerar_variantes(foto, sobrescrever=True):
+    """
+    Gera (ou regera) as variantes WebP de uma foto já gravada no storage.
+    Retorna quantas variantes foram gravadas; 0 se a foto não existir ou não for uma imagem válida.
+    """
+    if not foto or not foto.storage.exists(foto.name):
+        return 0
+    pendentes = {
+        variante: lado for variante, lado in VARIANTES.items()
+        if sobrescrever or not default_storage.exists(caminho_variante(foto.name, variante))
+    }
+    if not pendentes:
+        return 0
+
+    try:
+        with foto.storage.open(foto.name, 'rb') as arquivo:
+            imagem = Image.open(arquivo)
+            # JPEG: decodifica já reduzido (muito mais rápido que abrir os 12 MP e reduzir depois)
+            imagem.draft('RGB', (max(pendentes.values()),) * 2)
+            imagem = ImageOps.exif_transpose(imagem) # Fotos de celular vêm "deitadas" com a rotação no EXIF
+            imagem = imagem.convert('RGBA' if 'A' in imagem.getbands() or 'transparency' in imagem.info else 'RGB')
+    except (OSError, ValueError) as erro:
+        logger.warning('Não foi possível gerar variantes de %s: %s', foto.name, erro)
+        return 0
+
+    # Da maior para a menor: cada variante parte da anterior, já reduzida
+    for variante, lado in sorted(pendentes.items(), key=lambda item: -item[1]):
+        imagem.thumbnail((lado, lado), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        conteudo = io.BytesIO()
+        imagem.save(conteudo, 'WEBP', quality=QUALIDADE_WEBP, method=4)
+
+        caminho = caminho_variante(foto.name, variante)
+        if default_storage.exists(caminho):
+            default_storage.delete(caminho)
+        default_storage.save(caminho, ContentFile(conteudo.getvalue()))
+    return len(pendentes)
+
+
+def foto_enviada(foto):
+    """ True se a foto acabou de ser enviada (ainda não gravada no storage) """
+    return bool(foto) and not foto._committed
+
+
+def gerar_variantes_ao_salvar(foto):
+    """
+    Agenda a geração das variantes para depois do commit (o processamento da imagem não segura a transação).
+    Foto repetida (mesmo conteúdo, mesmo nome) já tem as variantes: nada é refeito.
+    Com as variantes no storage, o cadastro é marcado e as listagens passam a usá-las.
+    """
+    def gerar_e_marcar():
+        gerar_variantes(foto, sobrescrever=False)
+        if variantes_existem(foto.name):
+            cadastro = foto.instance
+            marcar_variantes(type(cadastro).objects.filter(pk=cadastro.pk, foto=foto.name))
+    transaction.on_commit(gerar_e_marcar)
@@ -0,0 +1,185 @@
+import contextlib
+import contextvars
+import functools
+import heapq
+import logging
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+# --- INSTRUMENTAÇÃO POR REQUISIÇÃO ---
+# Opcional (INSTRUMENTACAO=true, ver settings.py): o middleware só entra no MIDDLEWARE quando ligado,
+# e só então as medições abaixo são instaladas. Desligado, não há nenhum custo.
+#
+# Por requisição: número de consultas SQL e tempo no banco, tempo nos serializers e na renderização do JSON.
+# Vão no cabeçalho Server-Timing (aparece na aba Network do navegador) e, acima de
+# INSTRUMENTACAO_LIMITE_LENTA_MS, num log de requisição lenta com as consultas mais demoradas.
+# As consultas aparecem como o Django as monta (%s no lugar dos valores): parâmetros nunca vão para o log.
+#
+# Respostas em streaming (exportações, /api/eventos/) são medidas até o início do envio.
+
+# Consultas mais lentas guardadas por requisição (as demais só entram na contagem e no tempo total)
+MAX_CONSULTAS_NO_LOG = 5
+
+# Corte do texto de cada consulta no log
+TAMANHO_MAXIMO_SQL = 1000
+
+_medicao_atual = contextvars.ContextVar('medicao_requisicao', default=None)
+
+# Literais em SQL escrito à mão (o ORM sempre usa %s); listas longas de %s viram uma só
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LISTA_PARAMETROS = re.compile(r'%s(?:, %s)+')
+
+
+class Medicao:
+    """ Tempos de uma requisição. A contextvar leva a mesma instância às threads do sync_to_async """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempos = {'serializacao': 0.0, 'renderizacao': 0.0}
+        self.em_andamento = set()
+        self.mais_lentas = [] # heap de (duração, ordem, sql), no máximo MAX_CONSULTAS_NO_LOG
+
+    def registrar_consulta(self, sql, duracao):
+        self.consultas += 1
+        self.tempo_banco += duracao
+        item = (duracao, self.consultas, sql)
+        if len(self.mais_lentas) < MAX_CONSULTAS_NO_LOG:
+            heapq.heappush(self.mais_lentas, item)
+        elif duracao > self.mais_lentas[0][0]:
+            heapq.heapreplace(self.mais_lentas, item)
+
+
+def _medir_fase(fase, funcao):
+    """ Soma o tempo de 'funcao' na fase; chamadas aninhadas (ex: serializer dentro de serializer) contam uma vez """
+    @functools.wraps(funcao)
+    def medida(*args, **kwargs):
+        medicao = _medicao_atual.get()
+        if medicao is None or fase in medicao.em_andamento:
+            return funcao(*args, **kwargs)
+        medicao.em_andamento.add(fase)
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            medicao.tempos[fase] += time.perf_counter() - inicio
+            medicao.em_andamento.discard(fase)
+    return medida
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicao.registrar_consulta(sql, time.perf_counter() - inicio)
+
+
+def _registrar_na_conexao(sender=None, connection=None, **kwargs):
+    # connection_created dispara a cada nova conexão do mesmo DatabaseWrapper (ex: CONN_MAX_AGE=0)
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+_instalada = False
+
+
+def instalar_medicoes():
+    """ Liga as medições (uma vez por processo): consultas de todas as conexões, serializers e JSONRenderer """
+    global _instalada
+    if _instalada:
+        return
+    # Serializer.data e ListSerializer.data chamam BaseSerializer.data (onde roda o to_representation)
+    BaseSerializer.data = property(_medir_fase('serializacao', BaseSerializer.data.fget))
+    JSONRenderer.render = _medir_fase('renderizacao', JSONRenderer.render)
+    connection_created.connect(_registrar_na_conexao)
+    for conexao in connections.all(initialized_only=True):
+        _registrar_na_conexao(connection=conexao)
+    _instalada = True
+
+
+@contextlib.contextmanager
+def medindo():
+    """ Medição da requisição atual: reaproveita a de um middleware mais externo ou abre uma nova """
+    medicao = _medicao_atual.get()
+    if medicao is not None:
+        yield medicao
+        return
+    medicao = Medicao()
+    token = _medicao_atual.set(medicao)
+    try:
+        yield medicao
+    finally:
+        _medicao_atual.reset(token)
+
+
+def sql_sem_parametros(sql):
+    """ Texto da consulta para o log: sem valores e com as listas de %s resumidas """
+    sql = _LITERAL_TEXTO.sub("'?'", str(sql))
+    sql = _LISTA_PARAMETROS.sub(lambda lista: f"%s x{lista.group(0).count('%s')}", sql)
+    return sql if len(sql) <= TAMANHO_MAXIMO_SQL else sql[:TAMANHO_MAXIMO_SQL] + '...'
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede a requisição e adiciona o cabeçalho Server-Timing. Deve ser o primeiro do MIDDLEWARE
+    (o 'total' inclui os demais). Funciona sob WSGI e ASGI sem trocar de thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limite_lenta = settings.INSTRUMENTACAO_LIMITE_LENTA_MS / 1000
+        instalar_medicoes()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with medindo() as medicao:
+            response = self.get_response(request)
+        return self._concluir(request, response, medicao)
+
+    async def __acall__(self, request):
+        with medindo() as medicao:
+            response = await self.get_response(request)
+        return self._concluir(request, response, medicao)
+
+    def _concluir(self, request, response, medicao):
+        total = time.perf_counter() - medicao.inicio
+        response['Server-Timing'] = ', '.join([
+            f'banco;dur={medicao.tempo_banco * 1000:.1f};desc="{medicao.consultas} consultas"',
+            f"serializacao;dur={medicao.tempos['serializacao'] * 1000:.1f}",
+            f"renderizacao;dur={medicao.tempos['renderizacao'] * 1000:.1f}",
+            f'total;dur={total * 1000:.1f}',
+        ])
+        if total >= self.limite_lenta:
+            self._registrar_lenta(request, response, medicao, total)
+        return response
+
+    def _registrar_lenta(self, request, response, medicao, total):
+        # Só o caminho e os nomes dos parâmetros: valores da URL podem ser buscas ou o ?token= dos eventos
+        parametros = f" (parâmetros: {', '.join(sorted(request.GET))})" if request.GET else ''
+        linhas = [
+            f'Requisição lenta: {request.method} {request.path}{parametros} -> {response.status_code} em {total * 1000:.1f} ms '
+            f'(banco {medicao.tempo_banco * 1000:.1f} ms em {medicao.consultas} consultas, '
+            f"serialização {medicao.tempos['serializacao'] * 1000:.1f} ms, renderização {medicao.tempos['renderizacao'] * 1000:.1f} ms)"
+        ]
+        for duracao, ordem, sql in sorted(medicao.mais_lentas, reverse=True):
+            linhas.append(f'  {duracao * 1000:8.1f} ms  #{ordem}  {sql_sem_parametros(sql)}')
+        logger.warning('\n'.join(linhas))
@@ -0,0 +1,359 @@
+import datetime
+import http.client
+import json
+import random
+import statistics
+import subprocess
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from toolcare_api.management.commands.populate_db import NOMES_FERRAMENTAS, SENHA_PADRAO
+from toolcare_api.models import Usuario, Filial, Ferramenta, Funcionario, Emprestimo, Manutencao
+
+# Incrementar ao mudar o formato do JSON gerado
+VERSAO_RELATORIO = 1
+
+# Peso de cada cenário no sorteio de cada usuário virtual (proporção aproximada do uso real)
+CENARIOS = {
+    'dashboard': 4,   # Tela inicial consultando o dashboard periodicamente
+    'busca': 3,       # Busca de ferramentas por nome, paginada
+    'historico': 2,   # Histórico de empréstimos, três páginas seguidas
+    'emprestimo': 1,  # Dropdown de funcionários, empréstimo e devolução
+    'login': 0.5,     # Novo login (token expirado, troca de turno)
+}
+
+# Rotas de leitura: síncronas (padrão) ou as versões de views_async.py (--assincrono)
+ROTAS_LEITURA = {
+    False: {'dashboard': '/api/dashboard/', 'ferramentas': '/api/ferramentas/', 'emprestimos': '/api/emprestimos/'},
+    True: {'dashboard': '/api/async/dashboard/', 'ferramentas': '/api/async/ferramentas/', 'emprestimos': '/api/async/emprestimos/'},
+}
+
+TERMOS_BUSCA = [nome.split()[0].lower() for nome in NOMES_FERRAMENTAS]
+
+
+class ClienteHTTP:
+    """ Conexão keep-alive de um usuário virtual; cada requisição vira uma amostra (rótulo, status, segundos, instante) """
+
+    def __init__(self, host, porta, amostras):
+        self.host, self.porta, self.amostras = host, porta, amostras
+        self.token = None
+        self.conexao = None
+
+    def requisitar(self, rotulo, metodo, caminho, corpo=None):
+        cabecalhos = {'Accept': 'application/json'}
+        if self.token:
+            cabecalhos['Authorization'] = f'Bearer {self.token}'
+        if corpo is not None:
+            corpo = json.dumps(corpo)
+            cabecalhos['Content-Type'] = 'application/json'
+
+        inicio = time.perf_counter()
+        try:
+            if self.conexao is None:
+                self.conexao = http.client.HTTPConnection(self.host, self.porta, timeout=60)
+            self.conexao.request(metodo, caminho, body=corpo, headers=cabecalhos)
+            resposta = self.conexao.getresponse()
+            conteudo = resposta.read()
+            status_http = resposta.status
+            if resposta.getheader('Connection', '').lower() == 'close':
+                self.fechar()
+        except (OSError, http.client.HTTPException):
+            self.fechar()
+            status_http, conteudo = None, b''
+        self.amostras.append((rotulo, status_http, time.perf_counter() - inicio, time.monotonic()))
+
+        try:
+            return status_http, json.loads(conteudo) if conteudo else None
+        except ValueError:
+            return status_http, None
+
+    def fechar(self):
+        if self.conexao is not None:
+            self.conexao.close()
+            self.conexao = None
+
+
+class UsuarioVirtual:
+    """ Executa cenários sorteados (ver CENARIOS) até o fim do teste, com o seu próprio token e sorteio """
+
+    def __init__(self, comando, cpf, indice):
+        self.comando = comando
+        self.cpf = cpf
+        self.rng = random.Random(comando.opcoes['semente'] + indice)
+        self.cliente = ClienteHTTP(comando.host, comando.porta, comando.amostras)
+        self.rotas = ROTAS_LEITURA[comando.opcoes['assincrono']]
+        self.filial_ids = comando.filiais_por_cpf[cpf]
+
+    def executar(self, fim):
+        self.login()
+        cenarios = [nome for nome in CENARIOS if nome in self.comando.cenarios]
+        pesos = [CENARIOS[nome] for nome in cenarios]
+        while time.monotonic() < fim:
+            getattr(self, self.rng.choices(cenarios, pesos)[0])()
+        self.cliente.fechar()
+
+    def login(self):
+        self.cliente.token = None
+        status_http, dados = self.cliente.requisitar(
+            'POST /api/token/', 'POST', '/api/token/', {'cpf': self.cpf, 'password': self.comando.opcoes['senha']}
+        )
+        if status_http == 200:
+            self.cliente.token = dados['access']
+
+    def dashboard(self):
+        self.cliente.requisitar(f"GET {self.rotas['dashboard']}", 'GET', self.rotas['dashboard'])
+
+    def busca(self):
+        parametros = {
+            'page': self.rng.choice([1, 1, 1, 2, 3]), 'search_field': 'nome', 'search_value': self.rng.choice(TERMOS_BUSCA),
+            'somente_disponiveis_emprestadas_manutencao': 'true',
+        }
+        self.cliente.requisitar(f"GET {self.rotas['ferramentas']} (busca)", 'GET', f"{self.rotas['ferramentas']}?{urlencode(parametros)}")
+
+    def historico(self):
+        for pagina in (1, 2, 3):
+            self.cliente.requisitar(
+                f"GET {self.rotas['emprestimos']} (página {pagina})", 'GET', f"{self.rotas['emprestimos']}?page={pagina}"
+            )
+
+    def emprestimo(self):
+        ferramenta = self.comando.reservar_ferramenta(self.filial_ids, self.rng)
+        if ferramenta is None:
+            return # Nenhuma ferramenta disponível no escopo deste usuário
+        ferramenta_id, filial_id = ferramenta
+        try:
+            status_http, dados = self.cliente.requisitar(
+                'GET /api/funcionarios/ (dropdown)', 'GET', f'/api/funcionarios/?{urlencode({"filial": filial_id, "page": 1})}'
+            )
+            funcionarios = (dados or {}).get('results') or []
+            if status_http != 200 or not funcionarios:
+                return
+            funcionario = self.rng.choice(funcionarios)
+            status_http, dados = self.cliente.requisitar(
+                'POST /api/emprestimos/', 'POST', '/api/emprestimos/', {'ferramenta': ferramenta_id, 'funcionario': funcionario['id']}
+            )
+            if status_http != 201:
+                return
+            self.cliente.requisitar(
+                'PATCH /api/emprestimos/{id}/ (devolução)', 'PATCH', f"/api/emprestimos/{dados['id']}/",
+                {'ativo': False, 'data_devolucao': datetime.date.today().isoformat()}
+            )
+        finally:
+            self.comando.devolver_ferramenta(ferramenta)
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de ponta a ponta contra um servidor já em execução (WSGI ou ASGI) e o banco configurado '
+        '(ex: depois de populate_db --filiais 50 --ferramentas 100000 --anos 10). Usuários virtuais simultâneos '
+        'repetem cenários sorteados (login, dashboard, busca de ferramentas, empréstimo e devolução, histórico '
+        'paginado). Mostra vazão e latência p50/p95/p99 por endpoint e grava o resultado em JSON, '
+        'para comparar execuções entre commits (--comparar).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Endereço do servidor (padrão: http://127.0.0.1:8000).')
+        parser.add_argument('--usuarios', type=int, default=10, help='Usuários virtuais simultâneos (padrão: 10).')
+        parser.add_argument('--duracao', type=float, default=30, help='Duração da medição, em segundos (padrão: 30).')
+        parser.add_argument('--aquecimento', type=float, default=5, help='Segundos iniciais descartados das estatísticas (padrão: 5).')
+        parser.add_argument('--cpfs', default='0,1,4,8,9', help='Logins dos usuários virtuais, distribuídos em rodízio (padrão: 0,1,4,8,9).')
+        parser.add_argument('--senha', default=SENHA_PADRAO, help='Senha dos logins (padrão: a do populate_db).')
+        parser.add_argument('--cenarios', default=','.join(CENARIOS), help=f'Cenários executados (padrão: {",".join(CENARIOS)}).')
+        parser.add_argument('--assincrono', action='store_true', help='Leituras pelas rotas /api/async/ (servidor ASGI).')
+        parser.add_argument('--semente', type=int, default=42, help='Semente dos sorteios (padrão: 42).')
+        parser.add_argument('--saida', help='Arquivo JSON do resultado (padrão: benchmark_api_<data>_<commit>.json).')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior, para comparar p95 e vazão.')
+
+    def handle(self, *args, **options):
+        self.opcoes = options
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Use uma URL http://host:porta.')
+        self.host, self.porta = url.hostname, url.port or 80
+        self.cenarios = {nome.strip() for nome in options['cenarios'].split(',') if nome.strip()}
+        if not self.cenarios or self.cenarios - set(CENARIOS):
+            raise CommandError(f'Cenários válidos: {", ".join(CENARIOS)}.')
+        anterior = self._ler_anterior(options['comparar'])
+
+        if options['usuarios'] < 1 or options['duracao'] <= 0:
+            raise CommandError('--usuarios e --duracao devem ser positivos.')
+
+        self._preparar(options['cpfs'].split(','))
+        self._verificar_servidor()
+        self.amostras = [] # list.append é atômico: compartilhada pelas threads
+        usuarios = [UsuarioVirtual(self, self.cpfs[indice % len(self.cpfs)], indice) for indice in range(options['usuarios'])]
+
+        self.stdout.write(
+            f"{options['usuarios']} usuários virtuais por {options['aquecimento']:.0f}s + {options['duracao']:.0f}s "
+            f"contra {options['url']} ({'rotas assíncronas' if options['assincrono'] else 'rotas síncronas'})..."
+        )
+        inicio = time.monotonic()
+        inicio_medicao = inicio + options['aquecimento']
+        fim = inicio_medicao + options['duracao']
+        threads = [threading.Thread(target=usuario.executar, args=(fim,)) for usuario in usuarios]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Requisições em andamento no fim do prazo também contam
+        duracao = max(time.monotonic(), fim) - inicio_medicao
+
+        resultado = self._resultado([amostra for amostra in self.amostras if amostra[3] >= inicio_medicao], duracao)
+        self._imprimir(resultado, anterior)
+
+        saida = options['saida'] or f"benchmark_api_{datetime.datetime.now():%Y%m%d_%H%M%S}_{resultado['commit'] or 'sem_git'}.json"
+        with open(saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Resultado gravado em {saida}'))
+
+    # --- PREPARAÇÃO (fora da medição) ---
+
+    def _preparar(self, cpfs):
+        """ Escopo de cada login e as ferramentas disponíveis que os cenários de empréstimo podem usar """
+        self.cpfs = [cpf.strip() for cpf in cpfs if cpf.strip()]
+        usuarios = {usuario.cpf: usuario for usuario in Usuario.objects.filter(cpf__in=self.cpfs, ativo=True).prefetch_related('filiais')}
+        ausentes = [cpf for cpf in self.cpfs if cpf not in usuarios]
+        if ausentes:
+            raise CommandError(f'Usuários não encontrados ou inativos: {", ".join(ausentes)}. Rode o populate_db.')
+        self.filiais_por_cpf = {
+            cpf: {filial.id for filial in usuario.filiais.all()} if usuario.tipo == 'COORDENADOR' else None
+            for cpf, usuario in usuarios.items()
+        }
+
+        # Tamanho do banco antes do teste (o cenário de empréstimo acrescenta linhas durante a execução)
+        self.dados = {
+            'filiais': Filial.objects.count(), 'funcionarios': Funcionario.objects.count(),
+            'ferramentas': Ferramenta.objects.count(), 'emprestimos': Emprestimo.objects.count(),
+            'manutencoes': Manutencao.objects.count(),
+        }
+
+        self._trava = threading.Lock()
+        self._disponiveis = list(
+            Ferramenta.objects.filter(estado='DISPONIVEL', deposito__ativo=True, deposito__filial__ativo=True)
+            .values_list('id', 'deposito__filial_id')
+        )
+
+    def _verificar_servidor(self):
+        """ Um login antes de começar: servidor fora do ar ou senha errada encerram aqui, não viram milhares de erros """
+        cliente = ClienteHTTP(self.host, self.porta, [])
+        status_http, _ = cliente.requisitar('', 'POST', '/api/token/', {'cpf': self.cpfs[0], 'password': self.opcoes['senha']})
+        cliente.fechar()
+        if status_http is None:
+            raise CommandError(f"Servidor não respondeu em {self.opcoes['url']}.")
+        if status_http != 200:
+            raise CommandError(f'Login do CPF {self.cpfs[0]} recusado (HTTP {status_http}). Confira --cpfs e --senha.')
+
+    def reservar_ferramenta(self, filial_ids, rng):
+        """ Tira da lista uma ferramenta disponível do escopo (dois usuários virtuais não disputam a mesma) """
+        with self._trava:
+            for _ in range(20):
+                if not self._disponiveis:
+                    return None
+                indice = rng.randrange(len(self._disponiveis))
+                ferramenta = self._disponiveis[indice]
+                if filial_ids is None or ferramenta[1] in filial_ids:
+                    self._disponiveis[indice] = self._disponiveis[-1]
+                    self._disponiveis.pop()
+                    return ferramenta
+        return None
+
+    def devolver_ferramenta(self, ferramenta):
+        with self._trava:
+            self._disponiveis.append(ferramenta)
+
+    # --- RESULTADO ---
+
+    def _resultado(self, amostras, duracao):
+        por_rotulo = {}
+        for rotulo, status_http, segundos, _ in amostras:
+            por_rotulo.setdefault(rotulo, []).append((status_http, segundos))
+
+        return {
+            'versao_relatorio': VERSAO_RELATORIO,
+            'data': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': self._commit(),
+            'parametros': {
+                nome: self.opcoes[nome] for nome in ('url', 'usuarios', 'duracao', 'aquecimento', 'cpfs', 'assincrono', 'semente')
+            } | {'cenarios': sorted(self.cenarios)},
+            'dados': self.dados,
+            'duracao': round(duracao, 2),
+            'total': self._estatisticas([(status_http, segundos) for _, status_http, segundos, _ in amostras], duracao),
+            'endpoints': {rotulo: self._estatisticas(lista, duracao) for rotulo, lista in sorted(por_rotulo.items())},
+        }
+
+    @staticmethod
+    def _estatisticas(lista, duracao):
+        """ Vazão e latências (ms) das respostas de sucesso (2xx/3xx); falhas de rede e 4xx/5xx contam como erro """
+        tempos = sorted(segundos * 1000 for status_http, segundos in lista if status_http and status_http < 400)
+        estatisticas = {
+            'requisicoes': len(lista), 'erros': len(lista) - len(tempos),
+            'req_s': round(len(tempos) / duracao, 2) if duracao else 0,
+        }
+        if len(tempos) >= 2:
+            percentis = statistics.quantiles(tempos, n=100, method='inclusive')
+            estatisticas |= {
+                'p50_ms': round(percentis[49], 2), 'p95_ms': round(percentis[94], 2), 'p99_ms': round(percentis[98], 2),
+                'media_ms': round(statistics.fmean(tempos), 2), 'max_ms': round(tempos[-1], 2),
+            }
+        return estatisticas
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @staticmethod
+    def _ler_anterior(caminho):
+        if not caminho:
+            return None
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError) as erro:
+            raise CommandError(f'Não foi possível ler {caminho}: {erro}')
+
+    @staticmethod
+    def _mesmos_dados(antes, agora):
+        # Empréstimos criados pelas execuções anteriores no mesmo banco não contam como diferença (até 1%)
+        return all(antes.get(nome) == agora[nome] for nome in ('filiais', 'funcionarios', 'ferramentas')) and all(
+            abs((antes.get(nome) or 0) - agora[nome]) <= agora[nome] / 100 for nome in ('emprestimos', 'manutencoes')
+        )
+
+    def _imprimir(self, resultado, anterior):
+        linhas = list(resultado['endpoints'].items()) + [('TOTAL', resultado['total'])]
+        largura = max(len(rotulo) for rotulo, _ in linhas)
+        self.stdout.write(f"\nDados: {', '.join(f'{nome} {quantidade}' for nome, quantidade in resultado['dados'].items())}")
+        self.stdout.write(f"{'ENDPOINT':<{largura}} | {'REQ':>6} | {'ERROS':>5} | {'REQ/S':>7} | {'p50':>7} | {'p95':>7} | {'p99':>7} | {'MÁX':>7}  (ms)")
+        self.stdout.write('-' * (largura + 70))
+        for rotulo, e in linhas:
+            self.stdout.write(
+                f"{rotulo:<{largura}} | {e['requisicoes']:>6} | {e['erros']:>5} | {e['req_s']:>7.1f} | "
+                + ' | '.join(f"{e[campo]:>7.1f}" if campo in e else f"{'-':>7}" for campo in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+            )
+
+        if anterior is None:
+            return
+        self.stdout.write(f"\nComparação com {anterior.get('commit') or '?'} ({anterior.get('data', '?')}):")
+        if not self._mesmos_dados(anterior.get('dados') or {}, resultado['dados']):
+            self.stdout.write(self.style.WARNING('Atenção: os dados do banco são diferentes entre as duas execuções.'))
+        diferentes = [
+            nome for nome, valor in resultado['parametros'].items()
+            if nome not in ('duracao', 'aquecimento') and anterior.get('parametros', {}).get(nome) != valor
+        ]
+        if diferentes:
+            self.stdout.write(self.style.WARNING(f'Atenção: parâmetros diferentes ({", ".join(diferentes)}).'))
+        endpoints_anteriores = dict(anterior.get('endpoints', {}), TOTAL=anterior.get('total', {}))
+        self.stdout.write(f"{'ENDPOINT':<{largura}} | {'p95 ANTES':>9} | {'p95 AGORA':>9} | {'Δ p95':>7} | {'REQ/S ANTES':>11} | {'REQ/S AGORA':>11}")
+        for rotulo, e in linhas:
+            antes = endpoints_anteriores.get(rotulo)
+            if not antes or 'p95_ms' not in antes or 'p95_ms' not in e:
+                continue
+            variacao = (e['p95_ms'] - antes['p95_ms']) / antes['p95_ms'] * 100 if antes['p95_ms'] else 0
+            texto = f"{rotulo:<{largura}} | {antes['p95_ms']:>9.1f} | {e['p95_ms']:>9.1f} | {variacao:>+6.0f}% | {antes['req_s']:>11.1f} | {e['req_s']:>11.1f}"
+            self.stdout.write(self.style.ERROR(texto) if variacao > 10 else texto)
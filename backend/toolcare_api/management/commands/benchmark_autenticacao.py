@@ -0,0 +1,70 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from toolcare_api.autenticacao import JWTSemConsultaAuthentication
+from toolcare_api.escopo import obter_escopo
+from toolcare_api.models import Usuario
+from toolcare_api.serializers import CustomTokenObtainPairSerializer
+
+
+class _ViewEscopo(APIView):
+    """ View mínima: autentica e resolve o escopo de filiais, como toda view da API faz """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        escopo = obter_escopo(request)
+        return Response({'tipo': request.user.tipo, 'filiais': sorted(escopo.filial_ids or ())})
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede requisições por segundo da autenticação JWT: JWTAuthentication do SimpleJWT '
+        '(carrega o Usuario e as filiais do banco) x JWTSemConsultaAuthentication (usuário montado pelas claims).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=5000, help='Requisições por cenário (padrão: 5000).')
+        parser.add_argument('--cpf', help='CPF do usuário do token (padrão: primeiro coordenador ativo).')
+
+    def handle(self, *args, **options):
+        usuarios = Usuario.objects.filter(ativo=True)
+        usuario = usuarios.filter(cpf=options['cpf']).first() if options['cpf'] else usuarios.filter(tipo='COORDENADOR').first()
+        if usuario is None:
+            raise CommandError('Usuário não encontrado.')
+
+        token = str(CustomTokenObtainPairSerializer.get_token(usuario).access_token)
+        fabrica = APIRequestFactory()
+        cenarios = [
+            ('JWTAuthentication (antigo)', JWTAuthentication),
+            ('Sem consulta (atual)', JWTSemConsultaAuthentication),
+        ]
+
+        self.stdout.write(f'Usuário: {usuario.nome} ({usuario.tipo})')
+        self.stdout.write(f"{'CENÁRIO':<28} | {'REQ/S':>10} | {'CONSULTAS/REQ':>13}")
+        resultados = []
+        for nome, classe in cenarios:
+            view = _ViewEscopo.as_view(authentication_classes=[classe])
+
+            def requisitar():
+                resposta = view(fabrica.get('/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+                if resposta.status_code != 200:
+                    raise CommandError(f'{nome}: resposta {resposta.status_code} {resposta.data}')
+
+            requisitar() # Aquece o cache da versão do token
+            with CaptureQueriesContext(connection) as consultas:
+                requisitar()
+
+            inicio = time.perf_counter()
+            for _ in range(options['requisicoes']):
+                requisitar()
+            por_segundo = options['requisicoes'] / (time.perf_counter() - inicio)
+            resultados.append(por_segundo)
+            self.stdout.write(f'{nome:<28} | {por_segundo:>10.1f} | {len(consultas.captured_queries):>13}')
+
+        self.stdout.write(self.style.SUCCESS(f'Ganho: {resultados[1] / resultados[0]:.2f}x'))
@@ -0,0 +1,59 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from toolcare_api.models import Filial, Deposito, Ferramenta
+
+
+class _Desfazer(Exception):
+    """ Usada para desfazer a transação do benchmark ao final """
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara o plano de execução da busca de ferramentas por nome com __icontains (antigo) e __busca '
+        '(trigrama + unaccent) sobre N ferramentas sintéticas. Tudo roda numa transação desfeita ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=1_000_000, help='Quantidade de ferramentas sintéticas (padrão: 1.000.000).')
+        parser.add_argument('--termo', default='manutencao', help="Texto buscado (padrão: 'manutencao', sem acento).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Este benchmark só roda no PostgreSQL.')
+
+        linhas, termo = options['linhas'], options['termo']
+        try:
+            with transaction.atomic():
+                self._popular(linhas)
+                self._medir('__icontains', Ferramenta.objects.filter(nome__icontains=termo))
+                self._medir('__busca', Ferramenta.objects.filter(nome__busca=termo))
+                raise _Desfazer()
+        except _Desfazer:
+            self.stdout.write(self.style.SUCCESS('Benchmark concluído (dados sintéticos descartados).'))
+
+    def _popular(self, linhas):
+        self.stdout.write(f'Inserindo {linhas} ferramentas sintéticas...')
+        filial = Filial.objects.create(nome='__benchmark_busca__', cidade='-')
+        deposito = Deposito.objects.create(nome='__benchmark_busca__', filial=filial)
+        with connection.cursor() as cursor:
+            # 1 a cada 1000 ferramentas tem 'Manutenção' (com acento) no nome
+            cursor.execute(
+                f"""
+                INSERT INTO {Ferramenta._meta.db_table} (deposito_id, nome, numero_serie, foto, estado)
+                SELECT %s,
+                       CASE WHEN i %% 1000 = 0 THEN 'Kit de Manutenção ' ELSE 'Ferramenta ' END || md5(i::text),
+                       'BENCH-' || i, '', 'DISPONIVEL'
+                FROM generate_series(1, %s) AS i
+                """,
+                [deposito.id, linhas],
+            )
+            cursor.execute(f'ANALYZE {Ferramenta._meta.db_table}')
+
+    def _medir(self, rotulo, queryset):
+        inicio = time.perf_counter()
+        encontrados = queryset.count()
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        self.stdout.write(self.style.SUCCESS(f'\n--- {rotulo}: {encontrados} resultado(s) em {duracao_ms:.1f} ms ---'))
+        self.stdout.write(queryset.explain(analyze=True))
@@ -0,0 +1,100 @@
+import copy
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from toolcare_api.models import Ferramenta
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede o custo de abrir conexões com o Postgres: N threads simulam requisições (cada uma '
+        'pega a conexão, faz uma consulta leve e a devolve), comparando uma conexão por requisição '
+        '(CONN_MAX_AGE=0), conexões persistentes (CONN_MAX_AGE) e o pool do psycopg 3 (DB_POOL=true).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Threads simultâneas (padrão: 8).')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por thread (padrão: 200).')
+        parser.add_argument('--pool-max', type=int, default=8, help='Tamanho máximo do pool (padrão: 8).')
+
+    def handle(self, *args, **options):
+        base = connections.settings['default']
+        if base['ENGINE'] != 'django.db.backends.postgresql':
+            raise CommandError('Benchmark disponível apenas para PostgreSQL.')
+
+        opcoes_sem_pool = {chave: valor for chave, valor in base.get('OPTIONS', {}).items() if chave != 'pool'}
+        cenarios = [
+            ('Uma conexão por requisição', {'CONN_MAX_AGE': 0, 'OPTIONS': opcoes_sem_pool}),
+            ('Conexões persistentes', {'CONN_MAX_AGE': 600, 'OPTIONS': opcoes_sem_pool}),
+        ]
+        if self._pool_disponivel():
+            pool = {'min_size': 2, 'max_size': options['pool_max'], 'timeout': 10}
+            cenarios.append(('Pool (psycopg 3)', {'CONN_MAX_AGE': 0, 'OPTIONS': {**opcoes_sem_pool, 'pool': pool}}))
+        else:
+            self.stdout.write(self.style.WARNING('psycopg 3 / psycopg_pool não instalado: cenário do pool ignorado.'))
+
+        self.stdout.write(f"{options['threads']} threads x {options['requisicoes']} requisições")
+        self.stdout.write(f"{'CENÁRIO':<28} | {'REQ/S':>8} | {'P50 (ms)':>8} | {'P99 (ms)':>8} | {'CONEXÕES':>8}")
+        for indice, (nome, ajustes) in enumerate(cenarios):
+            alias = f'benchmark_conexoes_{indice}'
+            connections.settings[alias] = {**copy.deepcopy(base), **ajustes}
+            try:
+                por_segundo, tempos, conexoes = self._executar(alias, options['threads'], options['requisicoes'])
+            finally:
+                self._descartar(alias)
+            percentis = statistics.quantiles(tempos, n=100, method='inclusive')
+            self.stdout.write(
+                f'{nome:<28} | {por_segundo:>8.1f} | {percentis[49] * 1000:>8.2f} | '
+                f'{percentis[98] * 1000:>8.2f} | {conexoes:>8}'
+            )
+
+    def _executar(self, alias, threads, requisicoes):
+        tempos, processos = [], set()
+        trava = threading.Lock()
+
+        def worker():
+            locais, pids = [], set()
+            conexao = connections[alias]
+            for _ in range(requisicoes):
+                inicio = time.perf_counter()
+                with conexao.cursor() as cursor:
+                    cursor.execute('SELECT pg_backend_pid()')
+                    pids.add(cursor.fetchone()[0])
+                Ferramenta.objects.using(alias).filter(estado='DISPONIVEL').exists()
+                # Fim da "requisição": mesmo tratamento do sinal request_finished do Django
+                conexao.close_if_unusable_or_obsolete()
+                locais.append(time.perf_counter() - inicio)
+            conexao.close()
+            with trava:
+                tempos.extend(locais)
+                processos.update(pids)
+
+        inicio = time.perf_counter()
+        trabalhadores = [threading.Thread(target=worker) for _ in range(threads)]
+        for trabalhador in trabalhadores:
+            trabalhador.start()
+        for trabalhador in trabalhadores:
+            trabalhador.join()
+        duracao = time.perf_counter() - inicio
+        if len(tempos) != threads * requisicoes:
+            raise CommandError('Falha em uma das threads (ver erro acima).')
+        # Conexões = processos distintos do Postgres que atenderam as consultas
+        return len(tempos) / duracao, tempos, len(processos)
+
+    def _descartar(self, alias):
+        conexao = connections[alias]
+        conexao.close()
+        if hasattr(conexao, 'close_pool'):
+            conexao.close_pool()
+        del connections.settings[alias]
+
+    @staticmethod
+    def _pool_disponivel():
+        try:
+            import psycopg_pool # noqa: F401
+            from django.db.backends.postgresql.psycopg_any import is_psycopg3
+        except ImportError:
+            return False
+        return is_psycopg3
@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import models
+from toolcare_api.models import Emprestimo
+
+MARCADOR = '__benchmark_insercao__'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede inserções por segundo de Empréstimos: caminho atual (nome definido antes do INSERT) '
+        'x caminho antigo (INSERT seguido de UPDATE do nome). Os registros criados são apagados ao final.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=2000, help='Inserções por cenário (padrão: 2000).')
+
+    def handle(self, *args, **options):
+        quantidade = options['quantidade']
+        try:
+            antigo = self._medir(quantidade, self._inserir_antigo)
+            atual = self._medir(quantidade, self._inserir_atual)
+        finally:
+            Emprestimo.objects.filter(observacoes=MARCADOR).delete()
+
+        self.stdout.write(f"{'CENÁRIO':<28} | {'INSERÇÕES/S':>12}")
+        self.stdout.write(f"{'INSERT + UPDATE (antigo)':<28} | {antigo:>12.1f}")
+        self.stdout.write(f"{'INSERT único (atual)':<28} | {atual:>12.1f}")
+        self.stdout.write(self.style.SUCCESS(f'Ganho: {atual / antigo:.2f}x'))
+
+    def _medir(self, quantidade, inserir):
+        inicio = time.perf_counter()
+        for _ in range(quantidade):
+            inserir(Emprestimo(ativo=False, observacoes=MARCADOR))
+        return quantidade / (time.perf_counter() - inicio)
+
+    def _inserir_atual(self, emprestimo):
+        emprestimo.save()
+
+    def _inserir_antigo(self, emprestimo):
+        # Reproduz o fluxo anterior: INSERT sem nome e UPDATE para gravar "Empréstimo {id}"
+        models.Model.save(emprestimo)
+        emprestimo.nome = f"Empréstimo {emprestimo.id}"
+        models.Model.save(emprestimo, update_fields=['nome'])
@@ -0,0 +1,92 @@
+import os
+import posixpath
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Now
+from toolcare_api.armazenamento import armazenamento_fotos, eh_imutavel, hash_conteudo
+from toolcare_api.imagens import VARIANTES, caminho_variante, gerar_variantes, marcar_variantes, variantes_existem
+from toolcare_api.models import Ferramenta, Funcionario, VersaoTabela
+
+PASTAS = ('ferramentas', 'funcionarios')
+
+
+class Command(BaseCommand):
+    help = (
+        'Migra as fotos de media/ferramentas e media/funcionarios para o armazenamento por conteúdo '
+        '(nome = hash SHA-256): renomeia as fotos em uso, junta as duplicadas e apaga os arquivos que '
+        'nenhum cadastro referencia (fotos substituídas e suas variantes). Informa o espaço recuperado. '
+        'Rode com o sistema parado ou fora do horário de uso (um upload em andamento pareceria órfão).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simular', action='store_true', help='Só informa o que seria feito, sem alterar arquivos nem o banco.')
+
+    def handle(self, *args, **options):
+        simular = options['simular']
+        antes = sum(default_storage.size(caminho) for caminho in self._arquivos())
+
+        # 1. Fotos em uso com nome antigo -> nome pelo conteúdo (duplicadas caem no mesmo arquivo)
+        renomeadas, ausentes, hashes = 0, 0, set()
+        for model in (Ferramenta, Funcionario):
+            nomes = model.objects.exclude(foto='').order_by().values_list('foto', flat=True).distinct()
+            for nome in list(nomes):
+                if eh_imutavel(nome) or not nome.startswith(tuple(f'{pasta}/' for pasta in PASTAS)):
+                    continue # Já migrada, ou foto padrão (defaults/)
+                if not armazenamento_fotos.exists(nome):
+                    ausentes += 1
+                    continue
+                with armazenamento_fotos.open(nome, 'rb') as arquivo:
+                    if simular:
+                        hashes.add(hash_conteudo(arquivo))
+                        renomeadas += 1
+                        continue
+                    # Pasta nova definida pelo upload_to (sem a subpasta antiga com o nome do cadastro)
+                    destino = model._meta.get_field('foto').generate_filename(model(), posixpath.basename(nome))
+                    novo = armazenamento_fotos.save(destino, arquivo)
+                model.objects.filter(foto=nome).update(foto=novo, foto_variantes=False, atualizado_em=Now())
+                VersaoTabela.registrar_alteracao(model._meta.model_name) # update() não dispara sinais
+                gerar_variantes(model(foto=novo).foto, sobrescrever=False)
+                if variantes_existem(novo):
+                    marcar_variantes(model.objects.filter(foto=novo))
+                renomeadas += 1
+
+        # 2. Arquivos que nenhum cadastro referencia (nem como foto, nem como variante de uma foto)
+        referenciados = set()
+        for model in (Ferramenta, Funcionario):
+            referenciados.update(model.objects.order_by().values_list('foto', flat=True).distinct())
+        referenciados |= {caminho_variante(nome, variante) for nome in list(referenciados) for variante in VARIANTES}
+
+        orfaos = [caminho for caminho in self._arquivos() if caminho not in referenciados]
+        tamanho_orfaos = sum(default_storage.size(caminho) for caminho in orfaos)
+        if not simular:
+            for caminho in orfaos:
+                default_storage.delete(caminho)
+            self._remover_pastas_vazias()
+
+        depois = sum(default_storage.size(caminho) for caminho in self._arquivos())
+        self.stdout.write(f'Fotos renomeadas pelo conteúdo: {renomeadas}  |  Arquivos não encontrados: {ausentes}')
+        self.stdout.write(f'Arquivos sem referência: {len(orfaos)} ({tamanho_orfaos / 1024:.0f} KB)')
+        if simular:
+            self.stdout.write(f'Conteúdos distintos entre as fotos a renomear: {len(hashes)} de {renomeadas}')
+            self.stdout.write(self.style.WARNING('Simulação: nada foi alterado.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Espaço: {antes / 1024:.0f} KB -> {depois / 1024:.0f} KB (recuperados {(antes - depois) / 1024:.0f} KB)'
+            ))
+
+    def _arquivos(self, pastas=PASTAS):
+        """ Todos os arquivos (caminhos relativos ao MEDIA_ROOT) dentro das pastas, recursivamente """
+        for pasta in pastas:
+            if not default_storage.exists(pasta):
+                continue
+            subpastas, arquivos = default_storage.listdir(pasta)
+            for arquivo in arquivos:
+                yield posixpath.join(pasta, arquivo)
+            yield from self._arquivos([posixpath.join(pasta, subpasta) for subpasta in subpastas])
+
+    def _remover_pastas_vazias(self):
+        # Pastas antigas por nome (ex: ferramentas/Alicate/) ficam vazias após a migração
+        for pasta in PASTAS:
+            for raiz, _, _ in os.walk(default_storage.path(pasta), topdown=False):
+                if raiz != default_storage.path(pasta) and not os.listdir(raiz):
+                    os.rmdir(raiz)
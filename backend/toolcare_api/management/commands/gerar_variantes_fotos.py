@@ -0,0 +1,55 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from toolcare_api.imagens import VARIANTES, caminho_variante, gerar_variantes, marcar_variantes, variantes_existem
+from toolcare_api.models import Ferramenta, Funcionario
+
+# Fotos marcadas (foto_variantes) por UPDATE
+TAMANHO_LOTE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera as variantes WebP (miniatura e média) das fotos já cadastradas de ferramentas e funcionários '
+        '(media/ferramentas e media/funcionarios, além das fotos padrão) e marca os cadastros (foto_variantes) '
+        'para as listagens passarem a usá-las. Fotos novas já ganham as variantes no upload.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forcar', action='store_true', help='Regera também as variantes que já existem (as URLs são cacheadas como imutáveis: navegadores podem manter a versão antiga).')
+
+    def handle(self, *args, **options):
+        for model in (Ferramenta, Funcionario):
+            # Cada arquivo uma vez só (várias linhas podem apontar para a mesma foto, ex: a foto padrão)
+            nomes = model.objects.exclude(foto='').order_by().values_list('foto', flat=True).distinct()
+            processadas = ausentes = invalidas = 0
+            tamanho_original = tamanho_miniatura = 0
+            prontas = []
+
+            for nome in nomes.iterator():
+                foto = model(foto=nome).foto
+                if not foto.storage.exists(nome):
+                    ausentes += 1
+                    continue
+                gerar_variantes(foto, sobrescrever=options['forcar'])
+                if not variantes_existem(nome):
+                    invalidas += 1 # Pillow não conseguiu abrir (ver aviso no log)
+                    continue
+                processadas += 1
+                tamanho_original += foto.storage.size(nome)
+                tamanho_miniatura += default_storage.size(caminho_variante(nome, 'miniatura'))
+                prontas.append(nome)
+                if len(prontas) == TAMANHO_LOTE:
+                    marcar_variantes(model.objects.filter(foto__in=prontas))
+                    prontas = []
+            if prontas:
+                marcar_variantes(model.objects.filter(foto__in=prontas))
+
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural.capitalize()}: {processadas} foto(s) com variantes '
+                f'({", ".join(VARIANTES)}), {ausentes} arquivo(s) não encontrado(s), {invalidas} imagem(ns) inválida(s).'
+            )
+            if processadas:
+                self.stdout.write(
+                    f'  Originais: {tamanho_original / 1024:.0f} KB  |  Miniaturas: {tamanho_miniatura / 1024:.0f} KB'
+                )
+        self.stdout.write(self.style.SUCCESS('Variantes geradas.'))
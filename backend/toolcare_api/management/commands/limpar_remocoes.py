@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from toolcare_api.models import Remocao
+from toolcare_api.sincronizacao import RETENCAO_REMOCOES
+
+
+class Command(BaseCommand):
+    help = (
+        'Apaga as lápides (Remocao) mais antigas que a retenção da sincronização incremental. '
+        'Clientes com cursor anterior a esse prazo recebem a coleção inteira na próxima sincronização.'
+    )
+
+    def handle(self, *args, **options):
+        apagadas, _ = Remocao.objects.filter(removido_em__lt=timezone.now() - RETENCAO_REMOCOES).delete()
+        self.stdout.write(self.style.SUCCESS(f'Lápides apagadas: {apagadas} (retenção de {RETENCAO_REMOCOES.days} dias)'))
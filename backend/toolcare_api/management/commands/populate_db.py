@@ -1,20 +1,158 @@
+import datetime
+import itertools
 import random
-from django.core.management.base import BaseCommand
-from django.db import transaction
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
 from faker import Faker
-from toolcare_api.models import Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao
-from datetime import timedelta, date
+from toolcare_api.models import (
+    Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao,
+    ContadorEstoque, VersaoTabela, Remocao,
+)
+
+FILIAIS_FIXAS = [
+    ('Usina São Paulo', 'Sertãozinho'),
+    ('Usina Minas Gerais', 'Uberaba'),
+    ('Usina Bahia', 'Luís Eduardo Magalhães'),
+    ('Usina Goiás', 'Rio Verde'),
+]
+NOMES_DEPOSITOS = ['Almoxarifado Central', 'Depósito de Campo', 'Depósito Manutenção']
+SETORES = ['Manutenção', 'Elétrica', 'Produção', 'Usinagem', 'Caldeiraria', 'Logística', 'TI']
+CARGOS = ['Mecânico', 'Eletricista', 'Soldador', 'Torneiro', 'Ajudante', 'Supervisor', 'Engenheiro']
+NOMES_FERRAMENTAS = ['Furadeira', 'Parafusadeira', 'Lixadeira', 'Martelete', 'Serra Circular', 'Alicate de Pressão', 'Chave de Impacto', 'Multímetro', 'Esmerilhadeira', 'Talha']
+
+# Usuários fixos (senha padrão). Coordenadores: índices das filiais (módulo --filiais); None = todas
+USUARIOS = [
+    ('0', 'Máximo Principal', 'MAXIMO', ()),
+    ('00', 'Máximo Secundário', 'MAXIMO', ()),
+    ('1', 'Administrador 1', 'ADMINISTRADOR', ()),
+    ('2', 'Administrador 2', 'ADMINISTRADOR', ()),
+    ('3', 'Administrador 3', 'ADMINISTRADOR', ()),
+    ('4', 'Coord. Sertãozinho', 'COORDENADOR', (0,)),
+    ('5', 'Coord. Uberaba', 'COORDENADOR', (1,)),
+    ('6', 'Coord. Bahia', 'COORDENADOR', (2,)),
+    ('7', 'Coord. Goiás', 'COORDENADOR', (3,)),
+    ('8', 'Coord. Multilocal A', 'COORDENADOR', (0, 1)),
+    ('9', 'Coord. Multilocal B', 'COORDENADOR', None),
+]
+SENHA_PADRAO = '123'
+
+# Ferramentas com transação ativa: empréstimos dos últimos N dias, manutenções dos últimos M dias.
+# O histórico termina antes disso, para não se sobrepor a elas.
+DIAS_EMPRESTIMO_ATIVO = 10
+DIAS_MANUTENCAO_ATIVA = 5
+
+# Tamanho dos conjuntos de nomes/descrições sorteados (o Faker é lento para gerar um por linha)
+TAMANHO_AMOSTRAS = 2000
+
+# Colunas das transações na ordem das linhas geradas (ver Command._transacoes)
+CAMPOS_EMPRESTIMO = [
+    'id', 'nome', 'ferramenta_id', 'funcionario_id', 'data_emprestimo', 'data_devolucao', 'observacoes', 'ativo', 'atualizado_em',
+    'nome_ferramenta_historico', 'numero_serie_ferramenta_historico', 'nome_funcionario_historico', 'matricula_funcionario_historico',
+]
+CAMPOS_MANUTENCAO = [
+    'id', 'nome', 'tipo', 'ferramenta_id', 'observacoes', 'data_inicio', 'data_fim', 'ativo', 'atualizado_em',
+    'nome_ferramenta_historico', 'numero_serie_ferramenta_historico',
+]
+
+# Tabelas recriadas pelo comando (versões incrementadas ao final, ver VersaoTabela)
+TABELAS_VERSIONADAS = ('filial', 'deposito', 'setor', 'cargo', 'usuario', 'funcionario', 'ferramenta', 'emprestimo', 'manutencao')
+
+
+def gerar_cpf(base):
+    """ CPF válido (11 dígitos) a partir dos 9 primeiros """
+    digitos = [int(d) for d in f'{base:09d}']
+    for _ in range(2):
+        soma = sum(d * peso for d, peso in zip(digitos, range(len(digitos) + 1, 1, -1)))
+        digitos.append(soma * 10 % 11 % 10)
+    return ''.join(map(str, digitos))
+
 
 class Command(BaseCommand):
-    help = 'Popula o banco com dados consistentes e usuários definidos (0, 00, 1..9).'
+    help = (
+        'Apaga e popula o banco com dados sintéticos consistentes e os usuários fixos (0, 00, 1..9). '
+        'O tamanho é configurável (ex: --filiais 50 --ferramentas 100000 --anos 10 para teste de carga) '
+        'e a mesma --semente gera sempre os mesmos dados. No Postgres as linhas são carregadas com COPY; '
+        'nos outros bancos, com bulk_create.'
+    )
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.SUCCESS('--- INICIANDO POVOAMENTO CONTROLADO ---'))
-        fake = Faker('pt_BR')
-        senha_padrao = "123"
+    def add_arguments(self, parser):
+        parser.add_argument('--filiais', type=int, default=4, help='Filiais (padrão: 4).')
+        parser.add_argument('--depositos-por-filial', type=int, default=3, help='Depósitos por filial (padrão: 3).')
+        parser.add_argument('--funcionarios', type=int, default=200, help='Funcionários (padrão: 200).')
+        parser.add_argument('--ferramentas', type=int, default=500, help='Ferramentas (padrão: 500).')
+        parser.add_argument('--anos', type=int, default=1, help='Anos de histórico de empréstimos/manutenções (padrão: 1).')
+        parser.add_argument('--emprestimos-por-ano', type=float, default=0.2, help='Empréstimos finalizados por ferramenta por ano (padrão: 0.2).')
+        parser.add_argument('--manutencoes-por-ano', type=float, default=0.2, help='Manutenções finalizadas por ferramenta por ano (padrão: 0.2).')
+        parser.add_argument('--emprestadas', type=float, default=0.08, help='Fração das ferramentas com empréstimo ativo (padrão: 0.08).')
+        parser.add_argument('--em-manutencao', type=float, default=0.03, help='Fração das ferramentas em manutenção (padrão: 0.03).')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do gerador aleatório (padrão: 42).')
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas por INSERT no modo bulk_create (padrão: 5000).')
+        parser.add_argument('--sem-copy', action='store_true', help='Usa bulk_create mesmo no Postgres (comparação).')
 
-        # 1. LIMPEZA TOTAL
+    def handle(self, *args, **options):
+        if min(options['filiais'], options['depositos_por_filial'], options['anos']) < 1:
+            raise CommandError('--filiais, --depositos-por-filial e --anos devem ser pelo menos 1.')
+        if min(options['funcionarios'], options['ferramentas'], options['emprestimos_por_ano'], options['manutencoes_por_ano']) < 0:
+            raise CommandError('Quantidades não podem ser negativas.')
+        if options['emprestadas'] < 0 or options['em_manutencao'] < 0 or options['emprestadas'] + options['em_manutencao'] > 1:
+            raise CommandError('--emprestadas e --em-manutencao são frações que, somadas, não passam de 1.')
+
+        self.opcoes = options
+        self.rng = random.Random(options['semente'])
+        self.fake = Faker('pt_BR')
+        self.fake.seed_instance(options['semente'])
+        self.hoje = datetime.date.today()
+        self.agora = timezone.now()
+        usar_copy = connection.vendor == 'postgresql' and not options['sem_copy']
+        self.carregar = self._carregar_copy if usar_copy else self._carregar_bulk
+
+        self.stdout.write(self.style.SUCCESS('--- INICIANDO POVOAMENTO CONTROLADO ---'))
+        inicio = time.perf_counter()
         self.stdout.write('Limpando banco de dados...')
+        self._limpar()
+
+        with transaction.atomic():
+            filiais, depositos = self._estrutura()
+            self._usuarios(filiais)
+            funcionarios_por_filial, funcionarios = self._funcionarios(filiais)
+            ferramentas = self._ferramentas(depositos, funcionarios_por_filial)
+            self._transacoes(ferramentas, funcionarios_por_filial, funcionarios)
+
+            # Linhas inseridas com id explícito: a sequência continua depois do maior id
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao]):
+                    cursor.execute(sql)
+            # Nada passou pelo save(): contadores e versões (ETags, cache de referências) feitos aqui
+            ContadorEstoque.recalcular()
+            VersaoTabela.registrar_alteracao(TABELAS_VERSIONADAS)
+
+        if connection.vendor == 'postgresql':
+            # Estatísticas do planejador atualizadas antes de qualquer medição
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS(f'Dados gerados em {time.perf_counter() - inicio:.1f}s ({"COPY" if usar_copy else "bulk_create"}).'))
+        self._imprimir_usuarios()
+
+    # --- LIMPEZA ---
+
+    def _limpar(self):
+        if connection.vendor == 'postgresql':
+            # TRUNCATE: sem sinais nem DELETE linha a linha; os ids dos dados recomeçam em 1 (mesma
+            # semente = mesmos ids). Usuários à parte, sem reiniciar a sequência: um id reaproveitado
+            # tornaria válido o token antigo de outro usuário (ver autenticacao.py).
+            dados = [
+                Emprestimo, Manutencao, ContadorEstoque, Ferramenta, Funcionario.filiais.through, Funcionario,
+                Usuario.filiais.through, Deposito, Filial, Setor, Cargo, Remocao,
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE {", ".join(connection.ops.quote_name(m._meta.db_table) for m in dados)} RESTART IDENTITY CASCADE')
+                cursor.execute(f'TRUNCATE {connection.ops.quote_name(Usuario._meta.db_table)} CASCADE')
+            return
         Emprestimo.objects.all().delete()
         Manutencao.objects.all().delete()
         Ferramenta.objects.all().delete()
@@ -24,210 +162,231 @@ class Command(BaseCommand):
         Setor.objects.all().delete()
         Cargo.objects.all().delete()
         Usuario.objects.all().delete()
-        
-        with transaction.atomic():
-            # 2. ESTRUTURA BÁSICA (Filiais, Depósitos, Setores, Cargos)
-            filiais = [
-                Filial.objects.create(nome='Usina São Paulo', cidade='Sertãozinho'),
-                Filial.objects.create(nome='Usina Minas Gerais', cidade='Uberaba'),
-                Filial.objects.create(nome='Usina Bahia', cidade='Luís Eduardo Magalhães'),
-                Filial.objects.create(nome='Usina Goiás', cidade='Rio Verde'),
-            ]
+        Remocao.objects.all().delete() # Lápides dos registros apagados acima
 
-            depositos = []
-            for filial in filiais:
-                depositos.append(Deposito.objects.create(nome=f'Almoxarifado Central', filial=filial))
-                depositos.append(Deposito.objects.create(nome=f'Depósito de Campo', filial=filial))
-                depositos.append(Deposito.objects.create(nome=f'Depósito Manutenção', filial=filial))
-
-            setores = [Setor.objects.create(nome_setor=n) for n in ['Manutenção', 'Elétrica', 'Produção', 'Usinagem', 'Caldeiraria', 'Logística', 'TI']]
-            cargos = [Cargo.objects.create(nome_cargo=n) for n in ['Mecânico', 'Eletricista', 'Soldador', 'Torneiro', 'Ajudante', 'Supervisor', 'Engenheiro']]
-
-            self.stdout.write(self.style.SUCCESS('Estrutura base criada.'))
-
-            # 3. CRIAÇÃO DOS USUÁRIOS ESPECÍFICOS
-            # Lista de definição conforme seu pedido
-            usuarios_para_criar = [
-                # MÁXIMOS
-                {'cpf': '0',  'nome': 'Máximo Principal', 'tipo': 'MAXIMO'},
-                {'cpf': '00', 'nome': 'Máximo Secundário', 'tipo': 'MAXIMO'},
-                
-                # ADMS
-                {'cpf': '1', 'nome': 'Administrador 1', 'tipo': 'ADMINISTRADOR'},
-                {'cpf': '2', 'nome': 'Administrador 2', 'tipo': 'ADMINISTRADOR'},
-                {'cpf': '3', 'nome': 'Administrador 3', 'tipo': 'ADMINISTRADOR'},
-                
-                # COORDENADORES (Devem ter filiais)
-                {'cpf': '4', 'nome': 'Coord. Sertãozinho', 'tipo': 'COORDENADOR'},
-                {'cpf': '5', 'nome': 'Coord. Uberaba',     'tipo': 'COORDENADOR'},
-                {'cpf': '6', 'nome': 'Coord. Bahia',       'tipo': 'COORDENADOR'},
-                {'cpf': '7', 'nome': 'Coord. Goiás',       'tipo': 'COORDENADOR'},
-                {'cpf': '8', 'nome': 'Coord. Multilocal A', 'tipo': 'COORDENADOR'},
-                {'cpf': '9', 'nome': 'Coord. Multilocal B', 'tipo': 'COORDENADOR'},
-            ]
+    # --- CARGA ---
+
+    def _carregar_copy(self, model, campos, linhas):
+        """ COPY ... FROM STDIN (psycopg 3): as linhas vão em fluxo, sem montar objetos do Django """
+        tabela = connection.ops.quote_name(model._meta.db_table)
+        colunas = ', '.join(connection.ops.quote_name(model._meta.get_field(campo).column) for campo in campos)
+        with connection.cursor() as cursor:
+            with cursor.copy(f'COPY {tabela} ({colunas}) FROM STDIN') as copia:
+                for linha in linhas:
+                    copia.write_row(linha)
 
-            for u_data in usuarios_para_criar:
-                user = Usuario.objects.create_user(
-                    cpf=u_data['cpf'],
-                    nome=u_data['nome'],
-                    tipo=u_data['tipo'],
-                    password=senha_padrao
-                )
-                
-                # Se for coordenador, associa a filiais
-                if u_data['tipo'] == 'COORDENADOR':
-                    # Distribuição lógica para garantir que todos tenham filial
-                    if u_data['cpf'] == '4': user.filiais.add(filiais[0]) # SP
-                    elif u_data['cpf'] == '5': user.filiais.add(filiais[1]) # MG
-                    elif u_data['cpf'] == '6': user.filiais.add(filiais[2]) # BA
-                    elif u_data['cpf'] == '7': user.filiais.add(filiais[3]) # GO
-                    elif u_data['cpf'] == '8': 
-                        user.filiais.add(filiais[0])
-                        user.filiais.add(filiais[1])
-                    elif u_data['cpf'] == '9': 
-                        user.filiais.set(filiais) # Todas
-
-            self.stdout.write(self.style.SUCCESS('Usuários 0 a 9 criados e configurados.'))
-
-            # 4. FUNCIONÁRIOS (200)
-            funcionarios = []
-            for i in range(200):
-                f_filial = random.choice(filiais)
-                func = Funcionario.objects.create(
-                    nome=fake.name(),
-                    matricula=str(10000 + i),
-                    cpf=fake.cpf(),
-                    setor=random.choice(setores),
-                    cargo=random.choice(cargos)
-                )
-                func.filiais.add(f_filial)
-                if random.random() > 0.9: # 10% de chance de ter 2 filiais
-                    func.filiais.add(random.choice(filiais))
-                funcionarios.append(func)
-            
-            self.stdout.write(self.style.SUCCESS('200 Funcionários criados.'))
-
-            # 5. FERRAMENTAS (500)
-            lista_nomes = ['Furadeira', 'Parafusadeira', 'Lixadeira', 'Martelete', 'Serra Circular', 'Alicate de Pressão', 'Chave de Impacto', 'Multímetro', 'Esmerilhadeira', 'Talha']
-            ferramentas = []
-            
-            for i in range(500):
-                deposito = random.choice(depositos)
-                nome = f"{random.choice(lista_nomes)} {fake.color_name().capitalize()}"
-                ferramenta = Ferramenta.objects.create(
-                    nome=nome,
-                    numero_serie=f"SN-{i:04d}",
-                    descricao=fake.sentence(),
-                    data_aquisicao=fake.date_between(start_date='-4y', end_date='today'),
-                    deposito=deposito,
-                    estado='DISPONIVEL'
-                )
-                ferramentas.append(ferramenta)
-            
-            self.stdout.write(self.style.SUCCESS('500 Ferramentas criadas.'))
-
-            # 6. DISTRIBUIÇÃO DE TRANSAÇÕES
-            # Embaralha para pegar aleatórias
-            random.shuffle(ferramentas)
-
-            # Fatias (Slices) para garantir consistência (uma ferramenta não pode estar em 2 estados)
-            grupo_emp_ativo = ferramentas[0:40]      # 40 Ferramentas -> Serão EMPRESTADAS
-            grupo_man_ativa = ferramentas[40:55]     # 15 Ferramentas -> Serão EM MANUTENÇÃO
-            grupo_historico = ferramentas[55:155]    # 100 Ferramentas -> Terão histórico (mas estarão DISPONIVEIS agora)
-            # As outras 330 ficam paradas no depósito (DISPONIVEL)
-            
-            # A. EMPRÉSTIMOS ATIVOS
-            count_emp = 0
-            for ferr in grupo_emp_ativo:
-                filiais_da_ferramenta = [ferr.deposito.filial]
-                # Acha funcionário da MESMA filial da ferramenta
-                funcs_compativeis = [f for f in funcionarios if any(fil in f.filiais.all() for fil in filiais_da_ferramenta)]
-                
-                if funcs_compativeis:
-                    func = random.choice(funcs_compativeis)
-                    Emprestimo.objects.create(
-                        ferramenta=ferr,
-                        funcionario=func,
-                        data_emprestimo=date.today() - timedelta(days=random.randint(1, 10)),
-                        ativo=True,
-                        observacoes="Uso contínuo em obra.",
-                        nome=f"Empréstimo Ativo {count_emp}"
-                    )
-                    ferr.estado = 'EMPRESTADA'
-                    ferr.save()
-                    count_emp += 1
-
-            # B. MANUTENÇÕES ATIVAS
-            count_man = 0
-            for ferr in grupo_man_ativa:
-                Manutencao.objects.create(
-                    ferramenta=ferr,
-                    tipo=random.choice(['PREVENTIVA', 'CORRETIVA']),
-                    data_inicio=date.today() - timedelta(days=random.randint(1, 5)),
-                    ativo=True,
-                    observacoes="Aguardando peça de reposição.",
-                    nome=f"Manutenção Ativa {count_man}"
-                )
-                ferr.estado = 'EM_MANUTENCAO'
-                ferr.save()
-                count_man += 1
-
-            # C. HISTÓRICO (Empréstimos e Manutenções já finalizados)
-            # Usamos o 'grupo_historico', que são ferramentas que estão DISPONIVEIS agora,
-            # mas vamos criar registros antigos com ativo=False para elas.
-            for i, ferr in enumerate(grupo_historico):
-                # 1. Cria um empréstimo antigo
-                filiais_da_ferramenta = [ferr.deposito.filial]
-                funcs_compativeis = [f for f in funcionarios if any(fil in f.filiais.all() for fil in filiais_da_ferramenta)]
-                
-                if funcs_compativeis:
-                    func = random.choice(funcs_compativeis)
-                    dt_inicio = fake.date_between(start_date='-1y', end_date='-60d')
-                    dt_fim = dt_inicio + timedelta(days=random.randint(1, 5))
-                    
-                    emp = Emprestimo.objects.create(
-                        ferramenta=ferr,
-                        funcionario=func,
-                        data_emprestimo=dt_inicio,
-                        ativo=True, # Cria ativo para linkar
-                        nome=f"Emp. Histórico {i}"
-                    )
-                    # Finaliza para gerar o snapshot
-                    emp.data_devolucao = dt_fim
-                    emp.ativo = False
-                    emp.save()
-
-                # 2. Cria uma manutenção antiga (para a mesma ferramenta, em data diferente)
-                dt_man_inicio = fake.date_between(start_date='-50d', end_date='-10d')
-                dt_man_fim = dt_man_inicio + timedelta(days=2)
-                
-                man = Manutencao.objects.create(
-                    ferramenta=ferr,
-                    tipo='PREVENTIVA',
-                    data_inicio=dt_man_inicio,
-                    ativo=True,
-                    nome=f"Manut. Histórico {i}"
-                )
-                man.data_fim = dt_man_fim
-                man.ativo = False
-                man.save()
-                
-                # Garante que no final ela está disponivel
-                ferr.estado = 'DISPONIVEL'
-                ferr.save()
-
-        # 8. IMPRESSÃO DA LISTA (Corrigido erro de formatação)
+    def _carregar_bulk(self, model, campos, linhas):
+        linhas = iter(linhas)
+        while lote := list(itertools.islice(linhas, self.opcoes['lote'])):
+            model.objects.bulk_create([model(**dict(zip(campos, linha))) for linha in lote])
+
+    # --- ESTRUTURA ---
+
+    def _estrutura(self):
+        """ Filiais, depósitos, setores e cargos. Retorna ([filial_id], [(deposito_id, filial_id)]) """
+        filiais = []
+        for indice in range(self.opcoes['filiais']):
+            if indice < len(FILIAIS_FIXAS):
+                nome, cidade = FILIAIS_FIXAS[indice]
+            else:
+                cidade = self.fake.city()
+                nome = f'Usina {indice + 1:02d} - {cidade}'
+            filiais.append((indice + 1, nome, cidade, True, self.agora))
+        self.carregar(Filial, ['id', 'nome', 'cidade', 'ativo', 'atualizado_em'], filiais)
+
+        nomes = NOMES_DEPOSITOS + [f'Depósito {numero}' for numero in range(len(NOMES_DEPOSITOS) + 1, self.opcoes['depositos_por_filial'] + 1)]
+        depositos = [
+            (indice + 1, nome, filial[0], True, self.agora)
+            for indice, (filial, nome) in enumerate(itertools.product(filiais, nomes[:self.opcoes['depositos_por_filial']]))
+        ]
+        self.carregar(Deposito, ['id', 'nome', 'filial_id', 'ativo', 'atualizado_em'], depositos)
+
+        self.carregar(Setor, ['id', 'nome_setor', 'ativo'], [(indice + 1, nome, True) for indice, nome in enumerate(SETORES)])
+        self.carregar(Cargo, ['id', 'nome_cargo', 'ativo'], [(indice + 1, nome, True) for indice, nome in enumerate(CARGOS)])
+
+        self.stdout.write(self.style.SUCCESS(f'Estrutura base criada: {len(filiais)} filiais, {len(depositos)} depósitos.'))
+        return [filial[0] for filial in filiais], [(deposito[0], deposito[2]) for deposito in depositos]
+
+    def _usuarios(self, filiais):
+        senha = make_password(SENHA_PADRAO) # Um hash para todos: o PBKDF2 é lento de propósito
+        for cpf, nome, tipo, indices in USUARIOS:
+            usuario = Usuario.objects.create(cpf=cpf, nome=nome, tipo=tipo, password=senha)
+            if tipo == 'COORDENADOR':
+                usuario.filiais.set(filiais if indices is None else {filiais[indice % len(filiais)] for indice in indices})
+        self.stdout.write(self.style.SUCCESS('Usuários 0 a 9 criados e configurados.'))
+
+    def _funcionarios(self, filiais):
+        """
+        Funcionários (10% em duas filiais). Retorna o índice {filial_id: [funcionario_id]} usado para
+        sortear funcionários compatíveis sem consultar o banco, e {funcionario_id: (nome, matricula)}.
+        """
+        quantidade = self.opcoes['funcionarios']
+        nomes = [self.fake.name() for _ in range(min(quantidade, TAMANHO_AMOSTRAS))]
+        bases_cpf = self.rng.sample(range(100_000_000, 1_000_000_000), quantidade)
+
+        funcionarios, vinculos, por_filial = {}, [], {filial_id: [] for filial_id in filiais}
+        linhas = []
+        for indice in range(quantidade):
+            funcionario_id = indice + 1
+            nome, matricula = self.rng.choice(nomes), str(10000 + indice)
+            linhas.append((
+                funcionario_id, nome, matricula, gerar_cpf(bases_cpf[indice]),
+                self.rng.randint(1, len(SETORES)), self.rng.randint(1, len(CARGOS)),
+                'defaults/default_avatar.png', False, True, self.agora,
+            ))
+            funcionarios[funcionario_id] = (nome, matricula)
+            filiais_do_funcionario = {self.rng.choice(filiais)}
+            if self.rng.random() > 0.9:
+                filiais_do_funcionario.add(self.rng.choice(filiais))
+            for filial_id in sorted(filiais_do_funcionario):
+                vinculos.append((funcionario_id, filial_id))
+                por_filial[filial_id].append(funcionario_id)
+
+        self.carregar(Funcionario, ['id', 'nome', 'matricula', 'cpf', 'setor_id', 'cargo_id', 'foto', 'foto_variantes', 'ativo', 'atualizado_em'], linhas)
+        self.carregar(Funcionario.filiais.through, ['funcionario_id', 'filial_id'], vinculos)
+        self.stdout.write(self.style.SUCCESS(f'{quantidade} Funcionários criados.'))
+        return por_filial, funcionarios
+
+    def _ferramentas(self, depositos, funcionarios_por_filial):
+        """
+        Ferramentas já com o estado final: as sorteadas para empréstimo ativo (só se houver funcionário
+        na filial) ficam EMPRESTADA e as de manutenção ativa EM_MANUTENCAO.
+        Retorna [(id, nome, numero_serie, deposito_id, filial_id, data_aquisicao, estado)].
+        """
+        quantidade = self.opcoes['ferramentas']
+        cores = sorted({self.fake.color_name().capitalize() for _ in range(200)})
+        descricoes = [self.fake.sentence() for _ in range(min(quantidade, TAMANHO_AMOSTRAS))]
+        dias_aquisicao = max(4, self.opcoes['anos']) * 365
+
+        ordem = list(range(quantidade))
+        self.rng.shuffle(ordem)
+        emprestadas = round(quantidade * self.opcoes['emprestadas'])
+        em_manutencao = round(quantidade * self.opcoes['em_manutencao'])
+        estados = {}
+        for posicao, indice in enumerate(ordem[:emprestadas + em_manutencao]):
+            estados[indice] = Ferramenta.EstadoChoices.EMPRESTADA if posicao < emprestadas else Ferramenta.EstadoChoices.EM_MANUTENCAO
+
+        ferramentas, linhas = [], []
+        for indice in range(quantidade):
+            deposito_id, filial_id = self.rng.choice(depositos)
+            estado = estados.get(indice, Ferramenta.EstadoChoices.DISPONIVEL)
+            if estado == Ferramenta.EstadoChoices.EMPRESTADA and not funcionarios_por_filial[filial_id]:
+                estado = Ferramenta.EstadoChoices.DISPONIVEL # Ninguém na filial para emprestar
+            ferramenta = (
+                indice + 1, f'{self.rng.choice(NOMES_FERRAMENTAS)} {self.rng.choice(cores)}', f'SN-{indice:04d}',
+                deposito_id, filial_id, self.hoje - datetime.timedelta(days=self.rng.randint(0, dias_aquisicao)), estado,
+            )
+            ferramentas.append(ferramenta)
+            linhas.append((
+                ferramenta[0], ferramenta[1], ferramenta[2], self.rng.choice(descricoes), ferramenta[5],
+                deposito_id, estado, 'defaults/default_ferramenta.png', False, self.agora,
+            ))
+
+        self.carregar(Ferramenta, ['id', 'nome', 'numero_serie', 'descricao', 'data_aquisicao', 'deposito_id', 'estado', 'foto', 'foto_variantes', 'atualizado_em'], linhas)
+        self.stdout.write(self.style.SUCCESS(f'{quantidade} Ferramentas criadas.'))
+        return ferramentas
+
+    # --- TRANSAÇÕES ---
+
+    def _transacoes(self, ferramentas, funcionarios_por_filial, funcionarios):
+        """
+        Histórico (finalizados, com snapshot e sem vínculos) ano a ano, do mais antigo ao mais recente,
+        e por fim as transações ativas: os ids seguem a ordem cronológica, como no uso real.
+        Cada ferramenta tem no máximo uma transação ativa, coerente com o seu estado.
+        """
+        fim_historico = self.hoje - datetime.timedelta(days=DIAS_EMPRESTIMO_ATIVO + 1)
+        inicio_historico = self.hoje - datetime.timedelta(days=365 * self.opcoes['anos'])
+        proximo_emprestimo, proxima_manutencao = 1, 1
+
+        janela = inicio_historico
+        while janela <= fim_historico:
+            fim_janela = min(janela + datetime.timedelta(days=364), fim_historico)
+            emprestimos, manutencoes = self._historico_da_janela(janela, fim_janela, ferramentas, funcionarios_por_filial, funcionarios)
+            # Ordem cronológica dentro da janela
+            emprestimos.sort(key=lambda linha: linha[4])
+            manutencoes.sort(key=lambda linha: linha[5])
+            self.carregar(Emprestimo, CAMPOS_EMPRESTIMO, self._numerar(emprestimos, proximo_emprestimo, 'Empréstimo'))
+            self.carregar(Manutencao, CAMPOS_MANUTENCAO, self._numerar(manutencoes, proxima_manutencao, 'Manutenção'))
+            proximo_emprestimo += len(emprestimos)
+            proxima_manutencao += len(manutencoes)
+            janela = fim_janela + datetime.timedelta(days=1)
+
+        emprestimos, manutencoes = [], []
+        for ferramenta_id, nome, numero_serie, deposito_id, filial_id, aquisicao, estado in ferramentas:
+            if estado == Ferramenta.EstadoChoices.EMPRESTADA:
+                inicio = self.hoje - datetime.timedelta(days=self.rng.randint(1, DIAS_EMPRESTIMO_ATIVO))
+                funcionario_id = self.rng.choice(funcionarios_por_filial[filial_id])
+                emprestimos.append([None, None, ferramenta_id, funcionario_id, inicio, None, 'Uso contínuo em obra.', True, self.agora, None, None, None, None])
+            elif estado == Ferramenta.EstadoChoices.EM_MANUTENCAO:
+                inicio = self.hoje - datetime.timedelta(days=self.rng.randint(1, DIAS_MANUTENCAO_ATIVA))
+                tipo = self.rng.choice(Manutencao.TipoChoices.values)
+                manutencoes.append([None, None, tipo, ferramenta_id, 'Aguardando peça de reposição.', inicio, None, True, self.agora, None, None])
+        self.carregar(Emprestimo, CAMPOS_EMPRESTIMO, self._numerar(emprestimos, proximo_emprestimo, 'Empréstimo'))
+        self.carregar(Manutencao, CAMPOS_MANUTENCAO, self._numerar(manutencoes, proxima_manutencao, 'Manutenção'))
+
+        total_emprestimos = proximo_emprestimo - 1 + len(emprestimos)
+        total_manutencoes = proxima_manutencao - 1 + len(manutencoes)
+        self.stdout.write(self.style.SUCCESS(
+            f'{total_emprestimos} Empréstimos ({len(emprestimos)} ativos) e {total_manutencoes} Manutenções ({len(manutencoes)} ativas) criados.'
+        ))
+
+    def _historico_da_janela(self, inicio, fim, ferramentas, funcionarios_por_filial, funcionarios):
+        """
+        Transações finalizadas de cada ferramenta entre 'inicio' e 'fim' (e depois da aquisição).
+        A quantidade segue as taxas por ano; o período da ferramenta é dividido em fatias,
+        uma transação por fatia, para que as de uma mesma ferramenta não se sobreponham.
+        """
+        emprestimos, manutencoes = [], []
+        taxa_emprestimos, taxa_manutencoes = self.opcoes['emprestimos_por_ano'], self.opcoes['manutencoes_por_ano']
+        for ferramenta_id, nome, numero_serie, deposito_id, filial_id, aquisicao, estado in ferramentas:
+            comeco = max(inicio, aquisicao)
+            dias = (fim - comeco).days + 1
+            if dias < 1:
+                continue
+            candidatos = funcionarios_por_filial[filial_id]
+            tipos = ['E'] * (self._sortear_quantidade(taxa_emprestimos * dias / 365) if candidatos else 0)
+            tipos += ['M'] * self._sortear_quantidade(taxa_manutencoes * dias / 365)
+            if not tipos:
+                continue
+            self.rng.shuffle(tipos)
+            fatia = dias / len(tipos)
+            for posicao, tipo in enumerate(tipos):
+                duracao = self.rng.randint(1, 5)
+                folga = max(0, int(fatia) - duracao)
+                data_inicio = comeco + datetime.timedelta(days=int(posicao * fatia) + self.rng.randint(0, folga))
+                data_fim = min(data_inicio + datetime.timedelta(days=duracao), fim)
+                if tipo == 'E':
+                    nome_funcionario, matricula = funcionarios[self.rng.choice(candidatos)]
+                    emprestimos.append([None, None, None, None, data_inicio, data_fim, None, False, self.agora, nome, numero_serie, nome_funcionario, matricula])
+                else:
+                    tipo_manutencao = self.rng.choice(Manutencao.TipoChoices.values)
+                    manutencoes.append([None, None, tipo_manutencao, None, None, data_inicio, data_fim, False, self.agora, nome, numero_serie])
+        return emprestimos, manutencoes
+
+    def _sortear_quantidade(self, media):
+        """ Parte inteira da média, mais um com probabilidade igual à parte fracionária """
+        inteira = int(media)
+        return inteira + (self.rng.random() < media - inteira)
+
+    @staticmethod
+    def _numerar(linhas, primeiro_id, prefixo):
+        # Mesmo nome automático do save() (ex: "Empréstimo 42")
+        for numero, linha in enumerate(linhas, primeiro_id):
+            linha[0], linha[1] = numero, f'{prefixo} {numero}'
+            yield linha
+
+    # --- RESUMO ---
+
+    def _imprimir_usuarios(self):
         self.stdout.write(self.style.SUCCESS('\n' + '='*60))
-        self.stdout.write(self.style.SUCCESS(f'--- LISTA DE USUÁRIOS (Senha: {senha_padrao}) ---'))
+        self.stdout.write(self.style.SUCCESS(f'--- LISTA DE USUÁRIOS (Senha: {SENHA_PADRAO}) ---'))
         self.stdout.write(f"{'TIPO':<15} | {'LOGIN (CPF)':<15} | {'NOME'}")
         self.stdout.write('-'*60)
 
-        todos_usuarios = Usuario.objects.all().order_by('tipo', 'nome')
-
-        for u in todos_usuarios:
+        for u in Usuario.objects.all().order_by('tipo', 'nome'):
             # Convertendo CPF para string para evitar erro de formatação
-            cpf_str = str(u.cpf) 
-            self.stdout.write(f"{u.tipo:<15} | {cpf_str:<15} | {u.nome}")
+            self.stdout.write(f"{u.tipo:<15} | {str(u.cpf):<15} | {u.nome}")
 
         self.stdout.write(self.style.SUCCESS('='*60))
-        self.stdout.write(self.style.SUCCESS('POVOAMENTO CONCLUÍDO COM SUCESSO!'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('POVOAMENTO CONCLUÍDO COM SUCESSO!'))
+
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from toolcare_api.models import ContadorEstoque
+
+class Command(BaseCommand):
+    help = 'Reconstrói os contadores de estoque (ContadorEstoque) e verifica se batem com a tabela de ferramentas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--somente-verificar', action='store_true',
+            help='Apenas compara os contadores com a contagem real, sem reconstruir.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['somente_verificar']:
+            self.stdout.write('Reconstruindo contadores...')
+            ContadorEstoque.recalcular()
+
+        # VERIFICAÇÃO: compara contador salvo x contagem real, ignorando contadores zerados
+        salvos = {
+            (c.deposito_id, c.estado): c.quantidade
+            for c in ContadorEstoque.objects.exclude(quantidade=0)
+        }
+        reais = ContadorEstoque.contagem_real()
+
+        divergencias = []
+        for chave in sorted(set(salvos) | set(reais), key=str):
+            if salvos.get(chave, 0) != reais.get(chave, 0):
+                divergencias.append((chave, salvos.get(chave, 0), reais.get(chave, 0)))
+
+        if divergencias:
+            self.stdout.write(f"{'DEPÓSITO':<10} | {'ESTADO':<15} | {'CONTADOR':>8} | {'REAL':>8}")
+            for (deposito_id, estado), salvo, real in divergencias:
+                self.stdout.write(f"{deposito_id:<10} | {estado:<15} | {salvo:>8} | {real:>8}")
+            raise CommandError(f'{len(divergencias)} contador(es) divergente(s). Rode o comando sem --somente-verificar para corrigir.')
+
+        self.stdout.write(self.style.SUCCESS(f'Contadores OK ({len(reais)} combinações de depósito/estado).'))
@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from toolcare_api.models import Usuario
+from toolcare_api.serializers import CustomTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga local contra um servidor já em execução, simulando clientes lentos '
+        '(ex: tablets das filiais em rede ruim): cada requisição abre uma conexão e envia o '
+        'cabeçalho em duas partes separadas por --latencia. Serve para comparar workers WSGI '
+        '(ex: gunicorn toolcare_api.wsgi) com o servidor ASGI (ex: uvicorn toolcare_api.asgi, rotas /api/async/).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL completa, ex: http://127.0.0.1:8000/api/async/dashboard/')
+        parser.add_argument('--clientes', type=int, default=100, help='Clientes simultâneos (padrão: 100).')
+        parser.add_argument('--requisicoes', type=int, default=5, help='Requisições por cliente (padrão: 5).')
+        parser.add_argument('--latencia', type=float, default=200, help='Atraso do cliente no meio do envio, em ms (padrão: 200).')
+        parser.add_argument('--cpf', help='CPF do usuário do token (padrão: primeiro coordenador ativo).')
+
+    def handle(self, *args, **options):
+        usuarios = Usuario.objects.filter(ativo=True)
+        usuario = usuarios.filter(cpf=options['cpf']).first() if options['cpf'] else usuarios.filter(tipo='COORDENADOR').first()
+        if usuario is None:
+            raise CommandError('Usuário não encontrado.')
+        token = str(CustomTokenObtainPairSerializer.get_token(usuario).access_token)
+
+        url = urlsplit(options['url'])
+        caminho = url.path + (f'?{url.query}' if url.query else '')
+        cabecalho = (
+            f'GET {caminho} HTTP/1.1\r\nHost: {url.netloc}\r\n'
+            f'Authorization: Bearer {token}\r\nConnection: close\r\n\r\n'
+        ).encode()
+
+        inicio = time.perf_counter()
+        resultados = asyncio.run(self._executar(
+            url.hostname, url.port or 80, cabecalho, options['clientes'], options['requisicoes'], options['latencia'] / 1000
+        ))
+        duracao = time.perf_counter() - inicio
+
+        tempos = sorted(tempo for status_http, tempo in resultados if status_http == 200)
+        erros = len(resultados) - len(tempos)
+        self.stdout.write(f"URL: {options['url']}  ({options['clientes']} clientes x {options['requisicoes']} req, latência {options['latencia']:.0f} ms)")
+        self.stdout.write(f'Requisições: {len(resultados)}  |  Erros: {erros}  |  Duração: {duracao:.2f}s')
+        if not tempos:
+            raise CommandError('Nenhuma requisição com sucesso.')
+        percentis = statistics.quantiles(tempos, n=100, method='inclusive')
+        self.stdout.write(f'Req/s: {len(tempos) / duracao:.1f}')
+        self.stdout.write(
+            f'Latência (ms)  p50: {percentis[49] * 1000:.0f}  p95: {percentis[94] * 1000:.0f}  '
+            f'p99: {percentis[98] * 1000:.0f}  máx: {tempos[-1] * 1000:.0f}'
+        )
+
+    async def _executar(self, host, porta, cabecalho, clientes, requisicoes, latencia):
+        async def cliente():
+            return [await self._requisitar(host, porta, cabecalho, latencia) for _ in range(requisicoes)]
+
+        por_cliente = await asyncio.gather(*(cliente() for _ in range(clientes)))
+        return [resultado for lista in por_cliente for resultado in lista]
+
+    async def _requisitar(self, host, porta, cabecalho, latencia):
+        inicio = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(host, porta)
+            meio = len(cabecalho) // 2
+            writer.write(cabecalho[:meio])
+            await writer.drain()
+            await asyncio.sleep(latencia) # Cliente lento: o resto do pedido chega depois
+            writer.write(cabecalho[meio:])
+            await writer.drain()
+            resposta = await reader.read()
+            writer.close()
+            status_http = int(resposta.split(b' ', 2)[1])
+        except (OSError, IndexError, ValueError):
+            status_http = None
+        return status_http, time.perf_counter() - inicio
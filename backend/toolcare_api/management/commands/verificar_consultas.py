@@ -0,0 +1,402 @@
+import datetime
+import json
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Exists, OuterRef
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+from toolcare_api.management.commands.populate_db import gerar_cpf
+from toolcare_api.models import Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao
+from toolcare_api.serializers import CustomTokenObtainPairSerializer
+
+# Contagens e varreduras aceitas, por caso e tipo de usuário (gerado com --gravar, versionado no repositório)
+REFERENCIA_PADRAO = Path(__file__).resolve().parents[2] / 'consultas_esperadas.json'
+
+TIPOS = ['MAXIMO', 'ADMINISTRADOR', 'COORDENADOR']
+
+# Seq Scan em tabela com pelo menos estas linhas reprova o caso (a não ser que esteja aceito na referência).
+# Os planos só se parecem com os de produção num banco em escala: a referência é gravada depois de
+#   manage.py populate_db --filiais 50 --funcionarios 20000 --ferramentas 100000 --anos 10
+# (num banco pequeno o planejador lê tudo por Seq Scan e nenhuma tabela chega ao limite)
+LIMITE_TABELA_GRANDE = 10_000
+
+# Listagens: as consultas não podem variar com o tamanho da página (senão há N+1 no serializer)
+TAMANHOS_PAGINA = (2, 20)
+
+# Comandos que passam pelo EXPLAIN (SAVEPOINT, INSERT simples etc. não têm plano de leitura)
+COMANDOS_EXPLICADOS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+# Caches só desta verificação: toda requisição começa sem cache (contagem estável) e os caches reais não são tocados
+CACHES_ISOLADOS = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'verificar_consultas'},
+    'referencias': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'verificar_consultas_referencias'},
+    'versao_token': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'verificar_consultas_versao_token'},
+}
+
+MARCA = '__verificar_consultas__'
+
+# CPFs dos registros criados pelos casos (fora da faixa sorteada pelo populate_db)
+CPF_USUARIO, CPF_USUARIO_EXCLUIDO, CPF_FUNCIONARIO, CPF_FUNCIONARIO_EXCLUIDO = (gerar_cpf(999_999_990 + indice) for indice in range(4))
+
+
+class _Desfazer(Exception):
+    """ Desfaz a transação de cada requisição, levando o resultado medido """
+    def __init__(self, resultado):
+        self.resultado = resultado
+
+
+class Caso:
+    """
+    Uma requisição da verificação.
+    'url' pode ser uma função: é chamada dentro da transação, fora da contagem
+    (ex: cria o registro que será excluído) e retorna a URL.
+    listagem=True: também compara as consultas entre os TAMANHOS_PAGINA.
+    exige_indice=True: Seq Scan em tabela grande nunca é aceito, nem gravado na referência
+    (casos que existem para provar o uso de um índice, ex: busca pelos índices trigrama).
+    """
+    def __init__(self, nome, metodo, url, corpo=None, listagem=False, exige_indice=False):
+        self.nome, self.metodo, self.url, self.corpo, self.listagem = nome, metodo, url, corpo, listagem
+        self.exige_indice = exige_indice
+
+
+class Command(BaseCommand):
+    help = (
+        'Executa cada ação das viewsets e o dashboard com cada tipo de usuário, cada requisição numa transação '
+        'desfeita ao final, e compara com consultas_esperadas.json: número de consultas SQL, status, N+1 nas '
+        'listagens e Seq Scan em tabelas grandes (EXPLAIN). Sai com erro se algo piorou. '
+        'Rodar contra um banco de desenvolvimento/CI populado em escala pelo populate_db (ver LIMITE_TABELA_GRANDE).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gravar', action='store_true', help='Grava os resultados atuais como referência (revise o diff do JSON).')
+        parser.add_argument('--referencia', default=str(REFERENCIA_PADRAO), help='Arquivo de referência (padrão: toolcare_api/consultas_esperadas.json).')
+        parser.add_argument('--caso', help="Só os casos cujo nome contém este texto (ex: 'ferramentas.').")
+        parser.add_argument('--tipo', choices=TIPOS, help='Só este tipo de usuário.')
+        parser.add_argument('--planos', help='Pasta onde gravar o EXPLAIN da consulta principal de cada caso.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Esta verificação só roda no PostgreSQL (usa EXPLAIN FORMAT JSON).')
+
+        caminho_referencia = Path(options['referencia'])
+        referencia = json.loads(caminho_referencia.read_text()) if caminho_referencia.exists() else {}
+        if not referencia and not options['gravar']:
+            raise CommandError(f'Referência {caminho_referencia} não encontrada. Gere com --gravar.')
+
+        dados = self._dados()
+        self.tabelas_grandes = self._tabelas_grandes()
+        if not self.tabelas_grandes:
+            self.stdout.write(self.style.WARNING(
+                f'Nenhuma tabela com {LIMITE_TABELA_GRANDE} linhas ou mais: Seq Scan não será verificado '
+                '(popule o banco em escala, ver LIMITE_TABELA_GRANDE).'
+            ))
+        casos = [caso for caso in self._casos(dados) if not options['caso'] or options['caso'] in caso.nome]
+        tipos = [options['tipo']] if options['tipo'] else TIPOS
+        if not casos:
+            raise CommandError('Nenhum caso corresponde a --caso.')
+
+        pasta_planos = Path(options['planos']) if options['planos'] else None
+        if pasta_planos:
+            pasta_planos.mkdir(parents=True, exist_ok=True)
+
+        falhas = 0
+        falhas_indice = 0
+        self.stdout.write(f"{'CASO':<32} | {'TIPO':<13} | {'STATUS':>6} | {'CONSULTAS':>9} | {'ESPERADO':>8} | RESULTADO")
+        # 403/404 esperados não precisam de aviso a cada caso; erros 500 continuam aparecendo
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        with override_settings(CACHES=CACHES_ISOLADOS):
+            for caso in casos:
+                for tipo in tipos:
+                    cliente = APIClient(SERVER_NAME='localhost')
+                    cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {dados.tokens[tipo]}')
+                    medida = self._executar(cliente, caso)
+
+                    problemas = []
+                    if caso.listagem and medida.status == 200:
+                        problemas += self._verificar_paginas(cliente, caso)
+                    esperado = referencia.get(caso.nome, {}).get(tipo)
+                    if esperado or not options['gravar']:
+                        problemas += self._comparar(caso, medida, esperado)
+                    elif caso.exige_indice and medida.varreduras:
+                        problemas.append(f"Seq Scan em {', '.join(medida.varreduras)} (o caso exige índice)")
+                    falhas_indice += caso.exige_indice and bool(medida.varreduras)
+
+                    if pasta_planos and medida.principal:
+                        self._gravar_plano(pasta_planos / f'{caso.nome}.{tipo}.txt', medida.principal)
+
+                    if options['gravar']:
+                        referencia.setdefault(caso.nome, {})[tipo] = {
+                            'status': medida.status,
+                            'consultas': len(medida.consultas),
+                            'varreduras': [] if caso.exige_indice else medida.varreduras,
+                        }
+                    falhas += bool(problemas)
+                    resultado = self.style.ERROR('; '.join(problemas)) if problemas else self.style.SUCCESS('OK')
+                    self.stdout.write(
+                        f"{caso.nome:<32} | {tipo:<13} | {medida.status:>6} | {len(medida.consultas):>9} | "
+                        f"{esperado['consultas'] if esperado else '-':>8} | {resultado}"
+                    )
+
+        if options['gravar']:
+            caminho_referencia.write_text(json.dumps(referencia, indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Referência gravada em {caminho_referencia}.'))
+            if falhas_indice:
+                raise CommandError(f'{falhas_indice} caso(s) sem o índice exigido: a referência não aceita essas varreduras.')
+        elif falhas:
+            raise CommandError(f'{falhas} caso(s) com regressão de consultas.')
+        else:
+            self.stdout.write(self.style.SUCCESS('Nenhuma regressão de consultas.'))
+
+    # --- EXECUÇÃO E ANÁLISE ---
+
+    def _executar(self, cliente, caso, sufixo=''):
+        """ Faz a requisição contando as consultas e explica cada uma; tudo desfeito ao final """
+        try:
+            with transaction.atomic():
+                for alias in CACHES_ISOLADOS:
+                    caches[alias].clear()
+                url = (caso.url() if callable(caso.url) else caso.url) + sufixo
+                with CaptureQueriesContext(connection) as capturadas:
+                    resposta = getattr(cliente, caso.metodo)(url, caso.corpo, format='json')
+                    if resposta.streaming:
+                        b''.join(resposta.streaming_content) # Exportações: as consultas acontecem no streaming
+                consultas = [consulta['sql'] for consulta in capturadas.captured_queries]
+                raise _Desfazer(SimpleNamespace(status=resposta.status_code, consultas=consultas, **self._explicar(consultas)))
+        except _Desfazer as desfeito:
+            return desfeito.resultado
+
+    def _explicar(self, consultas):
+        """ EXPLAIN de cada consulta; a principal é a de maior custo estimado """
+        varreduras = set()
+        principal = None
+        with connection.cursor() as cursor:
+            for sql in consultas:
+                if not sql.lstrip().upper().startswith(COMANDOS_EXPLICADOS):
+                    continue
+                plano = self._plano(cursor, f'EXPLAIN (FORMAT JSON) {sql}')
+                if plano is None:
+                    continue
+                plano = (json.loads(plano) if isinstance(plano, str) else plano)[0]['Plan']
+                varreduras |= self._varreduras(plano)
+                if principal is None or plano['Total Cost'] > principal[1]:
+                    principal = (sql, plano['Total Cost'])
+
+            if principal:
+                texto = self._plano(cursor, f'EXPLAIN {principal[0]}', todas_linhas=True)
+                principal = (principal[0], texto)
+        return {'varreduras': sorted(varreduras), 'principal': principal}
+
+    def _plano(self, cursor, sql, todas_linhas=False):
+        try:
+            with transaction.atomic(): # Consulta que não aceita EXPLAIN não derruba a transação
+                cursor.execute(sql)
+                linhas = cursor.fetchall()
+        except DatabaseError:
+            return None
+        return '\n'.join(linha[0] for linha in linhas) if todas_linhas else linhas[0][0]
+
+    def _varreduras(self, plano):
+        """ Tabelas grandes lidas por Seq Scan em qualquer nó do plano (inclui subplanos) """
+        encontradas = set()
+        pendentes = [plano]
+        while pendentes:
+            no = pendentes.pop()
+            if no['Node Type'] == 'Seq Scan' and no.get('Relation Name') in self.tabelas_grandes:
+                encontradas.add(no['Relation Name'])
+            pendentes.extend(no.get('Plans', []))
+        return encontradas
+
+    def _tabelas_grandes(self):
+        """ Tabelas com LIMITE_TABELA_GRANDE linhas ou mais, pela estimativa do Postgres (ANALYZE) """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relname FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace AND reltuples >= %s",
+                [LIMITE_TABELA_GRANDE]
+            )
+            return {linha[0] for linha in cursor.fetchall()}
+
+    def _verificar_paginas(self, cliente, caso):
+        contagens = [len(self._executar(cliente, caso, f'&page_size={tamanho}').consultas) for tamanho in TAMANHOS_PAGINA]
+        if len(set(contagens)) > 1:
+            detalhes = ', '.join(f'{tamanho} itens: {contagem}' for tamanho, contagem in zip(TAMANHOS_PAGINA, contagens))
+            return [f'N+1 (consultas por página: {detalhes})']
+        return []
+
+    def _comparar(self, caso, medida, esperado):
+        if esperado is None:
+            return ['sem referência (rode com --gravar)']
+        problemas = []
+        if medida.status != esperado['status']:
+            problemas.append(f"status {medida.status}, esperado {esperado['status']}")
+        if len(medida.consultas) > esperado['consultas']:
+            problemas.append(f"{len(medida.consultas)} consultas, esperado até {esperado['consultas']}")
+        aceitas = set() if caso.exige_indice else set(esperado['varreduras'])
+        novas = set(medida.varreduras) - aceitas
+        if novas:
+            problemas.append(f"Seq Scan em {', '.join(sorted(novas))}" + (' (o caso exige índice)' if caso.exige_indice else ''))
+        return problemas
+
+    def _gravar_plano(self, caminho, principal):
+        sql, plano = principal
+        caminho.write_text(f'{sql}\n\n{plano or "(sem plano)"}\n')
+
+    # --- DADOS E CASOS ---
+
+    def _dados(self):
+        """ Usuário de cada tipo e registros das filiais do coordenador (todos os tipos enxergam os mesmos ids) """
+        usuarios = {tipo: Usuario.objects.filter(tipo=tipo, ativo=True).order_by('id').first() for tipo in TIPOS}
+        usuarios['COORDENADOR'] = Usuario.objects.filter(tipo='COORDENADOR', ativo=True, filiais__ativo=True).order_by('id').first()
+        if None in usuarios.values():
+            raise CommandError('É preciso um usuário ativo de cada tipo (rode o populate_db).')
+
+        filial = usuarios['COORDENADOR'].filiais.filter(ativo=True).order_by('id').first()
+        emprestimo_ativo = Emprestimo.objects.filter(ativo=True, funcionario_id=OuterRef('pk'))
+        dados = SimpleNamespace(
+            tokens={tipo: str(CustomTokenObtainPairSerializer.get_token(usuario).access_token) for tipo, usuario in usuarios.items()},
+            coordenador=usuarios['COORDENADOR'],
+            filial=filial,
+            deposito=Deposito.objects.filter(filial=filial, ativo=True).order_by('id').first(),
+            setor=Setor.objects.filter(ativo=True).order_by('id').first(),
+            cargo=Cargo.objects.filter(ativo=True).order_by('id').first(),
+            ferramentas=list(Ferramenta.objects.filter(deposito__filial=filial, estado='DISPONIVEL').order_by('id')[:3]),
+            funcionario=Funcionario.objects.filter(filiais=filial, ativo=True).exclude(Exists(emprestimo_ativo)).order_by('id').first(),
+            emprestimos=list(Emprestimo.objects.filter(ativo=True, ferramenta__deposito__filial=filial).order_by('id').values_list('id', flat=True)[:2]),
+            manutencoes=list(Manutencao.objects.filter(ativo=True, ferramenta__deposito__filial=filial).order_by('id').values_list('id', flat=True)[:2]),
+        )
+        if None in (dados.deposito, dados.setor, dados.cargo, dados.funcionario) or len(dados.ferramentas) < 3 \
+                or len(dados.emprestimos) < 2 or len(dados.manutencoes) < 2:
+            raise CommandError(f"Dados insuficientes na filial '{filial.nome}' (rode o populate_db).")
+        return dados
+
+    def _casos(self, dados):
+        hoje = datetime.date.today().isoformat()
+        filial, deposito, ferramenta = dados.filial, dados.deposito, dados.ferramentas[0]
+        funcionario, emprestimo, manutencao = dados.funcionario, dados.emprestimos[0], dados.manutencoes[0]
+
+        # Registros criados dentro da transação do caso, fora da contagem
+        def nova_filial():
+            return Filial.objects.create(nome=MARCA, cidade=MARCA)
+
+        def novo_deposito(filial_destino=filial):
+            novo = Deposito.objects.create(nome=MARCA, filial=filial_destino)
+            for indice in range(2):
+                Ferramenta.objects.create(nome=MARCA, numero_serie=f'{MARCA}{indice}', deposito=novo)
+            return novo
+
+        def filial_com_deposito():
+            nova = nova_filial()
+            novo_deposito(nova)
+            return nova
+
+        def ferramenta_inativa():
+            Ferramenta.objects.filter(id=ferramenta.id).update(estado='INATIVA')
+            return f'/api/ferramentas/{ferramenta.id}/reativar/'
+
+        def funcionario_inativo():
+            Funcionario.objects.filter(id=funcionario.id).update(ativo=False)
+            return f'/api/funcionarios/{funcionario.id}/reativar/'
+
+        def novo_funcionario():
+            novo = Funcionario.objects.create(nome=MARCA, matricula='99999998', cpf=CPF_FUNCIONARIO_EXCLUIDO)
+            novo.filiais.add(filial)
+            return novo
+
+        usuario = {'nome': MARCA, 'cpf': CPF_USUARIO, 'tipo': 'COORDENADOR', 'filiais': [filial.id], 'password': MARCA}
+        casos = [
+            Caso('usuarios.list', 'get', '/api/usuarios/?page=1', listagem=True),
+            Caso('usuarios.retrieve', 'get', f'/api/usuarios/{dados.coordenador.id}/'),
+            Caso('usuarios.create', 'post', '/api/usuarios/', usuario),
+            Caso('usuarios.update', 'put', f'/api/usuarios/{dados.coordenador.id}/', {
+                'nome': dados.coordenador.nome, 'cpf': str(dados.coordenador.cpf), 'tipo': 'COORDENADOR',
+                'filiais': list(dados.coordenador.filiais.values_list('id', flat=True)), 'ativo': True,
+            }),
+            Caso('usuarios.partial_update', 'patch', f'/api/usuarios/{dados.coordenador.id}/', {'password': MARCA}),
+            Caso('usuarios.destroy', 'delete', lambda: f"/api/usuarios/{Usuario.objects.create_user(nome=MARCA, cpf=CPF_USUARIO_EXCLUIDO, tipo='COORDENADOR').id}/"),
+        ]
+
+        for rota, modelo, campo_nome in (('filiais', Filial, 'nome'), ('depositos', Deposito, 'nome'), ('setores', Setor, 'nome_setor'), ('cargos', Cargo, 'nome_cargo')):
+            registro = {'filiais': filial, 'depositos': deposito, 'setores': dados.setor, 'cargos': dados.cargo}[rota]
+            corpo = {campo_nome: MARCA}
+            if rota == 'filiais':
+                corpo['cidade'] = MARCA
+            if rota == 'depositos':
+                corpo['filial'] = filial.id
+            casos += [
+                Caso(f'{rota}.list', 'get', f'/api/{rota}/?page=1', listagem=True),
+                Caso(f'{rota}.retrieve', 'get', f'/api/{rota}/{registro.id}/'),
+                Caso(f'{rota}.create', 'post', f'/api/{rota}/', corpo),
+                Caso(f'{rota}.update', 'put', f'/api/{rota}/{registro.id}/', corpo),
+                Caso(f'{rota}.partial_update', 'patch', f'/api/{rota}/{registro.id}/', {campo_nome: MARCA}),
+            ]
+        casos += [
+            Caso('filiais.destroy', 'delete', lambda: f'/api/filiais/{nova_filial().id}/'),
+            Caso('filiais.desativar', 'patch', lambda: f'/api/filiais/{filial_com_deposito().id}/desativar/'),
+            Caso('depositos.destroy', 'delete', lambda: f'/api/depositos/{Deposito.objects.create(nome=MARCA, filial=filial).id}/'),
+            Caso('depositos.desativar', 'patch', lambda: f'/api/depositos/{novo_deposito().id}/desativar/'),
+            Caso('setores.destroy', 'delete', lambda: f'/api/setores/{Setor.objects.create(nome_setor=MARCA).id}/'),
+            Caso('cargos.destroy', 'delete', lambda: f'/api/cargos/{Cargo.objects.create(nome_cargo=MARCA).id}/'),
+        ]
+
+        corpo_funcionario = {
+            'nome': MARCA, 'matricula': '99999999', 'cpf': CPF_FUNCIONARIO,
+            'setor': dados.setor.id, 'cargo': dados.cargo.id, 'filiais': [filial.id],
+        }
+        casos += [
+            Caso('funcionarios.list', 'get', '/api/funcionarios/?page=1', listagem=True),
+            Caso('funcionarios.busca', 'get', f'/api/funcionarios/?page=1&search_field=nome&search_value={funcionario.nome.split()[0]}', listagem=True, exige_indice=True),
+            Caso('funcionarios.retrieve', 'get', f'/api/funcionarios/{funcionario.id}/'),
+            Caso('funcionarios.create', 'post', '/api/funcionarios/', corpo_funcionario),
+            Caso('funcionarios.update', 'put', f'/api/funcionarios/{funcionario.id}/', {**corpo_funcionario, 'cpf': str(funcionario.cpf)}),
+            Caso('funcionarios.partial_update', 'patch', f'/api/funcionarios/{funcionario.id}/', {'nome': MARCA}),
+            Caso('funcionarios.destroy', 'delete', lambda: f'/api/funcionarios/{novo_funcionario().id}/'),
+            Caso('funcionarios.desativar', 'patch', f'/api/funcionarios/{funcionario.id}/desativar/'),
+            Caso('funcionarios.reativar', 'patch', funcionario_inativo),
+        ]
+
+        corpo_ferramenta = {'nome': MARCA, 'numero_serie': MARCA, 'deposito': deposito.id}
+        casos += [
+            Caso('ferramentas.list', 'get', '/api/ferramentas/?page=1', listagem=True),
+            Caso('ferramentas.busca', 'get', f'/api/ferramentas/?page=1&search_field=nome&search_value={ferramenta.nome.split()[0]}', listagem=True, exige_indice=True),
+            Caso('ferramentas.retrieve', 'get', f'/api/ferramentas/{ferramenta.id}/'),
+            Caso('ferramentas.create', 'post', '/api/ferramentas/', corpo_ferramenta),
+            Caso('ferramentas.update', 'put', f'/api/ferramentas/{ferramenta.id}/', corpo_ferramenta),
+            Caso('ferramentas.partial_update', 'patch', f'/api/ferramentas/{ferramenta.id}/', {'descricao': MARCA}),
+            Caso('ferramentas.destroy', 'delete', lambda: f"/api/ferramentas/{Ferramenta.objects.create(nome=MARCA, numero_serie=MARCA, deposito=deposito).id}/"),
+            Caso('ferramentas.desativar', 'patch', f'/api/ferramentas/{ferramenta.id}/desativar/'),
+            Caso('ferramentas.reativar', 'patch', ferramenta_inativa),
+        ]
+
+        itens_lote = [{'ferramenta': outra.id, 'funcionario': funcionario.id} for outra in dados.ferramentas[1:]]
+        casos += [
+            Caso('emprestimos.list', 'get', '/api/emprestimos/?page=1', listagem=True),
+            Caso('emprestimos.busca', 'get', f'/api/emprestimos/?page=1&search_field=nome&search_value=Empr%C3%A9stimo%20{emprestimo}', listagem=True, exige_indice=True),
+            Caso('emprestimos.retrieve', 'get', f'/api/emprestimos/{emprestimo}/'),
+            Caso('emprestimos.create', 'post', '/api/emprestimos/', itens_lote[0]),
+            Caso('emprestimos.update', 'put', f'/api/emprestimos/{emprestimo}/', {'observacoes': MARCA}),
+            Caso('emprestimos.partial_update', 'patch', f'/api/emprestimos/{emprestimo}/', {'ativo': False, 'data_devolucao': hoje}),
+            Caso('emprestimos.destroy', 'delete', f'/api/emprestimos/{emprestimo}/'),
+            Caso('emprestimos.lote', 'post', '/api/emprestimos/lote/', {'itens': itens_lote}),
+            Caso('emprestimos.devolver_lote', 'post', '/api/emprestimos/devolver_lote/', {'ids': dados.emprestimos, 'data_devolucao': hoje}),
+            Caso('emprestimos.export', 'get', f'/api/emprestimos/export/?formato=csv&filial={filial.id}&ativo=true'),
+        ]
+
+        casos += [
+            Caso('manutencoes.list', 'get', '/api/manutencoes/?page=1', listagem=True),
+            Caso('manutencoes.retrieve', 'get', f'/api/manutencoes/{manutencao}/'),
+            Caso('manutencoes.create', 'post', '/api/manutencoes/', {'ferramenta': dados.ferramentas[1].id, 'tipo': 'PREVENTIVA'}),
+            Caso('manutencoes.update', 'put', f'/api/manutencoes/{manutencao}/', {'observacoes': MARCA}),
+            Caso('manutencoes.partial_update', 'patch', f'/api/manutencoes/{manutencao}/', {'ativo': False, 'data_fim': hoje}),
+            Caso('manutencoes.destroy', 'delete', f'/api/manutencoes/{manutencao}/'),
+            Caso('manutencoes.finalizar_lote', 'post', '/api/manutencoes/finalizar_lote/', {'ids': dados.manutencoes, 'data_fim': hoje}),
+            Caso('manutencoes.export', 'get', f'/api/manutencoes/export/?formato=csv&filial={filial.id}&ativo=true'),
+        ]
+
+        casos += [
+            Caso('dashboard', 'get', '/api/dashboard/'),
+            Caso('dashboard.filial', 'get', f'/api/dashboard/?filial={filial.id}'),
+        ]
+        return casos
@@ -0,0 +1,123 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+from .instrumentacao import instalar_medicoes, medindo
+
+# --- MÉTRICAS (formato Prometheus, servidas em /metrics) ---
+# Opcional (METRICAS=true, ver settings.py). Por requisição: latência por viewset/ação/tipo de usuário,
+# número de consultas SQL e erros (status >= 400). Fora das requisições: transições de estado das
+# ferramentas, que contam os empréstimos e as manutenções iniciados e finalizados (a desativação em
+# cascata de filial/depósito recalcula o ContadorEstoque de uma vez e não entra na contagem).
+#
+# Vários processos (workers do gunicorn): com PROMETHEUS_MULTIPROC_DIR definida antes de iniciar,
+# cada processo grava seus valores em arquivos na pasta e o /metrics soma todos (ver gunicorn.conf.py).
+# Sem ela, cada processo responde só os próprios números (adequado ao runserver).
+
+# Latência em segundos: de 5 ms (cache/ETag) a 10 s (exportações e lotes grandes)
+FAIXAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Consultas por requisição: uma listagem normal faz de 2 a 5; N+1 aparece nas faixas de cima
+FAIXAS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+LATENCIA = Histogram(
+    'toolcare_requisicao_segundos', 'Duração das requisições até o início da resposta',
+    ['viewset', 'acao', 'tipo_usuario'], buckets=FAIXAS_LATENCIA,
+)
+CONSULTAS = Histogram(
+    'toolcare_requisicao_consultas', 'Consultas SQL por requisição',
+    ['viewset', 'acao'], buckets=FAIXAS_CONSULTAS,
+)
+ERROS = Counter(
+    'toolcare_requisicao_erros', 'Respostas com status >= 400',
+    ['viewset', 'acao', 'status'],
+)
+TRANSICOES = Counter(
+    'toolcare_transicoes_ferramenta',
+    'Ferramentas que mudaram de estado. Empréstimos: DISPONIVEL->EMPRESTADA (início) e EMPRESTADA->DISPONIVEL (devolução); '
+    'manutenções: DISPONIVEL->EM_MANUTENCAO e EM_MANUTENCAO->DISPONIVEL',
+    ['origem', 'destino'],
+)
+
+
+def registrar_transicao(estado_origem, estado_destino, quantidade=1):
+    """ Conta 'quantidade' ferramentas indo de um estado a outro, só se a transação for confirmada """
+    if not settings.METRICAS or estado_origem == estado_destino:
+        return
+    transaction.on_commit(
+        lambda: TRANSICOES.labels(origem=estado_origem, destino=estado_destino).inc(quantidade), robust=True
+    )
+
+
+def gerar_exposicao():
+    """ Texto do /metrics: soma de todos os processos quando PROMETHEUS_MULTIPROC_DIR está definida """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
+
+
+def _rotulos_da_rota(request):
+    """
+    (viewset, ação) da rota atendida. ViewSets: a ação do router (list, create, desativar...);
+    demais views de classe: o método HTTP. Funções (admin, mídia) usam o nome da rota.
+    """
+    rota = getattr(request, 'resolver_match', None)
+    if rota is None:
+        return 'nenhuma', request.method.lower()
+    classe = getattr(rota.func, 'cls', None) or getattr(rota.func, 'view_class', None) # DRF ou View do Django (views_async)
+    if classe is None:
+        return rota.view_name, request.method.lower()
+    acoes = getattr(rota.func, 'actions', None) or {}
+    return classe.__name__, acoes.get(request.method.lower(), request.method.lower())
+
+
+def _tipo_usuario(request):
+    # O DRF troca o request.user pelo usuário autenticado. Se ainda for o preguiçoso do
+    # AuthenticationMiddleware, ninguém autenticou pelo DRF: não é avaliado (evita consultar a sessão)
+    usuario = getattr(request, 'user', None)
+    if usuario is None or type(usuario) is SimpleLazyObject:
+        return 'anonimo'
+    return getattr(usuario, 'tipo', None) or 'anonimo'
+
+
+class MetricasMiddleware:
+    """ Alimenta os histogramas e contadores de requisição. Funciona sob WSGI e ASGI """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instalar_medicoes() # Contagem de consultas (ver instrumentacao.py)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        with medindo() as medicao:
+            response = self.get_response(request)
+        self._registrar(request, response, medicao, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        with medindo() as medicao:
+            response = await self.get_response(request)
+        self._registrar(request, response, medicao, time.perf_counter() - inicio)
+        return response
+
+    def _registrar(self, request, response, medicao, duracao):
+        viewset, acao = _rotulos_da_rota(request)
+        LATENCIA.labels(viewset=viewset, acao=acao, tipo_usuario=_tipo_usuario(request)).observe(duracao)
+        CONSULTAS.labels(viewset=viewset, acao=acao).observe(medicao.consultas)
+        if response.status_code >= 400:
+            ERROS.labels(viewset=viewset, acao=acao, status=str(response.status_code)).inc()
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def popular_contadores(apps, schema_editor):
+    """ Preenche os contadores com o estoque já existente """
+    Ferramenta = apps.get_model('toolcare_api', 'Ferramenta')
+    ContadorEstoque = apps.get_model('toolcare_api', 'ContadorEstoque')
+    linhas = Ferramenta.objects.values('deposito_id', 'estado').annotate(quantidade=Count('id')).order_by()
+    ContadorEstoque.objects.bulk_create([
+        ContadorEstoque(deposito_id=l['deposito_id'], estado=l['estado'], quantidade=l['quantidade'])
+        for l in linhas
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0006_auto_20260108_1002'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('DISPONIVEL', 'Disponível'), ('EMPRESTADA', 'Emprestada'), ('EM_MANUTENCAO', 'Em Manutenção'), ('INATIVA', 'Inativa')], max_length=20)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('deposito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores', to='toolcare_api.deposito')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('deposito', 'estado'), name='unique_contador_por_deposito_estado')],
+            },
+        ),
+        migrations.RunPython(popular_contadores, migrations.RunPython.noop),
+    ]
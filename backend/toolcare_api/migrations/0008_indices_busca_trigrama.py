@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:50
+
+import django.contrib.postgres.indexes
+import toolcare_api.busca
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# unaccent() é STABLE e não pode ser usada em índices: este wrapper IMMUTABLE pode.
+CRIAR_F_UNACCENT = """
+CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+$$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0007_contadorestoque'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(CRIAR_F_UNACCENT, 'DROP FUNCTION IF EXISTS f_unaccent(text);'),
+        migrations.AddIndex(
+            model_name='emprestimo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome_ferramenta_historico'), name='gin_trgm_ops'), name='emprestimo_ferr_hist_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='emprestimo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('numero_serie_ferramenta_historico'), name='gin_trgm_ops'), name='emprestimo_serie_hist_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='emprestimo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome_funcionario_historico'), name='gin_trgm_ops'), name='emprestimo_func_hist_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='emprestimo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('matricula_funcionario_historico'), name='gin_trgm_ops'), name='emprestimo_matr_hist_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='ferramenta',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome'), name='gin_trgm_ops'), name='ferramenta_nome_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='ferramenta',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('numero_serie'), name='gin_trgm_ops'), name='ferramenta_serie_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='ferramenta',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('descricao'), name='gin_trgm_ops'), name='ferramenta_descricao_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='funcionario',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome'), name='gin_trgm_ops'), name='funcionario_nome_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='funcionario',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('matricula'), name='gin_trgm_ops'), name='funcionario_matricula_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='manutencao',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome_ferramenta_historico'), name='gin_trgm_ops'), name='manutencao_ferr_hist_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='manutencao',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('numero_serie_ferramenta_historico'), name='gin_trgm_ops'), name='manutencao_serie_hist_busca'),
+        ),
+    ]
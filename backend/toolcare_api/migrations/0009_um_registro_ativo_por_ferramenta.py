@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def verificar_registros_ativos_duplicados(apps, schema_editor):
+    """
+    As constraints abaixo falhariam com um IntegrityError sem contexto se alguma ferramenta
+    já tiver dois empréstimos (ou duas manutenções) ativos. Qual deles é o verdadeiro é decisão
+    de quem opera o sistema: a migração não escolhe, lista os casos e para.
+    """
+    problemas = []
+    for model_name, rotulo in [('Emprestimo', 'Empréstimos ativos'), ('Manutencao', 'Manutenções ativas')]:
+        model = apps.get_model('toolcare_api', model_name)
+        ferramentas = (
+            model.objects.filter(ativo=True, ferramenta__isnull=False)
+            .values('ferramenta_id').annotate(total=Count('id')).filter(total__gt=1)
+            .values_list('ferramenta_id', flat=True)
+        )
+        for ferramenta_id in ferramentas:
+            ids = list(model.objects.filter(ativo=True, ferramenta_id=ferramenta_id).order_by('id').values_list('id', flat=True))
+            problemas.append(f'  {rotulo} da ferramenta {ferramenta_id}: ids {", ".join(map(str, ids))}')
+
+    if problemas:
+        raise RuntimeError(
+            'Há ferramentas com mais de um registro ativo. Finalize os excedentes direto no banco '
+            '(UPDATE ... SET ativo = false; pelo save() a ferramenta do registro que continua ativo seria liberada) '
+            'e rode a migração de novo:\n' + '\n'.join(problemas)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0008_indices_busca_trigrama'),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_registros_ativos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='emprestimo',
+            constraint=models.UniqueConstraint(condition=models.Q(('ativo', True)), fields=('ferramenta',), name='um_emprestimo_ativo_por_ferramenta'),
+        ),
+        migrations.AddConstraint(
+            model_name='manutencao',
+            constraint=models.UniqueConstraint(condition=models.Q(('ativo', True)), fields=('ferramenta',), name='uma_manutencao_ativa_por_ferramenta'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.db import migrations
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+
+def nomear_registros_sem_nome(apps, schema_editor):
+    """
+    Completa registros que ficaram sem nome (INSERT gravado sem o UPDATE do nome)
+    com a mesma regra do save(): "Empréstimo {id}" / "Manutenção {id}".
+    """
+    for model_name, prefixo in [('Emprestimo', 'Empréstimo '), ('Manutencao', 'Manutenção ')]:
+        model = apps.get_model('toolcare_api', model_name)
+        model.objects.filter(nome__isnull=True).update(
+            nome=Concat(Value(prefixo), Cast('id', CharField()), output_field=CharField())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0009_um_registro_ativo_por_ferramenta'),
+    ]
+
+    operations = [
+        migrations.RunPython(nomear_registros_sem_nome, migrations.RunPython.noop),
+    ]
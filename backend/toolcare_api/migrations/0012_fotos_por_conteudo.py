@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+import toolcare_api.armazenamento
+import toolcare_api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0011_usuario_versao_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ferramenta',
+            name='foto',
+            field=models.ImageField(blank=True, default='defaults/default_ferramenta.png', storage=toolcare_api.armazenamento.ArmazenamentoPorConteudo(), upload_to=toolcare_api.models.upload_path_ferramenta),
+        ),
+        migrations.AlterField(
+            model_name='funcionario',
+            name='foto',
+            field=models.ImageField(blank=True, default='defaults/default_avatar.png', storage=toolcare_api.armazenamento.ArmazenamentoPorConteudo(), upload_to=toolcare_api.models.upload_path_funcionario),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0012_fotos_por_conteudo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoTabela',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(max_length=30)),
+                ('filial_id', models.IntegerField(default=0)),
+                ('versao', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tabela', 'filial_id'), name='unique_versao_por_tabela_filial')],
+            },
+        ),
+    ]
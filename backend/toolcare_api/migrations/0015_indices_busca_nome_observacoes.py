@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:30
+
+import django.contrib.postgres.indexes
+import toolcare_api.busca
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0014_sincronizacao_incremental'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emprestimo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome'), name='gin_trgm_ops'), name='emprestimo_nome_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='emprestimo',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('observacoes'), name='gin_trgm_ops'), name='emprestimo_obs_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='manutencao',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('nome'), name='gin_trgm_ops'), name='manutencao_nome_busca'),
+        ),
+        migrations.AddIndex(
+            model_name='manutencao',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(toolcare_api.busca.SemAcento('observacoes'), name='gin_trgm_ops'), name='manutencao_obs_busca'),
+        ),
+    ]
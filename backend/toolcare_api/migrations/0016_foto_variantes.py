@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('toolcare_api', '0015_indices_busca_nome_observacoes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ferramenta',
+            name='foto_variantes',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='funcionario',
+            name='foto_variantes',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -1,19 +1,50 @@
-from django.db import models
+from django.db import models, transaction, connection
+from django.db.models import F, Count, Q, Sum, Value
+from django.db.models.functions import Now
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django_cpf_cnpj.fields import CPFField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from .busca import SemAcento
+from .imagens import foto_enviada, gerar_variantes_ao_salvar
+from .armazenamento import armazenamento_fotos
+from .cache_referencias import invalidar as invalidar_cache_referencias
+from .eventos import obter_broker
+from .metricas import registrar_transicao
 import datetime
 
 # --- FUNÇÕES AUXILIARES ---
-# Define a organização de pastas para upload de arquivos.
-# As fotos serão salvas em pastas com o nome da entidade (ex: media/funcionarios/Joao/foto.jpg)
-def upload_path_funcionario(instance, filename): return f'funcionarios/{instance.nome}/{filename}'
-def upload_path_ferramenta(instance, filename): return f'ferramentas/{instance.nome}/{filename}'
+# Define a pasta de upload das fotos. O nome do arquivo é trocado pelo hash do conteúdo
+# (ver armazenamento.py), ex: media/funcionarios/3f/3fa9...e1.jpg
+def upload_path_funcionario(instance, filename): return f'funcionarios/{filename}'
+def upload_path_ferramenta(instance, filename): return f'ferramentas/{filename}'
 
 # Validador para garantir que campos numéricos (como matrícula) não recebam letras
 numeric_validator = RegexValidator(r'^\d+$', 'Somente números são permitidos.')
 
+def reservar_ids(model, quantidade=1):
+    """
+    Reserva os próximos 'quantidade' ids da sequência da tabela, sem inserir nada.
+    Permite montar campos que dependem do id (ex: nome automático) antes do INSERT.
+    Retorna None se o banco não tiver sequências (ex: SQLite).
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [model._meta.db_table, quantidade]
+        )
+        return [linha[0] for linha in cursor.fetchall()]
+
+def indice_busca(campo, nome):
+    """ Índice trigrama (GIN) sobre f_unaccent(campo), usado pelo lookup '__busca' (ver busca.py) """
+    return GinIndex(OpClass(SemAcento(campo), name='gin_trgm_ops'), name=nome)
+
 
 # --- GERENCIAMENTO DE USUÁRIOS ---
 
@@ -67,6 +98,10 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
     # Soft Delete: Usuários não são apagados, apenas inativados
     ativo = models.BooleanField(default=True)
 
+    # Versão dos tokens JWT: vai no token e é conferida a cada requisição (ver autenticacao.py).
+    # Incrementar invalida todos os tokens já emitidos para o usuário.
+    versao_token = models.PositiveIntegerField(default=0, editable=False)
+
     objects = UsuarioManager()
 
     # Configurações do Django Auth
@@ -79,9 +114,64 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
         # mas as permissões reais são controladas via código (IsAdminOrMaximo)
         return True
 
+    # (ativo, tipo, senha) gravados no banco: se algum mudar, os tokens emitidos deixam de valer.
+    _acesso_original = None
+
     def __str__(self):
         return self.nome
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._acesso_original = instance._dados_de_acesso()
+        return instance
+
+    def _dados_de_acesso(self):
+        return (self.__dict__.get('ativo'), self.__dict__.get('tipo'), self.__dict__.get('password'))
+
+    @staticmethod
+    def chave_versao_token(usuario_id):
+        """ Chave do cache onde fica a versão de token vigente do usuário """
+        return f'toolcare:versao_token:{usuario_id}'
+
+    @staticmethod
+    def cache_versao_token():
+        """ Cache das versões de token (settings.CACHES['versao_token']) """
+        return caches['versao_token']
+
+    def save(self, *args, **kwargs):
+        # REGRA: Desativar, mudar o tipo ou trocar a senha revoga os tokens já emitidos
+        revogar = self._acesso_original is not None and self._acesso_original != self._dados_de_acesso()
+        if revogar:
+            self.versao_token += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'versao_token'}
+
+        super().save(*args, **kwargs)
+        self._acesso_original = self._dados_de_acesso()
+        if revogar:
+            self._limpar_versao_em_cache()
+
+    def revogar_tokens(self):
+        """ Invalida todos os tokens do usuário (ex: filiais alteradas, já que elas vão no token) """
+        Usuario.revogar_tokens_de([self.pk])
+        self.refresh_from_db(fields=['versao_token'])
+
+    @classmethod
+    def revogar_tokens_de(cls, usuario_ids):
+        """ Invalida os tokens de vários usuários com um UPDATE só (ex: filial removida de vários usuários) """
+        usuario_ids = list(usuario_ids)
+        if not usuario_ids:
+            return
+        cls.objects.filter(pk__in=usuario_ids).update(versao_token=F('versao_token') + 1)
+        chaves = [cls.chave_versao_token(usuario_id) for usuario_id in usuario_ids]
+        transaction.on_commit(lambda: cls.cache_versao_token().delete_many(chaves))
+
+    def _limpar_versao_em_cache(self):
+        chave = Usuario.chave_versao_token(self.pk)
+        transaction.on_commit(lambda: Usuario.cache_versao_token().delete(chave))
+
 
 # --- ESTRUTURA ORGANIZACIONAL ---
 
@@ -90,10 +180,38 @@ class Filial(models.Model):
     nome = models.CharField(max_length=100, unique=True)
     cidade = models.CharField(max_length=100)
     ativo = models.BooleanField(default=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True) # Sincronização incremental (?atualizado_desde=, ver sincronizacao.py)
     
     def __str__(self):
         return f"{self.nome} ({self.cidade})"
 
+
+def _filiais_do_usuario_alteradas(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    REGRA: As filiais vão no token: adicionar ou remover filiais de um usuário revoga os tokens dele,
+    venha de onde vier (API, admin, comandos, ou pelo lado da filial: filial.usuario_set).
+    """
+    if action == 'post_add' and pk_set: # O Django só informa os vínculos realmente criados
+        if reverse:
+            Usuario.revogar_tokens_de(pk_set)
+        else:
+            instance.revogar_tokens()
+    elif action == 'pre_remove' and pk_set:
+        # O post_remove informa os ids pedidos, vinculados ou não: só revoga quem perde uma filial de fato
+        if reverse:
+            Usuario.revogar_tokens_de(
+                sender.objects.filter(filial_id=instance.pk, usuario_id__in=pk_set).values_list('usuario_id', flat=True)
+            )
+        elif sender.objects.filter(usuario_id=instance.pk, filial_id__in=pk_set).exists():
+            instance.revogar_tokens()
+    elif action == 'pre_clear':
+        if reverse:
+            Usuario.revogar_tokens_de(instance.usuario_set.values_list('id', flat=True))
+        elif instance.filiais.exists():
+            instance.revogar_tokens()
+
+m2m_changed.connect(_filiais_do_usuario_alteradas, sender=Usuario.filiais.through, dispatch_uid='revogar_tokens_filiais_usuario')
+
 class Deposito(models.Model):
     """ 
     Local físico dentro de uma filial onde as ferramentas são guardadas.
@@ -102,7 +220,11 @@ class Deposito(models.Model):
     nome = models.CharField(max_length=100)
     filial = models.ForeignKey(Filial, on_delete=models.CASCADE, related_name='depositos')
     ativo = models.BooleanField(default=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
     
+    # Filial gravada no banco: se mudar, os itens do depósito saem do escopo da filial antiga (ver sincronizacao.py)
+    _filial_original = None
+
     class Meta:
         # REGRA DE NEGÓCIO: Unicidade Composta
         # Impede que existam dois depósitos com o mesmo nome NA MESMA FILIAL.
@@ -114,6 +236,12 @@ class Deposito(models.Model):
     def __str__(self):
         return f"{self.nome} - {self.filial.nome}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._filial_original = instance.__dict__.get('filial_id')
+        return instance
+
 class Setor(models.Model):
     """ Setor de trabalho do funcionário (ex: Manutenção, Produção) """
     nome_setor = models.CharField(max_length=255, unique=True)
@@ -142,7 +270,8 @@ class Ferramenta(models.Model):
     nome = models.CharField(max_length=255)
     numero_serie = models.CharField(max_length=50, unique=True) # Identificador único global
     descricao = models.TextField(blank=True, null=True)
-    foto = models.ImageField(upload_to=upload_path_ferramenta, blank=True, default='defaults/default_ferramenta.png')
+    foto = models.ImageField(upload_to=upload_path_ferramenta, storage=armazenamento_fotos, blank=True, default='defaults/default_ferramenta.png')
+    foto_variantes = models.BooleanField(default=False, editable=False) # Miniatura/média da foto já geradas (ver imagens.py)
     data_aquisicao = models.DateField(blank=True, null=True)
     
     class EstadoChoices(models.TextChoices):
@@ -153,9 +282,164 @@ class Ferramenta(models.Model):
         
     # O estado é gerenciado automaticamente pelas transações (Empréstimo/Manutenção)
     estado = models.CharField(max_length=20, choices=EstadoChoices.choices, default=EstadoChoices.DISPONIVEL)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
     
+    class Meta:
+        indexes = [
+            indice_busca('nome', 'ferramenta_nome_busca'),
+            indice_busca('numero_serie', 'ferramenta_serie_busca'),
+            indice_busca('descricao', 'ferramenta_descricao_busca'),
+        ]
+
+    # (deposito_id, estado) gravados no banco, usados para manter o ContadorEstoque.
+    # None = ferramenta ainda não salva.
+    _contagem_original = None
+
     def __str__(self): return f"{self.nome} ({self.numero_serie})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._contagem_original = (instance.__dict__.get('deposito_id'), instance.__dict__.get('estado'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Salva a ferramenta e, na mesma transação, move uma unidade no ContadorEstoque
+        do (depósito, estado) anterior para o atual.
+        Se uma foto nova foi enviada, as variantes (miniatura/média) são geradas após o commit.
+        """
+        update_fields = kwargs.get('update_fields')
+        altera_contagem = update_fields is None or {'estado', 'deposito', 'deposito_id'} & set(update_fields)
+        if update_fields is not None:
+            # auto_now só é gravado se estiver na lista (ex: FerramentaSerializer.update)
+            kwargs['update_fields'] = {*update_fields, 'atualizado_em'}
+        foto_nova = foto_enviada(self.foto)
+        if foto_nova:
+            self.foto_variantes = False # Até as variantes serem geradas, as listagens usam a foto original
+            if update_fields is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'foto_variantes'}
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if altera_contagem:
+                atual = (self.deposito_id, self.estado)
+                ContadorEstoque.registrar_movimento(self._contagem_original, atual)
+                if atual != self._contagem_original:
+                    publicar_estado_ferramentas([(self.pk, self.deposito_id)], self.estado)
+                self._contagem_original = atual
+        if foto_nova:
+            gerar_variantes_ao_salvar(self.foto)
+
+    def transicionar(self, estado_origem, estado_destino):
+        """
+        Muda o estado com um UPDATE condicional (... WHERE estado = origem) que grava só a coluna 'estado'.
+        É a trava contra concorrência: se dois balcões tentarem emprestar a mesma ferramenta
+        ao mesmo tempo, só um UPDATE encontra a linha ainda DISPONIVEL.
+        Retorna False se a ferramenta não estava mais no estado de origem.
+        """
+        with transaction.atomic():
+            atualizadas = Ferramenta.objects.filter(pk=self.pk, estado=estado_origem).update(estado=estado_destino, atualizado_em=Now())
+            if not atualizadas:
+                return False
+            ContadorEstoque.registrar_movimento((self.deposito_id, estado_origem), (self.deposito_id, estado_destino))
+            VersaoTabela.registrar_alteracao('ferramenta', depositos=[self.deposito_id]) # UPDATE direto: não passa pelos sinais de save
+            publicar_estado_ferramentas([(self.pk, self.deposito_id)], estado_destino)
+        self.estado = estado_destino
+        self._contagem_original = (self.deposito_id, estado_destino)
+        return True
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            ContadorEstoque.registrar_movimento(self._contagem_original, None)
+            self._contagem_original = None
+        return resultado
+
+
+class ContadorEstoque(models.Model):
+    """
+    Quantidade de ferramentas por (depósito, estado), mantida incrementalmente.
+    Evita varrer a tabela de ferramentas para montar totais (ex: Dashboard):
+    a filial é obtida pelo depósito, então a leitura custa O(depósitos) linhas.
+    """
+    deposito = models.ForeignKey(Deposito, on_delete=models.CASCADE, related_name='contadores')
+    estado = models.CharField(max_length=20, choices=Ferramenta.EstadoChoices.choices)
+    quantidade = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['deposito', 'estado'], name='unique_contador_por_deposito_estado')
+        ]
+
+    def __str__(self):
+        return f"{self.deposito_id} / {self.estado}: {self.quantidade}"
+
+    @classmethod
+    def ajustar(cls, deposito_id, estado, delta):
+        """ Soma 'delta' ao contador de forma atômica no banco (UPDATE ... SET quantidade = quantidade + delta) """
+        atualizados = cls.objects.filter(deposito_id=deposito_id, estado=estado).update(quantidade=F('quantidade') + delta)
+        if not atualizados:
+            # Primeira ferramenta deste (depósito, estado): cria a linha
+            contador, criado = cls.objects.get_or_create(deposito_id=deposito_id, estado=estado, defaults={'quantidade': delta})
+            if not criado:
+                # Outra transação criou a linha entre o UPDATE e o INSERT
+                cls.objects.filter(pk=contador.pk).update(quantidade=F('quantidade') + delta)
+
+    @classmethod
+    def registrar_movimento(cls, anterior, atual):
+        """
+        Registra a saída de uma ferramenta de 'anterior' e a entrada em 'atual'.
+        Ambos são tuplas (deposito_id, estado) ou None (ferramenta criada/excluída).
+        """
+        if anterior == atual:
+            return
+        if anterior is not None:
+            cls.ajustar(anterior[0], anterior[1], -1)
+        if atual is not None:
+            cls.ajustar(atual[0], atual[1], 1)
+        if anterior is not None and atual is not None:
+            registrar_transicao(anterior[1], atual[1])
+
+    @classmethod
+    def registrar_transicao_em_massa(cls, ferramentas, estado_origem, estado_destino):
+        """
+        Versão em lote do registrar_movimento para operações que mudam o estado de várias
+        ferramentas com um único UPDATE: ajusta cada depósito uma vez só.
+        """
+        por_deposito = {}
+        for ferramenta in ferramentas:
+            por_deposito[ferramenta.deposito_id] = por_deposito.get(ferramenta.deposito_id, 0) + 1
+        for deposito_id, quantidade in por_deposito.items():
+            cls.ajustar(deposito_id, estado_origem, -quantidade)
+            cls.ajustar(deposito_id, estado_destino, quantidade)
+        registrar_transicao(estado_origem, estado_destino, len(ferramentas))
+
+    @classmethod
+    def contagem_real(cls, depositos=None):
+        """ Contagem calculada direto da tabela de ferramentas: {(deposito_id, estado): quantidade} """
+        ferramentas = Ferramenta.objects.all()
+        if depositos is not None:
+            ferramentas = ferramentas.filter(deposito__in=depositos)
+        linhas = ferramentas.values('deposito_id', 'estado').annotate(quantidade=Count('id')).order_by()
+        return {(l['deposito_id'], l['estado']): l['quantidade'] for l in linhas}
+
+    @classmethod
+    def recalcular(cls, depositos=None):
+        """
+        Reconstrói os contadores a partir da tabela de ferramentas.
+        Usado após atualizações em massa (QuerySet.update) que não passam pelo save().
+        """
+        with transaction.atomic():
+            contadores = cls.objects.all()
+            if depositos is not None:
+                contadores = contadores.filter(deposito__in=depositos)
+            contadores.delete()
+            cls.objects.bulk_create([
+                cls(deposito_id=deposito_id, estado=estado, quantidade=quantidade)
+                for (deposito_id, estado), quantidade in cls.contagem_real(depositos).items()
+            ])
+
 class Funcionario(models.Model):
     """ Colaborador que pode retirar ferramentas """
     # Um funcionário pode atuar em múltiplas filiais (Many-to-Many)
@@ -169,9 +453,17 @@ class Funcionario(models.Model):
     setor = models.ForeignKey(Setor, on_delete=models.SET_NULL, null=True, blank=True)
     cargo = models.ForeignKey(Cargo, on_delete=models.SET_NULL, null=True, blank=True)
     
-    foto = models.ImageField(upload_to=upload_path_funcionario, blank=True, default='defaults/default_avatar.png')
+    foto = models.ImageField(upload_to=upload_path_funcionario, storage=armazenamento_fotos, blank=True, default='defaults/default_avatar.png')
+    foto_variantes = models.BooleanField(default=False, editable=False) # Miniatura/média da foto já geradas (ver imagens.py)
     ativo = models.BooleanField(default=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
     
+    class Meta:
+        indexes = [
+            indice_busca('nome', 'funcionario_nome_busca'),
+            indice_busca('matricula', 'funcionario_matricula_busca'),
+        ]
+
     def __str__(self): return self.nome
     
     def clean(self):
@@ -186,7 +478,14 @@ class Funcionario(models.Model):
     
     def save(self, *args, **kwargs):
         self.full_clean() # Força a execução da validação clean() antes de salvar
+        foto_nova = foto_enviada(self.foto)
+        if foto_nova:
+            self.foto_variantes = False # Até as variantes serem geradas, as listagens usam a foto original
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'foto_variantes'}
         super().save(*args, **kwargs)
+        if foto_nova:
+            gerar_variantes_ao_salvar(self.foto) # Miniatura/média da foto nova, após o commit
 
 
 # --- TRANSAÇÕES (O CORAÇÃO DO SISTEMA) ---
@@ -206,6 +505,7 @@ class Emprestimo(models.Model):
     
     # Controle de Estado do Empréstimo (True = Em andamento / False = Finalizado)
     ativo = models.BooleanField(default=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
     
     # --- SNAPSHOT DE HISTÓRICO ---
     # Estes campos guardam os dados de texto no momento da devolução.
@@ -215,18 +515,41 @@ class Emprestimo(models.Model):
     nome_funcionario_historico = models.CharField(max_length=100, blank=True, null=True)
     matricula_funcionario_historico = models.CharField(max_length=50, blank=True, null=True)
     
+    class Meta:
+        indexes = [
+            indice_busca('nome', 'emprestimo_nome_busca'),
+            indice_busca('observacoes', 'emprestimo_obs_busca'),
+            indice_busca('nome_ferramenta_historico', 'emprestimo_ferr_hist_busca'),
+            indice_busca('numero_serie_ferramenta_historico', 'emprestimo_serie_hist_busca'),
+            indice_busca('nome_funcionario_historico', 'emprestimo_func_hist_busca'),
+            indice_busca('matricula_funcionario_historico', 'emprestimo_matr_hist_busca'),
+        ]
+        constraints = [
+            # REGRA: No máximo um empréstimo ativo por ferramenta
+            models.UniqueConstraint(fields=['ferramenta'], condition=models.Q(ativo=True), name='um_emprestimo_ativo_por_ferramenta')
+        ]
+
+    # Depósito da ferramenta desvinculada na finalização: o sinal de versão (versoes.py)
+    # registra a saída na filial dela, já que depois do save o registro não tem mais ferramenta
+    _deposito_da_saida = None
+
     def __str__(self):
         return self.nome or f"Empréstimo {self.id}"
     
     def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self._salvar(*args, **kwargs)
+
+    def _salvar(self, *args, **kwargs):
         is_new = self.pk is None
+        self._deposito_da_saida = None
         
         # REGRA DE NEGÓCIO: Início de Empréstimo
-        # Ao criar, muda o estado da ferramenta automaticamente.
+        # Ao criar, muda o estado da ferramenta automaticamente (só se ela ainda estiver DISPONIVEL).
         if is_new and self.ativo: 
             if self.ferramenta:
-                self.ferramenta.estado = Ferramenta.EstadoChoices.EMPRESTADA
-                self.ferramenta.save()
+                if not self.ferramenta.transicionar(Ferramenta.EstadoChoices.DISPONIVEL, Ferramenta.EstadoChoices.EMPRESTADA):
+                    raise ValidationError({'ferramenta': f"A ferramenta '{self.ferramenta.nome}' não está mais disponível."})
         
         # REGRA DE NEGÓCIO: Devolução / Finalização
         # Ao desativar o empréstimo:
@@ -234,6 +557,12 @@ class Emprestimo(models.Model):
         # 2. Libera a ferramenta (Estado = Disponível).
         # 3. Quebra os vínculos de chave estrangeira.
         if not self.ativo:
+            # REGRA: Finaliza uma vez só. O registro é reivindicado (UPDATE ... WHERE ativo) antes de tocar
+            # na ferramenta: uma cópia velha de um empréstimo já devolvido não libera a ferramenta, que pode
+            # estar em outro empréstimo. Mesma ordem de travas do devolver_lote (empréstimo, depois ferramenta).
+            if not is_new and self.ferramenta_id:
+                if not Emprestimo.objects.filter(pk=self.pk, ativo=True).update(ativo=False):
+                    raise ValidationError({'ativo': "O empréstimo já está finalizado."})
             if self.ferramenta:
                 self.nome_ferramenta_historico = self.ferramenta.nome
                 self.numero_serie_ferramenta_historico = self.ferramenta.numero_serie
@@ -243,29 +572,46 @@ class Emprestimo(models.Model):
             
             # Libera a ferramenta
             if self.ferramenta:
-                self.ferramenta.estado = Ferramenta.EstadoChoices.DISPONIVEL
-                self.ferramenta.save()
+                self.ferramenta.transicionar(Ferramenta.EstadoChoices.EMPRESTADA, Ferramenta.EstadoChoices.DISPONIVEL)
+                # Sem ferramenta, o empréstimo sai da listagem do coordenador da filial
+                if not is_new:
+                    Remocao.registrar_saida_por_ferramenta('emprestimo', {self.pk: self.ferramenta_id})
             
             # Anula relacionamentos
+            if self.ferramenta:
+                self._deposito_da_saida = self.ferramenta.deposito_id
             self.ferramenta = None
             self.funcionario = None
         
+        # Gera nome automático: com o id reservado antes, o registro já nasce com o nome (um INSERT só)
+        nomeado = is_new and self._nomear_antes_de_inserir()
+        if nomeado:
+            kwargs['force_insert'] = True
+
         super().save(*args, **kwargs)
 
-        # Gera nome automático após salvar (para ter o ID)
-        if is_new:
+        # Bancos sem sequência: nome gravado após salvar (para ter o ID)
+        if is_new and not nomeado:
             self.nome = f"Empréstimo {self.id}"
             super().save(update_fields=['nome'])
 
+    def _nomear_antes_de_inserir(self):
+        ids = reservar_ids(Emprestimo)
+        if ids is None:
+            return False
+        self.pk = ids[0]
+        self.nome = f"Empréstimo {self.pk}"
+        return True
+
     def delete(self, *args, **kwargs):
         """ 
         Segurança: Se um empréstimo for deletado (hard delete) enquanto ativo,
         garante que a ferramenta volte a ficar disponível para não travar o sistema.
         """
-        if self.ferramenta and self.ferramenta.estado == Ferramenta.EstadoChoices.EMPRESTADA:
-            self.ferramenta.estado = Ferramenta.EstadoChoices.DISPONIVEL
-            self.ferramenta.save()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            if self.ferramenta:
+                self.ferramenta.transicionar(Ferramenta.EstadoChoices.EMPRESTADA, Ferramenta.EstadoChoices.DISPONIVEL)
+            return super().delete(*args, **kwargs)
 
 class Manutencao(models.Model):
     """ Registra a saída de uma ferramenta para conserto """
@@ -280,46 +626,282 @@ class Manutencao(models.Model):
     data_inicio = models.DateField(default=datetime.date.today)
     data_fim = models.DateField(null=True, blank=True)
     ativo = models.BooleanField(default=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
     
     # Snapshot de Histórico
     nome_ferramenta_historico = models.CharField(max_length=255, blank=True, null=True)
     numero_serie_ferramenta_historico = models.CharField(max_length=50, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            indice_busca('nome', 'manutencao_nome_busca'),
+            indice_busca('observacoes', 'manutencao_obs_busca'),
+            indice_busca('nome_ferramenta_historico', 'manutencao_ferr_hist_busca'),
+            indice_busca('numero_serie_ferramenta_historico', 'manutencao_serie_hist_busca'),
+        ]
+        constraints = [
+            # REGRA: No máximo uma manutenção ativa por ferramenta
+            models.UniqueConstraint(fields=['ferramenta'], condition=models.Q(ativo=True), name='uma_manutencao_ativa_por_ferramenta')
+        ]
+
+    _deposito_da_saida = None # Ver Emprestimo._deposito_da_saida
+
     def __str__(self):
         return self.nome or f"Manutenção {self.id}"
     
     def save(self, *args, **kwargs):
+        with transaction.atomic():
+            self._salvar(*args, **kwargs)
+
+    def _salvar(self, *args, **kwargs):
         is_new = self.pk is None
+        self._deposito_da_saida = None
         
-        # REGRA: Ao iniciar manutenção, ferramenta fica indisponível
+        # REGRA: Ao iniciar manutenção, ferramenta fica indisponível (só se ainda estiver DISPONIVEL)
         if is_new and self.ativo:
             if self.ferramenta:
-                self.ferramenta.estado = Ferramenta.EstadoChoices.EM_MANUTENCAO
-                self.ferramenta.save()
+                if not self.ferramenta.transicionar(Ferramenta.EstadoChoices.DISPONIVEL, Ferramenta.EstadoChoices.EM_MANUTENCAO):
+                    raise ValidationError({'ferramenta': f"A ferramenta '{self.ferramenta.nome}' não está mais disponível."})
 
         # REGRA: Ao finalizar manutenção
         if not self.ativo:
+            # Reivindica o registro antes de liberar a ferramenta (ver Emprestimo._salvar)
+            if not is_new and self.ferramenta_id:
+                if not Manutencao.objects.filter(pk=self.pk, ativo=True).update(ativo=False):
+                    raise ValidationError({'ativo': "A manutenção já está finalizada."})
             if self.ferramenta:
                 # Salva histórico
                 self.nome_ferramenta_historico = self.ferramenta.nome
                 self.numero_serie_ferramenta_historico = self.ferramenta.numero_serie
                 
                 # Libera ferramenta
-                self.ferramenta.estado = Ferramenta.EstadoChoices.DISPONIVEL
-                self.ferramenta.save()
+                self.ferramenta.transicionar(Ferramenta.EstadoChoices.EM_MANUTENCAO, Ferramenta.EstadoChoices.DISPONIVEL)
+                if not is_new:
+                    Remocao.registrar_saida_por_ferramenta('manutencao', {self.pk: self.ferramenta_id})
                 
                 # Desvincula
+                self._deposito_da_saida = self.ferramenta.deposito_id
                 self.ferramenta = None
         
+        # Nome automático antes do INSERT (ver Emprestimo._nomear_antes_de_inserir)
+        nomeado = is_new and self._nomear_antes_de_inserir()
+        if nomeado:
+            kwargs['force_insert'] = True
+
         super().save(*args, **kwargs)
 
-        if is_new:
+        if is_new and not nomeado:
             self.nome = f"Manutenção {self.id}"
             super().save(update_fields=['nome'])
 
+    def _nomear_antes_de_inserir(self):
+        ids = reservar_ids(Manutencao)
+        if ids is None:
+            return False
+        self.pk = ids[0]
+        self.nome = f"Manutenção {self.pk}"
+        return True
+
     def delete(self, *args, **kwargs):
         # Segurança: Libera ferramenta se deletar manutenção ativa
-        if self.ferramenta and self.ferramenta.estado == Ferramenta.EstadoChoices.EM_MANUTENCAO:
-            self.ferramenta.estado = Ferramenta.EstadoChoices.DISPONIVEL
-            self.ferramenta.save()
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        with transaction.atomic():
+            if self.ferramenta:
+                self.ferramenta.transicionar(Ferramenta.EstadoChoices.EM_MANUTENCAO, Ferramenta.EstadoChoices.DISPONIVEL)
+            return super().delete(*args, **kwargs)
+
+# --- VERSÕES DOS DADOS (ETAG) ---
+
+class VersaoTabela(models.Model):
+    """
+    Contador de alterações por tabela (e por filial, nas tabelas com escopo de filial).
+    Incrementado a cada escrita (ver versoes.py), é a base das ETags das listagens e detalhes:
+    se nenhuma versão usada por uma resposta mudou, o cliente recebe 304 sem a consulta principal.
+    """
+    # Tabelas cujas linhas pertencem a uma filial (o que o coordenador enxerga depende dela)
+    TABELAS_POR_FILIAL = {'ferramenta', 'deposito', 'emprestimo', 'manutencao', 'funcionario'}
+
+    # Valores especiais de filial_id
+    GLOBAL = 0 # Tabelas sem filial; nas por filial, alterações que só Admin/Máximo enxergam
+    TODAS_AS_FILIAIS = -1 # Alteração sem filial conhecida: vale para todos os coordenadores
+
+    tabela = models.CharField(max_length=30)
+    filial_id = models.IntegerField(default=GLOBAL)
+    versao = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tabela', 'filial_id'], name='unique_versao_por_tabela_filial')
+        ]
+
+    def __str__(self):
+        return f"{self.tabela} / {self.filial_id}: {self.versao}"
+
+    @classmethod
+    def registrar_alteracao(cls, tabelas, filiais=None, depositos=None):
+        """
+        Registra uma alteração em 'tabelas' (um nome, ou vários alterados juntos, ex: empréstimos e ferramentas de um lote).
+        'filiais' / 'depositos': ids afetados. Sem nenhum dos dois, a alteração vale para todas as filiais.
+        A filial dos depósitos é lida aqui, dentro da transação da escrita; o incremento das versões
+        fica para depois do commit (não segura lock nas linhas de versão), num UPDATE só.
+        """
+        if isinstance(tabelas, str):
+            tabelas = [tabelas]
+        afetadas = None
+        if filiais is not None or depositos is not None:
+            afetadas = set(filiais or ())
+            depositos = set(depositos or ()) - {None}
+            if depositos and cls.TABELAS_POR_FILIAL.intersection(tabelas):
+                afetadas |= set(Deposito.objects.filter(id__in=depositos).values_list('filial_id', flat=True))
+        chaves = {(tabela, filial_id) for tabela in tabelas for filial_id in cls._filiais_alteradas(tabela, afetadas)}
+        # robust: a escrita já foi confirmada; se o incremento falhar, vai para o log em vez de virar um erro 500
+        transaction.on_commit(lambda: cls._incrementar(chaves), robust=True)
+
+    @classmethod
+    def _filiais_alteradas(cls, tabela, filiais):
+        """
+        filial_id das linhas de versão que uma alteração em 'tabela' incrementa ('filiais': None = todas).
+        Nas tabelas por filial a linha GLOBAL não é tocada (a não ser nas alterações que só Admin/Máximo
+        enxergam): escritas em filiais diferentes não disputam a mesma linha. A versão vista por
+        Admin/Máximo é a soma das linhas da tabela (ver _consulta_versoes).
+        """
+        if tabela not in cls.TABELAS_POR_FILIAL:
+            return {cls.GLOBAL}
+        if filiais is None:
+            return {cls.TODAS_AS_FILIAIS}
+        return filiais or {cls.GLOBAL}
+
+    @classmethod
+    def _incrementar(cls, chaves):
+        alteradas = Q()
+        for tabela, filial_id in chaves:
+            alteradas |= Q(tabela=tabela, filial_id=filial_id)
+        if cls.objects.filter(alteradas).update(versao=F('versao') + 1) < len(chaves):
+            # Primeira alteração de alguma (tabela, filial): cria as linhas que faltam e repete o incremento
+            # (as que já existiam sobem 2; a ETag só precisa mudar)
+            cls.objects.bulk_create([cls(tabela=tabela, filial_id=filial_id) for tabela, filial_id in chaves], ignore_conflicts=True)
+            cls.objects.filter(alteradas).update(versao=F('versao') + 1)
+        # Listagens de referência em cache (filiais, depósitos...) guardadas sob as mesmas chaves,
+        # mais a GLOBAL de cada tabela (a das listagens de Admin/Máximo)
+        for tabela in {tabela for tabela, _ in chaves}:
+            invalidar_cache_referencias(tabela, {filial_id for outra, filial_id in chaves if outra == tabela} | {cls.GLOBAL})
+
+    @classmethod
+    def versoes(cls, tabelas, filial_ids=None):
+        """
+        Versões que uma resposta usa, em uma consulta: {(tabela, filial_id): versao}.
+        filial_ids=None (Admin/Máximo): só as versões globais.
+        Coordenador: nas tabelas por filial, as versões das suas filiais e a de TODAS_AS_FILIAIS.
+        """
+        chaves, consulta = cls._consulta_versoes(tabelas, filial_ids)
+        return cls._completar(chaves, consulta)
+
+    @classmethod
+    async def aversoes(cls, tabelas, filial_ids=None):
+        """ Versão assíncrona de versoes() (usada pelas views de views_async.py) """
+        chaves, consulta = cls._consulta_versoes(tabelas, filial_ids)
+        return cls._completar(chaves, [linha async for linha in consulta])
+
+    @classmethod
+    def chaves_versoes(cls, tabelas, filial_ids=None):
+        """ Chaves (tabela, filial_id) que valem para quem vê 'filial_ids' (None = todas as filiais) """
+        chaves = set()
+        for tabela in tabelas:
+            if filial_ids is None or tabela not in cls.TABELAS_POR_FILIAL:
+                chaves.add((tabela, cls.GLOBAL))
+            else:
+                chaves.add((tabela, cls.TODAS_AS_FILIAIS))
+                chaves.update((tabela, filial_id) for filial_id in filial_ids)
+        return chaves
+
+    @classmethod
+    def _consulta_versoes(cls, tabelas, filial_ids):
+        chaves = cls.chaves_versoes(tabelas, filial_ids)
+        if filial_ids is None:
+            # Admin/Máximo: soma das linhas de cada tabela (qualquer incremento, em qualquer filial, muda a soma)
+            consulta = (
+                cls.objects.filter(tabela__in={tabela for tabela, _ in chaves}).values('tabela').order_by()
+                .annotate(filial=Value(cls.GLOBAL, output_field=models.IntegerField()), total=Sum('versao'))
+                .values_list('tabela', 'filial', 'total')
+            )
+        else:
+            consulta = cls.objects.filter(
+                tabela__in={tabela for tabela, _ in chaves}, filial_id__in={filial_id for _, filial_id in chaves}
+            ).values_list('tabela', 'filial_id', 'versao')
+        return chaves, consulta
+
+    @staticmethod
+    def _completar(chaves, linhas):
+        # Tabela/filial sem linha ainda = nunca alterada (versão 0)
+        encontradas = {(tabela, filial_id): versao for tabela, filial_id, versao in linhas}
+        return {chave: encontradas.get(chave, 0) for chave in chaves}
+
+
+# --- SINCRONIZAÇÃO INCREMENTAL ---
+
+class Remocao(models.Model):
+    """
+    "Lápide" de um registro que saiu da listagem de uma filial: apagado (hard delete) ou fora
+    do escopo dela (ferramenta transferida, empréstimo/manutenção finalizado, funcionário desvinculado).
+    A sincronização incremental (sincronizacao.py) informa esses ids para o cliente descartar.
+    """
+    tabela = models.CharField(max_length=30)
+    objeto_id = models.BigIntegerField()
+    # Filial de onde o registro saiu. None: registro sem filial (só Admin/Máximo o viam)
+    filial_id = models.IntegerField(null=True, blank=True)
+    removido_em = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tabela', 'removido_em'], name='remocao_tabela_data'),
+        ]
+
+    def __str__(self):
+        return f"{self.tabela} {self.objeto_id} (filial {self.filial_id})"
+
+    @classmethod
+    def registrar(cls, tabela, pares):
+        """ Uma lápide por (objeto_id, filial_id) """
+        cls.objects.bulk_create([cls(tabela=tabela, objeto_id=objeto_id, filial_id=filial_id) for objeto_id, filial_id in pares])
+
+    @classmethod
+    def registrar_saida_por_ferramenta(cls, tabela, ferramenta_por_objeto):
+        """
+        Empréstimos/manutenções ({id: ferramenta_id}) que perdem a ferramenta (finalização):
+        saem da listagem do coordenador da filial dessa ferramenta.
+        """
+        filiais = cls.filiais_das_ferramentas(ferramenta_por_objeto.values())
+        cls.registrar(tabela, [
+            (objeto_id, filiais.get(ferramenta_id)) for objeto_id, ferramenta_id in ferramenta_por_objeto.items()
+        ])
+
+    @staticmethod
+    def filiais_das_ferramentas(ferramenta_ids):
+        """ {ferramenta_id: filial_id}, em uma consulta """
+        return dict(
+            Ferramenta.objects.filter(id__in=set(ferramenta_ids) - {None}).values_list('id', 'deposito__filial_id')
+        )
+
+
+# --- EVENTOS EM TEMPO REAL ---
+
+def publicar_estado_ferramentas(ferramentas, estado):
+    """
+    Agenda para depois do commit o aviso às conexões de /api/eventos/ (ver eventos.py)
+    de que as ferramentas, pares (ferramenta_id, deposito_id), passaram para 'estado'.
+    Um evento por depósito, com a filial dele (filtro do coordenador).
+    """
+    por_deposito = {}
+    for ferramenta_id, deposito_id in ferramentas:
+        por_deposito.setdefault(deposito_id, []).append(ferramenta_id)
+    if por_deposito:
+        # robust: falha ao publicar não desfaz nem derruba a escrita, que já foi gravada
+        transaction.on_commit(lambda: _publicar_estado(por_deposito, estado), robust=True)
+
+def _publicar_estado(por_deposito, estado):
+    filiais = dict(Deposito.objects.filter(id__in=por_deposito).values_list('id', 'filial_id'))
+    broker = obter_broker()
+    for deposito_id, ferramenta_ids in por_deposito.items():
+        broker.publicar({
+            'tipo': 'estado_ferramenta', 'estado': estado, 'ferramentas': sorted(ferramenta_ids),
+            'deposito_id': deposito_id, 'filial_id': filiais.get(deposito_id),
+        })
@@ -1,13 +1,178 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class PaginacaoSobDemanda(PageNumberPagination):
+    """
+    Três modos, escolhidos pelos parâmetros da URL:
+    - ?page=N   -> paginação por número de página (OFFSET + COUNT), usada pelo frontend.
+    - ?cursor=  -> paginação por cursor (keyset): sem OFFSET e sem COUNT, custo constante em qualquer página.
+    - nenhum    -> lista sem paginação, limitada a 'max_sem_paginacao' itens.
+    """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+    cursor_query_param = 'cursor'
+
+    # Teto de segurança para listas sem paginação (ex: dropdowns que carregam tudo)
+    max_sem_paginacao = 5000
+
     def paginate_queryset(self, queryset, request, view=None):
-        # A MÁGICA: Se não tiver o parâmetro 'page' na URL, desativa a paginação!
+        self.request = request
+
+        if self.cursor_query_param in request.query_params:
+            self.modo = 'cursor'
+            return self._paginar_por_cursor(queryset, request)
+
+        # A MÁGICA: Se não tiver o parâmetro 'page' na URL, desativa a paginação (até o teto)!
         if 'page' not in request.query_params:
+            self.modo = 'sem_paginacao'
+            return self._cortar_sem_paginacao(list(queryset[:self.max_sem_paginacao + 1]))
+
+        self.modo = 'pagina'
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Versão assíncrona de paginate_queryset (views de views_async.py):
+        mesmos três modos e mesmas respostas, com as consultas feitas pelo ORM assíncrono.
+        """
+        self.request = request
+
+        if self.cursor_query_param in request.query_params:
+            self.modo = 'cursor'
+            consulta, ordenacao, page_size = self._consulta_cursor(queryset, request)
+            return self._pagina_do_cursor([item async for item in consulta], ordenacao, page_size, request)
+
+        if 'page' not in request.query_params:
+            self.modo = 'sem_paginacao'
+            return self._cortar_sem_paginacao([item async for item in queryset[:self.max_sem_paginacao + 1]])
+
+        self.modo = 'pagina'
+        page_size = self.get_page_size(request)
+        if not page_size:
             return None
-        
-        return super().paginate_queryset(queryset, request, view)
\ No newline at end of file
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # 'count' é cached_property: preenchido aqui, o Paginator não faz o COUNT síncrono
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [item async for item in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+    def _cortar_sem_paginacao(self, itens):
+        self.truncado = len(itens) > self.max_sem_paginacao
+        return itens[:self.max_sem_paginacao]
+
+    def get_paginated_response(self, data):
+        if self.modo == 'cursor':
+            return Response({'next': self.proximo_link, 'results': data})
+
+        if self.modo == 'sem_paginacao':
+            # Mantém o formato de lista simples; o corte é sinalizado por cabeçalho
+            headers = {'X-Resultado-Truncado': 'true', 'X-Limite-Resultados': str(self.max_sem_paginacao)} if self.truncado else None
+            return Response(data, headers=headers)
+
+        return super().get_paginated_response(data)
+
+    # --- PAGINAÇÃO POR CURSOR (KEYSET) ---
+
+    def _ordenacao(self, queryset):
+        """
+        Ordenação da viewset (ex: 'nome', '-data_emprestimo') + 'id' como desempate estável.
+        Os campos de ordenação não podem ser nulos.
+        """
+        ordenacao = [campo for campo in queryset.query.order_by if campo.lstrip('-') not in ('id', 'pk')]
+        decrescente = bool(ordenacao) and ordenacao[-1].startswith('-')
+        return ordenacao + ['-id' if decrescente else 'id']
+
+    def _paginar_por_cursor(self, queryset, request):
+        consulta, ordenacao, page_size = self._consulta_cursor(queryset, request)
+        return self._pagina_do_cursor(list(consulta), ordenacao, page_size, request)
+
+    def _consulta_cursor(self, queryset, request):
+        ordenacao = self._ordenacao(queryset)
+        queryset = queryset.order_by(*ordenacao)
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._filtro_apos(ordenacao, self._decodificar_cursor(cursor, queryset.model, ordenacao)))
+
+        # Busca um item a mais só para saber se existe próxima página
+        return queryset[:page_size + 1], ordenacao, page_size
+
+    def _pagina_do_cursor(self, itens, ordenacao, page_size, request):
+        pagina = itens[:page_size]
+
+        self.proximo_link = None
+        if len(itens) > page_size:
+            ultimo = pagina[-1]
+            valores = [getattr(ultimo, campo.lstrip('-')) for campo in ordenacao]
+            self.proximo_link = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param, self._codificar_cursor(valores)
+            )
+        return pagina
+
+    def _filtro_apos(self, ordenacao, valores):
+        """
+        Monta a condição "depois da última linha vista" para ordenações mistas:
+        (a > va) OR (a = va AND b > vb) OR (a = va AND b = vb AND id > vid) ...
+        """
+        condicao = Q()
+        iguais = Q()
+        for campo, valor in zip(ordenacao, valores):
+            nome = campo.lstrip('-')
+            operador = 'lt' if campo.startswith('-') else 'gt'
+            condicao |= iguais & Q(**{f'{nome}__{operador}': valor})
+            iguais &= Q(**{nome: valor})
+        return condicao
+
+    def _codificar_cursor(self, valores):
+        texto = json.dumps(valores, cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(texto.encode()).decode()
+
+    def _decodificar_cursor(self, cursor, model, ordenacao):
+        """
+        Valores do cursor convertidos pelo campo de cada ordenação (to_python): o cursor vem do
+        cliente e um valor de tipo errado viraria erro 500 no filtro, em vez de 'Cursor inválido.'
+        """
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (ValueError, TypeError):
+            raise NotFound('Cursor inválido.')
+        if not isinstance(valores, list) or len(valores) != len(ordenacao):
+            raise NotFound('Cursor inválido.')
+        try:
+            valores = [_campo_da_ordenacao(model, campo).to_python(valor) for campo, valor in zip(ordenacao, valores)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound('Cursor inválido.')
+        # Os campos de ordenação não são nulos: None não tem posição na ordem (e o filtro não o aceita)
+        if any(valor is None for valor in valores):
+            raise NotFound('Cursor inválido.')
+        return valores
+
+
+def _campo_da_ordenacao(model, caminho):
+    """ Campo do model para um item da ordenação (ex: '-data_emprestimo', 'deposito__nome') """
+    campo = None
+    for parte in caminho.lstrip('-').split('__'):
+        campo = model._meta.get_field('id' if parte == 'pk' else parte)
+        model = campo.related_model
+    return campo
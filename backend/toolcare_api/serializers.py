@@ -3,6 +3,10 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework.validators import UniqueValidator
 from .models import Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao
 from rest_framework.exceptions import AuthenticationFailed
+from django.core.exceptions import ValidationError as DjangoValidationError
+from .escopo import obter_escopo
+from .autenticacao import CLAIM_FILIAIS, CLAIM_VERSAO
+from .imagens import url_variante
 import datetime
 
 # --- SERIALIZERS DE ESTRUTURA ---
@@ -37,6 +41,7 @@ class UsuarioSerializer(serializers.ModelSerializer):
     class Meta:
         model = Usuario
         fields = ['id', 'nome', 'cpf', 'tipo', 'filiais', 'filiais_detalhes', 'ativo', 'password']
+        prefetch_related = ['filiais'] # Carregamento antecipado (ver CarregamentoAntecipadoMixin)
         extra_kwargs = {
             'password': {'write_only': True} # Senha nunca é retornada na API, apenas enviada
         }
@@ -104,7 +109,7 @@ class UsuarioSerializer(serializers.ModelSerializer):
             user.set_password(password) # Garante re-hash da senha se alterada
             user.save()
         if filiais_data is not None:
-            user.filiais.set(filiais_data)
+            user.filiais.set(filiais_data) # Se mudarem, os tokens emitidos deixam de valer (ver Usuario)
         return user
 
 
@@ -113,6 +118,7 @@ class DepositoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Deposito
         fields = ['id', 'nome', 'filial', 'filial_nome', 'ativo']
+        select_related = ['filial']
         read_only_fields = ['id']
         
     def __init__(self, *args, **kwargs):
@@ -166,7 +172,23 @@ class CargoSerializer(serializers.ModelSerializer):
 
 # --- FUNCIONÁRIOS E FERRAMENTAS ---
 
-class FuncionarioSerializer(serializers.ModelSerializer):
+class VariantesFotoMixin(serializers.Serializer):
+    """
+    URLs das versões reduzidas da foto (ver imagens.py): 'foto_miniatura' para listagens e
+    'foto_media' para telas de detalhe. Enquanto as variantes não forem geradas (foto_variantes), apontam para a foto original.
+    """
+    foto_miniatura = serializers.SerializerMethodField(); foto_media = serializers.SerializerMethodField()
+
+    def get_foto_miniatura(self, obj): return self._url_variante(obj, 'miniatura')
+    def get_foto_media(self, obj): return self._url_variante(obj, 'media')
+
+    def _url_variante(self, obj, variante):
+        url = url_variante(obj.foto, variante, obj.foto_variantes)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request else url
+
+
+class FuncionarioSerializer(VariantesFotoMixin, serializers.ModelSerializer):
     # Campos de leitura (detalhes expandidos)
     filiais_detalhes = FilialSerializer(source='filiais', many=True, read_only=True)
     setor_nome = serializers.CharField(source='setor.nome_setor', read_only=True)
@@ -177,8 +199,10 @@ class FuncionarioSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Funcionario
-        fields = ['id', 'nome', 'matricula', 'cpf', 'setor', 'setor_nome', 'cargo', 'cargo_nome', 'foto', 'ativo', 'filiais', 'filiais_detalhes']
+        fields = ['id', 'nome', 'matricula', 'cpf', 'setor', 'setor_nome', 'cargo', 'cargo_nome', 'foto', 'foto_miniatura', 'foto_media', 'ativo', 'filiais', 'filiais_detalhes']
         read_only_fields = ['id', 'setor_nome', 'cargo_nome']
+        select_related = ['setor', 'cargo']
+        prefetch_related = ['filiais']
     
     def validate_cpf(self, value):
         # REGRA DE INTEGRIDADE CRUZADA: CPF não pode existir na tabela de Usuários
@@ -188,7 +212,6 @@ class FuncionarioSerializer(serializers.ModelSerializer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        user = self.context['request'].user
         
         # REGRA: Ativo é read-only na criação
         if not self.instance: 
@@ -204,8 +227,7 @@ class FuncionarioSerializer(serializers.ModelSerializer):
         if not filiais_selecionadas:
             raise serializers.ValidationError("O funcionário deve ser associado a pelo menos uma filial.")
         
-        user = self.context['request'].user
-        user_filiais_ids = set(user.filiais.values_list('id', flat=True)) if user.tipo == 'COORDENADOR' else set()
+        escopo = obter_escopo(self.context['request'])
 
         for filial in filiais_selecionadas:
             # REGRA DE INTEGRIDADE: Bloquear filial inativa
@@ -213,29 +235,29 @@ class FuncionarioSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(f"A filial '{filial.nome}' está inativa. Não é possível vincular funcionários a ela.")
 
             # REGRA: Coordenador só pode associar funcionário a filiais que ele gerencia
-            if user.tipo == 'COORDENADOR' and filial.id not in user_filiais_ids:
+            if not escopo.permite_filial(filial.id):
                 raise serializers.ValidationError(f"Coordenadores só podem associar funcionários às suas próprias filiais. A filial '{filial.nome}' é inválida.")
                 
         return filiais_selecionadas
 
 
-class FerramentaSerializer(serializers.ModelSerializer):
+class FerramentaSerializer(VariantesFotoMixin, serializers.ModelSerializer):
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
     deposito_nome = serializers.CharField(source='deposito.nome', read_only=True)
     filial_nome = serializers.CharField(source='deposito.filial.nome', read_only=True)
     
     class Meta:
         model = Ferramenta
-        fields = ['id', 'nome', 'numero_serie', 'descricao', 'foto', 'data_aquisicao', 'estado', 'estado_display', 'deposito', 'deposito_nome', 'filial_nome']
+        fields = ['id', 'nome', 'numero_serie', 'descricao', 'foto', 'foto_miniatura', 'foto_media', 'data_aquisicao', 'estado', 'estado_display', 'deposito', 'deposito_nome', 'filial_nome']
         read_only_fields = ['id', 'estado', 'estado_display']
+        select_related = ['deposito__filial']
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        user = self.context['request'].user
-        
         # REGRA: Coordenador só vê e cadastra ferramentas em depósitos das suas filiais
-        if user.tipo == 'COORDENADOR':
-            self.fields['deposito'].queryset = Deposito.objects.filter(filial__in=user.filiais.all())
+        # A filial vem no mesmo SELECT do depósito (usada em validate_deposito)
+        escopo = obter_escopo(self.context['request'])
+        self.fields['deposito'].queryset = escopo.filtrar(Deposito.objects.select_related('filial'), 'filial')
     
     def validate_data_aquisicao(self, value):
         # REGRA: Data não pode ser futura
@@ -251,14 +273,20 @@ class FerramentaSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(f"A filial '{deposito_selecionado.filial.nome}', à qual este depósito pertence, está inativa.")
 
         # REGRA: Validação extra de segurança para Coordenador
-        user = self.context['request'].user
-        if user.tipo == 'COORDENADOR':
-            user_filiais = user.filiais.all()
-            if deposito_selecionado.filial not in user_filiais:
-                raise serializers.ValidationError("Coordenadores só podem cadastrar ferramentas em depósitos de suas próprias filiais.")
+        if not obter_escopo(self.context['request']).permite_filial(deposito_selecionado.filial_id):
+            raise serializers.ValidationError("Coordenadores só podem cadastrar ferramentas em depósitos de suas próprias filiais.")
                 
         return deposito_selecionado
 
+    def update(self, instance, validated_data):
+        # Grava só as colunas enviadas: o 'estado' carregado aqui pode estar velho
+        # e é alterado apenas pelas transições (Ferramenta.transicionar).
+        for campo, valor in validated_data.items():
+            setattr(instance, campo, valor)
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
+        return instance
+
 
 # --- TRANSAÇÕES (EMPRÉSTIMOS E MANUTENÇÕES) ---
 
@@ -269,6 +297,7 @@ class EmprestimoSerializer(serializers.ModelSerializer):
         model = Emprestimo
         fields = ['id', 'nome', 'ferramenta', 'ferramenta_nome', 'ferramenta_numero_serie', 'funcionario', 'funcionario_nome', 'funcionario_matricula', 'data_emprestimo', 'data_devolucao', 'observacoes', 'ativo']
         read_only_fields = ['id']
+        select_related = ['ferramenta', 'funcionario']
     
     # LÓGICA DE SNAPSHOT: Se tem objeto (ativo), mostra ele. Se não (histórico), mostra o campo de texto salvo.
     def get_ferramenta_nome(self, obj): return obj.ferramenta.nome if obj.ferramenta else obj.nome_ferramenta_historico
@@ -315,6 +344,39 @@ class EmprestimoSerializer(serializers.ModelSerializer):
         
         return data
 
+    def create(self, validated_data):
+        # A checagem do validate() pode ficar velha (outro balcão emprestou a ferramenta nesse meio tempo):
+        # o Emprestimo.save recusa a transição e o erro volta como 400.
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as erro:
+            raise serializers.ValidationError(erro.message_dict)
+
+    def update(self, instance, validated_data):
+        # Devolução concorrente (outra requisição ou o devolver_lote finalizou antes): o save recusa e volta 400
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as erro:
+            raise serializers.ValidationError(erro.message_dict)
+
+class EmprestimoLoteItemSerializer(serializers.Serializer):
+    """
+    Item do empréstimo em lote (ver EmprestimoViewSet.lote).
+    Valida apenas o formato: as regras de negócio são checadas para o lote inteiro
+    de uma vez na view, sem uma consulta por item.
+    """
+    ferramenta = serializers.IntegerField()
+    funcionario = serializers.IntegerField()
+    data_emprestimo = serializers.DateField(required=False)
+    observacoes = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class DevolucaoLoteSerializer(serializers.Serializer):
+    """ Entrada da devolução em lote (ver EmprestimoViewSet.devolver_lote) """
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=200)
+    data_devolucao = serializers.DateField(required=False)
+
+
 class ManutencaoSerializer(serializers.ModelSerializer):
     ferramenta_nome = serializers.SerializerMethodField()
     ferramenta_numero_serie = serializers.SerializerMethodField()
@@ -322,6 +384,7 @@ class ManutencaoSerializer(serializers.ModelSerializer):
         model = Manutencao
         fields = ['id', 'nome', 'tipo', 'ferramenta', 'ferramenta_nome', 'ferramenta_numero_serie', 'observacoes', 'data_inicio', 'data_fim', 'ativo']
         read_only_fields = ['id']
+        select_related = ['ferramenta']
     
     def get_ferramenta_nome(self, obj):
         return obj.ferramenta.nome if obj.ferramenta else obj.nome_ferramenta_historico
@@ -348,12 +411,33 @@ class ManutencaoSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(f"A ferramenta '{ferramenta.nome}' não está disponível para manutenção. Estado atual: {ferramenta.get_estado_display()}.")
         return ferramenta
 
+    def create(self, validated_data):
+        # Ver EmprestimoSerializer.create
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as erro:
+            raise serializers.ValidationError(erro.message_dict)
+
+    def update(self, instance, validated_data):
+        # Ver EmprestimoSerializer.update
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as erro:
+            raise serializers.ValidationError(erro.message_dict)
+
+
+class FinalizacaoManutencaoLoteSerializer(serializers.Serializer):
+    """ Entrada da finalização de manutenções em lote (ver ManutencaoViewSet.finalizar_lote) """
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=200)
+    data_fim = serializers.DateField(required=False)
+
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """
     Serializer de Login:
     Valida se o usuário está ativo antes de permitir o login e 
-    adiciona 'tipo' e 'nome' ao payload do Token JWT.
+    adiciona 'tipo', 'nome', as filiais e a versão do token ao payload do Token JWT
+    (usados por autenticacao.JWTSemConsultaAuthentication sem consultar o banco).
     """
     
     def validate(self, attrs):
@@ -372,4 +456,6 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token = super().get_token(user)
         token['tipo'] = user.tipo
         token['nome'] = user.nome
+        token[CLAIM_FILIAIS] = list(user.filiais.values_list('id', flat=True))
+        token[CLAIM_VERSAO] = user.versao_token
         return token
\ No newline at end of file
@@ -5,14 +5,15 @@ import os
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-SECRET_KEY = "django-insecure-#f7w3t1@j+%e962$s)0)0xfbt%_%^#7dz(r@6#&&)(2j=_wvr9"
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', "django-insecure-#f7w3t1@j+%e962$s)0)0xfbt%_%^#7dz(r@6#&&)(2j=_wvr9")
 
-DEBUG = True
+# Perfil de produção (docker-compose --profile producao) usa DJANGO_DEBUG=false
+DEBUG = os.environ.get('DJANGO_DEBUG', 'true').lower() == 'true'
 
 ALLOWED_HOSTS = [
     '127.0.0.1',
     'localhost'
-]
+] + [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 if DEBUG:
     ALLOWED_HOSTS = ['*']
@@ -24,6 +25,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres", # OpClass/GinIndex dos índices de busca (migração 0008) e lookups do Postgres
     "toolcare_api",
     "rest_framework",
     "django_cpf_cnpj",
@@ -75,8 +77,82 @@ DATABASES = {
         'OPTIONS': {
             'client_encoding': 'UTF8',
         },
+        # Testa a conexão reaproveitada antes de usar (evita erro após queda/restart do Postgres)
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# --- CONEXÕES COM O BANCO ---
+# DB_POOL=true: pool nativo do Django (psycopg 3), um pool por processo do servidor.
+#   Obrigatório sob ASGI: cada requisição roda na própria thread, então conexões
+#   persistentes não seriam reaproveitadas. Total de conexões = workers x DB_POOL_MAX.
+# Sem pool: a conexão de cada thread é mantida por DB_CONN_MAX_AGE segundos (workers WSGI do gunicorn).
+#   O padrão 0 (uma conexão por requisição) é o adequado ao runserver, que cria uma thread por requisição.
+if os.environ.get('DB_POOL', 'false').lower() == 'true':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX', 20)), # Mesmo valor de views_async.LIMITE_REQUISICOES_NO_BANCO
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)), # Segundos esperando uma conexão livre
     }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+
+# --- CACHE ---
+# 'default': local de cada processo.
+# 'referencias': listagens de filiais, depósitos, setores e cargos (cache_referencias.py).
+# 'versao_token': versão vigente dos tokens de cada usuário (autenticacao.py), conferida a cada requisição.
+# CACHE_REFERENCIAS e CACHE_VERSAO_TOKEN escolhem onde cada um fica:
+#   - 'memoria' (padrão): na memória do processo. Adequado ao runserver (um processo só);
+#     com vários workers, a invalidação feita por um não chega aos outros (valem até expirar).
+#   - 'arquivo': em CACHE_REFERENCIAS_PASTA / CACHE_VERSAO_TOKEN_PASTA, compartilhado pelos workers da mesma máquina.
+#   - 'redis://host:porta/0': Redis, compartilhado entre máquinas (requer o pacote 'redis').
+# Revogar os tokens de um usuário (desativar, trocar tipo, senha ou filiais) apaga a versão do cache:
+# com cache compartilhado a revogação vale na hora em todos os workers. Em 'memoria', os demais
+# workers aceitam os tokens antigos por até CACHE_VERSAO_TOKEN_SEGUNDOS (0 = sem cache: uma consulta por requisição).
+def _cache_configurado(destino, pasta, nome):
+    if destino.startswith(('redis://', 'rediss://')):
+        return {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': destino}
+    if destino == 'arquivo':
+        return {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': pasta}
+    return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': nome}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'referencias': _cache_configurado(
+        os.environ.get('CACHE_REFERENCIAS', 'memoria'),
+        os.environ.get('CACHE_REFERENCIAS_PASTA', '/tmp/toolcare_cache_referencias'), 'referencias',
+    ),
+    'versao_token': _cache_configurado(
+        os.environ.get('CACHE_VERSAO_TOKEN', 'memoria'),
+        os.environ.get('CACHE_VERSAO_TOKEN_PASTA', '/tmp/toolcare_cache_versao_token'), 'versao_token',
+    ),
 }
+CACHE_VERSAO_TOKEN_SEGUNDOS = int(os.environ.get('CACHE_VERSAO_TOKEN_SEGUNDOS', 60))
+
+# --- EVENTOS EM TEMPO REAL (/api/eventos/, ver eventos.py) ---
+# 'local' (padrão): só entre as conexões do mesmo processo (runserver, um worker).
+# 'postgres': LISTEN/NOTIFY do banco, entre todos os workers. Usa mais uma conexão por worker com clientes conectados.
+EVENTOS_BACKEND = os.environ.get('EVENTOS_BACKEND', 'local')
+
+# --- MÉTRICAS (/metrics no formato Prometheus, ver metricas.py) ---
+# METRICAS=true: latência por viewset/ação/tipo de usuário, consultas por requisição, erros
+# e transições de estado das ferramentas (empréstimos e manutenções).
+# METRICAS_TOKEN: se definido, o /metrics exige 'Authorization: Bearer <token>' (configure o mesmo no Prometheus).
+# Com vários workers, defina PROMETHEUS_MULTIPROC_DIR (o gunicorn.conf.py faz isso quando METRICAS=true).
+METRICAS = os.environ.get('METRICAS', 'false').lower() == 'true'
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
+if METRICAS:
+    MIDDLEWARE.insert(0, 'toolcare_api.metricas.MetricasMiddleware')
+
+# --- INSTRUMENTAÇÃO POR REQUISIÇÃO (ver instrumentacao.py) ---
+# INSTRUMENTACAO=true: cabeçalho Server-Timing (consultas, tempo no banco, serializers e renderização)
+# e log das requisições acima de INSTRUMENTACAO_LIMITE_LENTA_MS com as consultas mais lentas (sem os valores).
+# Desligada por padrão: o middleware nem entra na lista.
+INSTRUMENTACAO = os.environ.get('INSTRUMENTACAO', 'false').lower() == 'true'
+INSTRUMENTACAO_LIMITE_LENTA_MS = int(os.environ.get('INSTRUMENTACAO_LIMITE_LENTA_MS', 500))
+if INSTRUMENTACAO:
+    MIDDLEWARE.insert(0, 'toolcare_api.instrumentacao.InstrumentacaoMiddleware') # Primeiro: o total inclui os demais
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",},
@@ -101,7 +177,7 @@ AUTH_USER_MODEL = 'toolcare_api.Usuario'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'toolcare_api.autenticacao.JWTSemConsultaAuthentication', # Usuário montado pelas claims do token
         'rest_framework.authentication.SessionAuthentication', 
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -0,0 +1,213 @@
+import base64
+import datetime
+import json
+
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+
+from .escopo import obter_escopo
+from .models import Deposito, Emprestimo, Ferramenta, Filial, Funcionario, Manutencao, Remocao
+from .versoes import filiais_da_requisicao
+
+# --- SINCRONIZAÇÃO INCREMENTAL (?atualizado_desde=) ---
+# Em vez de baixar a coleção inteira a cada atualização, o cliente guarda o cursor recebido
+# e pede só o que mudou depois dele:
+#   GET /api/ferramentas/?atualizado_desde=           -> coleção inteira (completo = true) + cursor
+#   GET /api/ferramentas/?atualizado_desde=<cursor>   -> só os alterados e removidos desde o cursor
+# Resposta: {"cursor", "mais", "completo", "alterados": [...], "removidos": [ids]}
+# - mais = true: há outra página; repetir com o novo cursor antes de considerar a sincronização concluída.
+# - completo = true: somadas as páginas, é a coleção inteira; o cliente descarta o que não veio.
+# Alterados: linhas do escopo do usuário com atualizado_em depois do cursor, sem os filtros da
+# listagem (busca, somente_ativos...), que o cliente aplica localmente. Campos de outras tabelas
+# (ex: nome do depósito na ferramenta) só são reenviados quando a própria linha muda.
+# Removidos: lápides (Remocao) das filiais do usuário, menos os ids que continuam visíveis para ele.
+
+# Escritas que ainda não tinham feito commit quando o cursor foi gerado gravaram um atualizado_em
+# anterior a ele: a margem reenvia o que mudou nesse intervalo (o cliente só sobrescreve).
+MARGEM_SINCRONIZACAO = datetime.timedelta(seconds=30)
+
+# Lápides mais antigas são apagadas (comando limpar_remocoes): cursor mais antigo recomeça do zero
+RETENCAO_REMOCOES = datetime.timedelta(days=30)
+
+ITENS_POR_PAGINA = 1000
+
+
+def _codificar_cursor(cursor):
+    # isoformat() direto: o DjangoJSONEncoder corta os microssegundos, e o cursor precisa do valor exato
+    texto = json.dumps(cursor, default=datetime.datetime.isoformat)
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def _decodificar_cursor(texto):
+    """ Cursor recebido do cliente, ou None se for inválido """
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(texto.encode()).decode())
+        desde = cursor['desde'] and parse_datetime(cursor['desde'])
+        inicio = cursor['inicio'] and parse_datetime(cursor['inicio'])
+        apos = cursor['apos'] and (parse_datetime(cursor['apos'][0]), int(cursor['apos'][1]))
+        filiais = cursor['filiais']
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return None
+    if (cursor['desde'] and desde is None) or (cursor['inicio'] and inicio is None) or (apos and apos[0] is None):
+        return None
+    return {'desde': desde, 'inicio': inicio, 'apos': apos, 'filiais': filiais}
+
+
+def _cursor_inicial(filiais):
+    return {'desde': None, 'inicio': None, 'apos': None, 'filiais': filiais}
+
+
+def responder_sincronizacao(viewset, request):
+    """
+    Resposta de ?atualizado_desde= para a viewset (ver SincronizacaoIncrementalMixin).
+    Cursor: desde = fim da sincronização anterior (None = coleção inteira); durante a paginação,
+    inicio = momento da primeira página e apos = (atualizado_em, id) da última linha enviada.
+    """
+    filiais = filiais_da_requisicao(request)
+    texto = request.query_params.get('atualizado_desde', '')
+    cursor = _decodificar_cursor(texto) if texto else _cursor_inicial(filiais)
+    if cursor is None:
+        return Response({"error": "Cursor de sincronização inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Filiais do coordenador mudaram, ou as lápides do período já foram apagadas: recomeça do zero
+    if cursor['filiais'] != filiais or (cursor['desde'] and cursor['desde'] < timezone.now() - RETENCAO_REMOCOES):
+        cursor = _cursor_inicial(filiais)
+    # Lido antes das consultas: o que mudar daqui em diante entra na próxima sincronização
+    inicio = cursor['inicio'] if cursor['apos'] else timezone.now()
+
+    model = viewset.queryset.model
+    escopo = obter_escopo(request)
+    visiveis = escopo.filtrar(model.objects.all(), viewset.caminho_filial)
+    if escopo.restrito:
+        visiveis = visiveis.distinct() # Caminho por ManyToMany (funcionário em várias filiais)
+
+    alterados = visiveis.order_by('atualizado_em', 'id')
+    if cursor['desde']:
+        alterados = alterados.filter(atualizado_em__gte=cursor['desde'] - MARGEM_SINCRONIZACAO)
+    if cursor['apos']:
+        atualizado_em, ultimo_id = cursor['apos']
+        alterados = alterados.filter(Q(atualizado_em__gt=atualizado_em) | Q(atualizado_em=atualizado_em, id__gt=ultimo_id))
+    # Busca uma linha a mais só para saber se existe próxima página
+    itens = list(viewset.carregar_relacoes(alterados)[:ITENS_POR_PAGINA + 1])
+    mais = len(itens) > ITENS_POR_PAGINA
+    itens = itens[:ITENS_POR_PAGINA]
+
+    if mais:
+        proximo = {'desde': cursor['desde'], 'inicio': inicio, 'apos': [itens[-1].atualizado_em, itens[-1].id], 'filiais': filiais}
+        removidos = []
+    else:
+        proximo = {'desde': inicio, 'inicio': None, 'apos': None, 'filiais': filiais}
+        removidos = _removidos(model, visiveis, cursor['desde'], filiais) if cursor['desde'] else []
+
+    return Response({
+        'cursor': _codificar_cursor(proximo),
+        'mais': mais,
+        'completo': cursor['desde'] is None,
+        'alterados': viewset.get_serializer(itens, many=True).data,
+        'removidos': removidos,
+    })
+
+
+def _removidos(model, visiveis, desde, filiais):
+    lapides = Remocao.objects.filter(tabela=model._meta.model_name, removido_em__gte=desde - MARGEM_SINCRONIZACAO)
+    if filiais is not None:
+        lapides = lapides.filter(filial_id__in=filiais)
+    ids = set(lapides.values_list('objeto_id', flat=True))
+    if ids:
+        # Saiu de uma filial mas continua visível (outra filial do coordenador, ou Admin/Máximo): não é remoção
+        ids -= set(visiveis.filter(id__in=ids).values_list('id', flat=True))
+    return sorted(ids)
+
+
+# --- LÁPIDES (SINAIS) ---
+# Hard delete de qualquer origem (API, admin, comandos, cascata) e mudanças de filial.
+# Finalizações de empréstimo/manutenção registram as lápides em Emprestimo/Manutencao._salvar
+# e nas operações em lote (views.py). O atualizado_em dos UPDATEs em massa é gravado por quem os faz.
+
+def _filiais_da_ferramenta(ferramenta):
+    return Deposito.objects.filter(pk=ferramenta.deposito_id).values_list('filial_id', flat=True)
+
+def _filiais_pela_ferramenta(registro):
+    # Empréstimo/manutenção: filial da ferramenta vinculada (sem ferramenta, só Admin/Máximo o viam)
+    return Remocao.filiais_das_ferramentas([registro.ferramenta_id]).values()
+
+# Filiais em que cada tipo de registro aparece
+_FILIAIS_DO_REGISTRO = {
+    Filial: lambda filial: [filial.pk],
+    Deposito: lambda deposito: [deposito.filial_id],
+    Ferramenta: _filiais_da_ferramenta,
+    Funcionario: lambda funcionario: funcionario.filiais.values_list('id', flat=True),
+    Emprestimo: _filiais_pela_ferramenta,
+    Manutencao: _filiais_pela_ferramenta,
+}
+
+
+def _apagado(sender, instance, **kwargs):
+    # pre_delete: ainda dá para ler as filiais (vínculos e cascatas não foram apagados),
+    # e a lápide é desfeita junto se a exclusão falhar (mesma transação)
+    filiais = list(_FILIAIS_DO_REGISTRO[sender](instance)) or [None]
+    Remocao.registrar(sender._meta.model_name, [(instance.pk, filial_id) for filial_id in filiais])
+
+
+def _ferramentas_sairam_da_filial(ferramenta_ids, filial_id):
+    Remocao.registrar('ferramenta', [(ferramenta_id, filial_id) for ferramenta_id in ferramenta_ids])
+    # Empréstimos/manutenções seguem a ferramenta: saem da filial antiga e aparecem na nova
+    for model in (Emprestimo, Manutencao):
+        vinculados = model.objects.filter(ferramenta_id__in=ferramenta_ids)
+        Remocao.registrar(model._meta.model_name, [(objeto_id, filial_id) for objeto_id in vinculados.values_list('id', flat=True)])
+        vinculados.update(atualizado_em=Now())
+
+
+def _ferramenta_salva(sender, instance, created, **kwargs):
+    # post_save roda antes de Ferramenta.save atualizar _contagem_original: ainda é o depósito gravado antes
+    original = instance._contagem_original
+    if created or original is None or original[0] == instance.deposito_id:
+        return
+    filiais = dict(Deposito.objects.filter(id__in=[original[0], instance.deposito_id]).values_list('id', 'filial_id'))
+    if filiais.get(original[0]) != filiais.get(instance.deposito_id):
+        _ferramentas_sairam_da_filial([instance.pk], filiais.get(original[0]))
+
+
+def _deposito_salvo(sender, instance, created, **kwargs):
+    antiga, instance._filial_original = instance._filial_original, instance.filial_id
+    if created or antiga is None or antiga == instance.filial_id:
+        return
+    # Depósito transferido de filial: leva as ferramentas (e seus empréstimos/manutenções)
+    Remocao.registrar('deposito', [(instance.pk, antiga)])
+    ferramentas = Ferramenta.objects.filter(deposito=instance)
+    ferramenta_ids = list(ferramentas.values_list('id', flat=True))
+    ferramentas.update(atualizado_em=Now())
+    _ferramentas_sairam_da_filial(ferramenta_ids, antiga)
+
+
+def _filiais_do_funcionario(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse: instance é a filial (ex: filial.funcionarios.clear() ao desativar a filial)
+    if action == 'pre_clear':
+        # clear() não informa os ids: guarda os vínculos antes de apagá-los
+        if reverse:
+            instance._vinculos_antes_de_limpar = set(sender.objects.filter(filial_id=instance.pk).values_list('funcionario_id', flat=True))
+        else:
+            instance._vinculos_antes_de_limpar = set(sender.objects.filter(funcionario_id=instance.pk).values_list('filial_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_vinculos_antes_de_limpar', set())
+
+    pares = [(funcionario_id, instance.pk) for funcionario_id in pk_set] if reverse else [(instance.pk, filial_id) for filial_id in pk_set]
+    if action != 'post_add':
+        Remocao.registrar('funcionario', pares)
+    # O vínculo não é coluna do funcionário: marca a linha como alterada (a lista de filiais mudou)
+    Funcionario.objects.filter(id__in={funcionario_id for funcionario_id, _ in pares}).update(atualizado_em=Now())
+
+
+for model in _FILIAIS_DO_REGISTRO:
+    pre_delete.connect(_apagado, sender=model, dispatch_uid=f'remocao_{model._meta.model_name}')
+post_save.connect(_ferramenta_salva, sender=Ferramenta, dispatch_uid='remocao_ferramenta_transferida')
+post_save.connect(_deposito_salvo, sender=Deposito, dispatch_uid='remocao_deposito_transferido')
+m2m_changed.connect(_filiais_do_funcionario, sender=Funcionario.filiais.through, dispatch_uid='remocao_funcionario_filiais')
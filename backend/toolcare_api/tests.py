@@ -0,0 +1,1204 @@
+import base64
+import datetime
+import json
+import threading
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import sincronizacao
+from .autenticacao import versao_token_vigente
+from .management.commands.populate_db import gerar_cpf
+from .pagination import PaginacaoSobDemanda
+from .models import (
+    Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, ContadorEstoque, Emprestimo, Manutencao, Remocao, VersaoTabela,
+)
+from .serializers import CustomTokenObtainPairSerializer
+
+# Caches só dos testes: cada teste começa sem cache e os caches reais (arquivo/Redis) não são tocados
+CACHES_DE_TESTE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'},
+    'referencias': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes_referencias'},
+    'versao_token': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes_versao_token'},
+}
+
+
+class Cenario:
+    """
+    Registros de duas filiais (A e B), um usuário de cada tipo e um coordenador de cada filial.
+    Os métodos criar_* passam pelo save() dos models: contadores de estoque e versões seguem as regras reais.
+    """
+    _sequencia = 0
+
+    @classmethod
+    def _proximo(cls):
+        Cenario._sequencia += 1
+        return Cenario._sequencia
+
+    @classmethod
+    def criar_cenario(cls):
+        cls.filial_a = Filial.objects.create(nome='Filial A', cidade='Sertãozinho')
+        cls.filial_b = Filial.objects.create(nome='Filial B', cidade='Uberaba')
+        cls.deposito_a = Deposito.objects.create(nome='Depósito A', filial=cls.filial_a)
+        cls.deposito_b = Deposito.objects.create(nome='Depósito B', filial=cls.filial_b)
+        cls.setor = Setor.objects.create(nome_setor='Manutenção')
+        cls.cargo = Cargo.objects.create(nome_cargo='Mecânico')
+
+        cls.maximo = Usuario.objects.create_user(cpf='0', nome='Máximo', tipo='MAXIMO', password='123')
+        cls.admin = Usuario.objects.create_user(cpf='1', nome='Administrador', tipo='ADMINISTRADOR', password='123')
+        cls.coordenador_a = Usuario.objects.create_user(cpf='4', nome='Coord. A', tipo='COORDENADOR', password='123')
+        cls.coordenador_a.filiais.set([cls.filial_a])
+        cls.coordenador_b = Usuario.objects.create_user(cpf='5', nome='Coord. B', tipo='COORDENADOR', password='123')
+        cls.coordenador_b.filiais.set([cls.filial_b])
+
+    @classmethod
+    def criar_funcionario(cls, *filiais):
+        numero = cls._proximo()
+        funcionario = Funcionario.objects.create(
+            nome=f'Funcionário {numero}', matricula=str(10000 + numero), cpf=gerar_cpf(100_000_000 + numero),
+            setor=cls.setor, cargo=cls.cargo,
+        )
+        funcionario.filiais.set(filiais)
+        return funcionario
+
+    @classmethod
+    def criar_ferramenta(cls, deposito, estado=Ferramenta.EstadoChoices.DISPONIVEL):
+        numero = cls._proximo()
+        return Ferramenta.objects.create(nome=f'Ferramenta {numero}', numero_serie=f'SN{numero:06d}', deposito=deposito, estado=estado)
+
+    @classmethod
+    def criar_registros(cls, deposito, quantidade):
+        """ 'quantidade' ferramentas e funcionários na filial do depósito; a primeira emprestada, a segunda em manutenção """
+        ferramentas = [cls.criar_ferramenta(deposito) for _ in range(quantidade)]
+        funcionarios = [cls.criar_funcionario(deposito.filial) for _ in range(quantidade)]
+        Emprestimo.objects.create(ferramenta=ferramentas[0], funcionario=funcionarios[0])
+        Manutencao.objects.create(ferramenta=ferramentas[1], tipo='PREVENTIVA')
+        return ferramentas, funcionarios
+
+    def cliente(self, usuario):
+        """ Cliente com o token JWT real do usuário (mesmo caminho de autenticação da produção) """
+        cliente = APIClient(SERVER_NAME='localhost')
+        token = CustomTokenObtainPairSerializer.get_token(usuario).access_token
+        cliente.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        # Versão do token já no cache: as contagens medem só a requisição, como num cliente já logado
+        versao_token_vigente(usuario.id)
+        return cliente
+
+    def consultas(self, cliente, url, metodo='get', **kwargs):
+        """ (resposta, número de consultas SQL) de uma requisição """
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = getattr(cliente, metodo)(url, **kwargs)
+        return resposta, len(capturadas)
+
+    def assertContadoresCorretos(self):
+        """ ContadorEstoque igual à contagem feita direto na tabela de ferramentas """
+        contadores = {
+            (contador.deposito_id, contador.estado): contador.quantidade
+            for contador in ContadorEstoque.objects.exclude(quantidade=0)
+        }
+        self.assertEqual(contadores, ContadorEstoque.contagem_real())
+
+
+
+# --- REVOGAÇÃO DE TOKENS ---
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class RevogacaoTokensTests(Cenario, TestCase):
+    """
+    Tokens emitidos deixam de valer quando muda algo que vai neles (filiais) ou o acesso do usuário
+    (ativo, tipo, senha), mesmo com a versão já no cache 'versao_token'. Alterações sem efeito não revogam.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.usuario = Usuario.objects.get(pk=self.coordenador_a.pk)
+        self.api = self.cliente(self.usuario) # Versão vigente já no cache
+        self.assertEqual(self.api.get('/api/dashboard/').status_code, 200)
+
+    def alterar(self, funcao):
+        """ Executa a alteração com os on_commit (a limpeza do cache acontece depois do commit) """
+        with self.captureOnCommitCallbacks(execute=True):
+            funcao()
+
+    def assertRevogado(self):
+        self.assertEqual(self.api.get('/api/dashboard/').status_code, 401)
+        # Um login novo volta a funcionar
+        self.usuario.refresh_from_db()
+        if self.usuario.ativo:
+            self.assertEqual(self.cliente(self.usuario).get('/api/dashboard/').status_code, 200)
+
+    def assertValido(self):
+        self.assertEqual(self.api.get('/api/dashboard/').status_code, 200)
+
+    def test_desativar(self):
+        self.usuario.ativo = False
+        self.alterar(self.usuario.save)
+        self.assertRevogado()
+
+    def test_mudar_tipo(self):
+        self.usuario.tipo = 'ADMINISTRADOR'
+        self.alterar(lambda: self.usuario.save(update_fields=['tipo']))
+        self.assertRevogado()
+
+    def test_trocar_senha(self):
+        self.usuario.set_password('nova-senha-123')
+        self.alterar(self.usuario.save)
+        self.assertRevogado()
+
+    def test_adicionar_filial(self):
+        self.alterar(lambda: self.usuario.filiais.add(self.filial_b))
+        self.assertRevogado()
+
+    def test_remover_filial(self):
+        self.alterar(lambda: self.usuario.filiais.remove(self.filial_a))
+        self.assertRevogado()
+
+    def test_limpar_filiais(self):
+        self.alterar(self.usuario.filiais.clear)
+        self.assertRevogado()
+
+    def test_alteracao_pelo_lado_da_filial(self):
+        self.alterar(lambda: self.filial_b.usuario_set.add(self.usuario))
+        self.assertRevogado()
+        self.api = self.cliente(self.usuario)
+        self.alterar(lambda: self.filial_a.usuario_set.remove(self.usuario))
+        self.assertRevogado()
+        self.api = self.cliente(self.usuario)
+        self.alterar(self.filial_b.usuario_set.clear)
+        self.assertRevogado()
+
+    def test_trocar_filiais_pela_api(self):
+        maximo = self.cliente(self.maximo)
+        self.alterar(lambda: maximo.patch(f'/api/usuarios/{self.usuario.id}/', {'filiais': [self.filial_b.id]}, format='json'))
+        self.assertRevogado()
+
+    def test_alteracoes_sem_efeito_nao_revogam(self):
+        versao = self.usuario.versao_token
+        self.alterar(lambda: self.usuario.filiais.set([self.filial_a])) # Mesmas filiais
+        self.assertValido()
+        self.alterar(lambda: self.usuario.filiais.add(self.filial_a)) # Já vinculada
+        self.assertValido()
+        self.alterar(lambda: self.usuario.filiais.remove(self.filial_b)) # Não vinculada
+        self.assertValido()
+        self.usuario.nome = 'Coord. A (Sertãozinho)'
+        self.alterar(self.usuario.save) # Nome não vai para o acesso
+        self.assertValido()
+        maximo = self.cliente(self.maximo)
+        self.alterar(lambda: maximo.patch(f'/api/usuarios/{self.usuario.id}/', {'filiais': [self.filial_a.id]}, format='json'))
+        self.assertValido()
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.versao_token, versao)
+
+    def test_revogacao_de_um_usuario_nao_afeta_os_outros(self):
+        outro = self.cliente(self.coordenador_b)
+        self.alterar(lambda: self.usuario.filiais.add(self.filial_b))
+        self.assertEqual(outro.get('/api/dashboard/').status_code, 200)
+
+# --- DASHBOARD ---
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class DashboardTests(Cenario, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.criar_registros(cls.deposito_a, 5)
+        cls.criar_registros(cls.deposito_b, 3)
+        # Inativa não entra nos totais; funcionário das duas filiais conta uma vez só
+        cls.criar_ferramenta(cls.deposito_a, Ferramenta.EstadoChoices.INATIVA)
+        cls.criar_funcionario(cls.filial_a, cls.filial_b)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_duas_consultas_para_todos_os_tipos(self):
+        for usuario in (self.maximo, self.admin, self.coordenador_a):
+            with self.subTest(tipo=usuario.tipo):
+                resposta, consultas = self.consultas(self.cliente(usuario), '/api/dashboard/')
+                self.assertEqual(resposta.status_code, 200)
+                self.assertEqual(consultas, 2)
+
+    def test_duas_consultas_com_filial_escolhida(self):
+        resposta, consultas = self.consultas(self.cliente(self.admin), f'/api/dashboard/?filial={self.filial_b.id}')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(consultas, 2)
+
+    def test_totais_da_visao_geral(self):
+        resposta = self.cliente(self.admin).get('/api/dashboard/')
+        self.assertEqual(resposta.json(), {
+            'total_funcionarios': 9,
+            'total_ferramentas': 8,
+            'funcionarios': {'com_emprestimo': 2, 'sem_emprestimo': 7},
+            'ferramentas': {'disponiveis': 4, 'emprestadas': 2, 'manutencao': 2},
+        })
+
+    def test_totais_do_coordenador_so_da_sua_filial(self):
+        resposta = self.cliente(self.coordenador_b).get('/api/dashboard/')
+        self.assertEqual(resposta.json(), {
+            'total_funcionarios': 4,
+            'total_ferramentas': 3,
+            'funcionarios': {'com_emprestimo': 1, 'sem_emprestimo': 3},
+            'ferramentas': {'disponiveis': 1, 'emprestadas': 1, 'manutencao': 1},
+        })
+
+    def test_coordenador_nao_acessa_filial_alheia(self):
+        resposta = self.cliente(self.coordenador_b).get(f'/api/dashboard/?filial={self.filial_a.id}')
+        self.assertEqual(resposta.status_code, 403)
+
+
+# --- LISTAGENS (N+1) ---
+
+# Listagens das viewsets: sem ?page a lista vem inteira (PaginacaoSobDemanda), com ?page a página pedida
+LISTAGENS = [
+    '/api/ferramentas/', '/api/funcionarios/', '/api/emprestimos/', '/api/manutencoes/',
+    '/api/filiais/', '/api/depositos/', '/api/setores/', '/api/cargos/',
+]
+# Só administradores listam usuários
+LISTAGENS_ADMIN = LISTAGENS + ['/api/usuarios/']
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class ListagemConsultasTests(Cenario, TestCase):
+    """ O número de consultas de cada listagem não pode crescer com o número de linhas """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.criar_registros(cls.deposito_a, 3)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def acrescentar_linhas(self):
+        """ Mais linhas em todas as tabelas listadas, com relações diferentes das já existentes """
+        filial = Filial.objects.create(nome='Filial C', cidade='Bahia')
+        deposito = Deposito.objects.create(nome='Depósito C', filial=filial)
+        self.criar_registros(self.deposito_a, 6)
+        self.criar_registros(deposito, 4)
+        self.criar_funcionario(self.filial_a, filial)
+        Setor.objects.create(nome_setor='Almoxarifado')
+        Cargo.objects.create(nome_cargo='Soldador')
+        for cpf in ('6', '7', '8'):
+            usuario = Usuario.objects.create_user(cpf=cpf, nome=f'Coord. {cpf}', tipo='COORDENADOR', password='123')
+            usuario.filiais.set([self.filial_a, filial])
+
+    def contagens(self, cliente, sufixo='', listagens=LISTAGENS_ADMIN):
+        contagens = {}
+        for url in listagens:
+            caches['referencias'].clear()
+            resposta, consultas = self.consultas(cliente, url + sufixo)
+            self.assertEqual(resposta.status_code, 200, url)
+            contagens[url] = consultas
+        return contagens
+
+    def verificar_constantes(self, usuario, sufixo=''):
+        cliente = self.cliente(usuario)
+        listagens = LISTAGENS if usuario.tipo == 'COORDENADOR' else LISTAGENS_ADMIN
+        antes = self.contagens(cliente, sufixo, listagens)
+        self.acrescentar_linhas()
+        depois = self.contagens(cliente, sufixo, listagens)
+        self.assertEqual(antes, depois)
+
+    def test_lista_inteira_admin(self):
+        self.verificar_constantes(self.admin)
+
+    def test_lista_inteira_coordenador(self):
+        self.verificar_constantes(self.coordenador_a)
+
+    def test_pagina(self):
+        self.verificar_constantes(self.admin, '?page=1&page_size=20')
+
+    def test_pagina_nao_depende_do_tamanho(self):
+        cliente = self.cliente(self.admin)
+        self.acrescentar_linhas()
+        self.assertEqual(self.contagens(cliente, '?page=1&page_size=2'), self.contagens(cliente, '?page=1&page_size=20'))
+
+    def test_orcamento_por_listagem(self):
+        # Teto de cada listagem (admin, lista inteira): autenticação sem consulta, versões, consulta principal e prefetches
+        orcamento = {
+            '/api/ferramentas/': 2, '/api/funcionarios/': 3, '/api/emprestimos/': 2, '/api/manutencoes/': 2,
+            '/api/usuarios/': 3, '/api/filiais/': 2, '/api/depositos/': 2, '/api/setores/': 2, '/api/cargos/': 2,
+        }
+        contagens = self.contagens(self.cliente(self.admin))
+        for url, teto in orcamento.items():
+            with self.subTest(url=url):
+                self.assertLessEqual(contagens[url], teto)
+
+
+
+# --- PAGINAÇÃO POR CURSOR ---
+
+def cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class PaginacaoCursorTests(Cenario, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.ferramentas, cls.funcionarios = cls.criar_registros(cls.deposito_a, 12)
+        # Nomes repetidos e empréstimos no mesmo dia: o desempate pelo id é que ordena
+        Ferramenta.objects.filter(pk__in=[ferramenta.pk for ferramenta in cls.ferramentas[:6]]).update(nome='Chave')
+        hoje = datetime.date.today()
+        for indice, (ferramenta, funcionario) in enumerate(zip(cls.ferramentas[2:], cls.funcionarios[2:])):
+            Emprestimo.objects.create(
+                ferramenta=ferramenta, funcionario=funcionario, data_emprestimo=hoje - datetime.timedelta(days=indice % 3)
+            )
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.api = self.cliente(self.admin)
+
+    def percorrer(self, url):
+        """ Ids de todas as páginas, seguindo o 'next' até o fim """
+        ids, proxima = [], url
+        while proxima:
+            resposta = self.api.get(proxima)
+            self.assertEqual(resposta.status_code, 200)
+            ids += [item['id'] for item in resposta.json()['results']]
+            proxima = resposta.json()['next']
+        return ids
+
+    def test_percorre_todas_as_linhas_sem_repetir(self):
+        # Ordenação da viewset + id como desempate (PaginacaoSobDemanda._ordenacao)
+        ordens = {
+            '/api/ferramentas/': Ferramenta.objects.order_by('nome', 'id'),
+            '/api/emprestimos/': Emprestimo.objects.order_by('-data_emprestimo', '-id'),
+            '/api/manutencoes/': Manutencao.objects.order_by('-data_inicio', '-id'),
+            '/api/funcionarios/': Funcionario.objects.order_by('nome', 'id'),
+        }
+        for url, ordem in ordens.items():
+            with self.subTest(url=url):
+                completa = [item['id'] for item in self.api.get(url).json()]
+                paginada = self.percorrer(f'{url}?cursor=&page_size=3')
+                # Mesmas linhas da lista inteira (que não desempata pelo id: a ordem entre iguais pode variar)
+                self.assertEqual(len(paginada), len(set(paginada)))
+                self.assertEqual(set(paginada), set(completa))
+                self.assertEqual(paginada, list(ordem.values_list('id', flat=True)))
+
+    def test_pagina_sem_count_nem_offset(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            resposta = self.api.get('/api/emprestimos/?cursor=&page_size=3')
+        proxima = resposta.json()['next']
+        with CaptureQueriesContext(connection) as capturadas:
+            self.assertEqual(self.api.get(proxima).status_code, 200)
+        for consulta in capturadas:
+            self.assertNotIn('COUNT(', consulta['sql'])
+            self.assertNotIn('OFFSET', consulta['sql'])
+
+    def test_cursor_invalido(self):
+        casos = [
+            ('/api/ferramentas/', 'nao-e-base64!'),
+            ('/api/ferramentas/', cursor(['x', 'y'])),
+            ('/api/ferramentas/', cursor(['x'])),
+            ('/api/ferramentas/', cursor({'nome': 'x'})),
+            ('/api/ferramentas/', cursor([None, 1])),
+            ('/api/emprestimos/', cursor(['x', 'y'])),
+            ('/api/emprestimos/', cursor([{'a': 1}, 1])),
+            ('/api/emprestimos/', cursor(['2025-01-01', [1]])),
+        ]
+        for url, valor in casos:
+            with self.subTest(url=url, cursor=valor):
+                resposta = self.api.get(url, {'cursor': valor})
+                self.assertEqual(resposta.status_code, 404)
+                self.assertEqual(resposta.json(), {'detail': 'Cursor inválido.'})
+
+    def test_limite_da_lista_sem_paginacao(self):
+        total = Ferramenta.objects.count()
+        with mock.patch.object(PaginacaoSobDemanda, 'max_sem_paginacao', total - 1):
+            resposta = self.api.get('/api/ferramentas/')
+        self.assertEqual(len(resposta.json()), total - 1)
+        self.assertEqual(resposta['X-Resultado-Truncado'], 'true')
+        self.assertEqual(resposta['X-Limite-Resultados'], str(total - 1))
+
+        with mock.patch.object(PaginacaoSobDemanda, 'max_sem_paginacao', total):
+            resposta = self.api.get('/api/ferramentas/')
+        self.assertEqual(len(resposta.json()), total)
+        self.assertFalse(resposta.has_header('X-Resultado-Truncado'))
+
+# --- SINCRONIZAÇÃO INCREMENTAL (?atualizado_desde=) ---
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class SincronizacaoTests(Cenario, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.ferramentas_a, cls.funcionarios_a = cls.criar_registros(cls.deposito_a, 5)
+        cls.ferramentas_b, cls.funcionarios_b = cls.criar_registros(cls.deposito_b, 3)
+        # Cenário gravado há uma hora: fora da margem do cursor, só o que o teste alterar volta como alterado
+        antes = timezone.now() - datetime.timedelta(hours=1)
+        for model in (Filial, Deposito, Ferramenta, Funcionario, Emprestimo, Manutencao):
+            model.objects.update(atualizado_em=antes)
+        Remocao.objects.update(removido_em=antes)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def sincronizar(self, api, url, desde=''):
+        """ Todas as páginas a partir do cursor 'desde': (ids alterados, última página) """
+        ids, mais = [], True
+        while mais:
+            resposta = api.get(url, {'atualizado_desde': desde})
+            self.assertEqual(resposta.status_code, 200)
+            dados = resposta.json()
+            ids += [item['id'] for item in dados['alterados']]
+            desde, mais = dados['cursor'], dados['mais']
+        return ids, dados
+
+    def test_colecao_inteira_e_depois_so_o_que_mudou(self):
+        api = self.cliente(self.coordenador_a)
+        ids, dados = self.sincronizar(api, '/api/ferramentas/')
+        self.assertTrue(dados['completo'])
+        self.assertEqual(sorted(ids), sorted(ferramenta.id for ferramenta in self.ferramentas_a))
+
+        ferramenta = self.ferramentas_a[2]
+        ferramenta.nome = 'Renomeada'
+        ferramenta.save()
+        ids, dados = self.sincronizar(api, '/api/ferramentas/', dados['cursor'])
+        self.assertFalse(dados['completo'])
+        self.assertEqual(ids, [ferramenta.id])
+        self.assertEqual(dados['removidos'], [])
+
+    def test_transferencia_entre_filiais(self):
+        coordenador_a, coordenador_b, admin = (self.cliente(usuario) for usuario in (self.coordenador_a, self.coordenador_b, self.admin))
+        cursores = {
+            (api, url): self.sincronizar(api, url)[1]['cursor']
+            for api in (coordenador_a, coordenador_b, admin) for url in ('/api/ferramentas/', '/api/emprestimos/')
+        }
+        # A primeira ferramenta está emprestada: o empréstimo acompanha a ferramenta
+        ferramenta = self.ferramentas_a[0]
+        emprestimo = Emprestimo.objects.get(ferramenta=ferramenta)
+        ferramenta.deposito = self.deposito_b
+        ferramenta.save()
+
+        for url, objeto_id in (('/api/ferramentas/', ferramenta.id), ('/api/emprestimos/', emprestimo.id)):
+            with self.subTest(url=url):
+                # Sai da lista do coordenador da filial antiga...
+                ids, dados = self.sincronizar(coordenador_a, url, cursores[(coordenador_a, url)])
+                self.assertNotIn(objeto_id, ids)
+                self.assertEqual(dados['removidos'], [objeto_id])
+                # ...entra na do coordenador da nova...
+                ids, dados = self.sincronizar(coordenador_b, url, cursores[(coordenador_b, url)])
+                self.assertIn(objeto_id, ids)
+                self.assertEqual(dados['removidos'], [])
+                # ...e para quem vê todas as filiais é só uma alteração
+                ids, dados = self.sincronizar(admin, url, cursores[(admin, url)])
+                self.assertIn(objeto_id, ids)
+                self.assertEqual(dados['removidos'], [])
+
+    def test_finalizacao_e_exclusao_viram_removidos(self):
+        api = self.cliente(self.coordenador_a)
+        emprestimos = self.sincronizar(api, '/api/emprestimos/')[1]['cursor']
+        funcionarios = self.sincronizar(api, '/api/funcionarios/')[1]['cursor']
+
+        emprestimo = Emprestimo.objects.get(ferramenta=self.ferramentas_a[0])
+        emprestimo.ativo = False
+        emprestimo.save()
+        funcionario_id = self.funcionarios_a[4].id
+        self.funcionarios_a[4].delete()
+
+        self.assertIn(emprestimo.id, self.sincronizar(api, '/api/emprestimos/', emprestimos)[1]['removidos'])
+        self.assertEqual(self.sincronizar(api, '/api/funcionarios/', funcionarios)[1]['removidos'], [funcionario_id])
+
+    def test_paginas_sem_repetir(self):
+        ferramentas = Ferramenta.objects.filter(deposito=self.deposito_a)
+        # Mesmo atualizado_em em todas: o desempate pelo id é que separa as páginas
+        ferramentas.update(atualizado_em=timezone.now())
+        api = self.cliente(self.coordenador_a)
+        with mock.patch.object(sincronizacao, 'ITENS_POR_PAGINA', 2):
+            paginas, desde, mais = [], '', True
+            while mais:
+                dados = api.get('/api/ferramentas/', {'atualizado_desde': desde}).json()
+                paginas.append([item['id'] for item in dados['alterados']])
+                desde, mais = dados['cursor'], dados['mais']
+                self.assertTrue(dados['completo'])
+        ids = [objeto_id for pagina in paginas for objeto_id in pagina]
+        self.assertEqual(len(paginas), 3)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, list(ferramentas.order_by('id').values_list('id', flat=True)))
+
+    def test_filiais_do_coordenador_mudaram(self):
+        api = self.cliente(self.coordenador_a)
+        desde = self.sincronizar(api, '/api/ferramentas/')[1]['cursor']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coordenador_a.filiais.add(self.filial_b)
+        api = self.cliente(Usuario.objects.get(pk=self.coordenador_a.pk))
+        # O cursor é das filiais antigas: as ferramentas da filial B nunca foram enviadas, recomeça do zero
+        ids, dados = self.sincronizar(api, '/api/ferramentas/', desde)
+        self.assertTrue(dados['completo'])
+        self.assertEqual(sorted(ids), sorted(ferramenta.id for ferramenta in self.ferramentas_a + self.ferramentas_b))
+
+        # Cursor forjado com outras filiais também não vale
+        forjado = json.loads(base64.urlsafe_b64decode(dados['cursor']))
+        forjado['filiais'] = [self.filial_a.id]
+        ids, dados = self.sincronizar(api, '/api/ferramentas/', cursor(forjado))
+        self.assertTrue(dados['completo'])
+
+    def test_cursor_antigo_recomeca_do_zero(self):
+        api = self.cliente(self.coordenador_a)
+        dados = self.sincronizar(api, '/api/ferramentas/')[1]
+        antigo = json.loads(base64.urlsafe_b64decode(dados['cursor']))
+        antigo['desde'] = (timezone.now() - sincronizacao.RETENCAO_REMOCOES - datetime.timedelta(days=1)).isoformat()
+        ids, dados = self.sincronizar(api, '/api/ferramentas/', cursor(antigo))
+        self.assertTrue(dados['completo'])
+        self.assertEqual(len(ids), len(self.ferramentas_a))
+
+    def test_cursor_invalido(self):
+        api = self.cliente(self.coordenador_a)
+        valido = json.loads(base64.urlsafe_b64decode(self.sincronizar(api, '/api/ferramentas/')[1]['cursor']))
+        casos = [
+            'nao-e-base64!',
+            cursor(['x']),
+            cursor({'desde': None}),
+            {**valido, 'desde': 'ontem'},
+            {**valido, 'inicio': 'x', 'apos': ['2025-01-01T00:00:00+00:00', 1]},
+            {**valido, 'apos': ['x', 1]},
+            {**valido, 'apos': ['2025-01-01T00:00:00+00:00', 'y']},
+            {**valido, 'apos': ['2025-01-01T00:00:00+00:00']},
+        ]
+        for valor in casos:
+            valor = cursor(valor) if isinstance(valor, dict) else valor
+            with self.subTest(cursor=valor):
+                resposta = api.get('/api/ferramentas/', {'atualizado_desde': valor})
+                self.assertEqual(resposta.status_code, 400)
+                self.assertEqual(resposta.json(), {'error': 'Cursor de sincronização inválido.'})
+
+
+# --- TRANSIÇÕES DE ESTADO SOB CONCORRÊNCIA ---
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class ConcorrenciaTransicoesTests(Cenario, TransactionTestCase):
+    """
+    Vários balcões pegando a mesma ferramenta ao mesmo tempo, cada um na sua thread e conexão.
+    TransactionTestCase: as threads só enxergam o que foi confirmado no banco.
+    """
+    THREADS = 8
+    RODADAS = 5
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.criar_cenario()
+        self.funcionarios = [self.criar_funcionario(self.filial_a) for _ in range(self.THREADS)]
+
+    def em_paralelo(self, funcoes):
+        """ Executa as funções em threads liberadas juntas; retorna os resultados na mesma ordem """
+        barreira = threading.Barrier(len(funcoes))
+        resultados, erros = [None] * len(funcoes), []
+
+        def executar(indice, funcao):
+            try:
+                barreira.wait()
+                resultados[indice] = funcao()
+            except Exception as erro:
+                erros.append(erro)
+            finally:
+                connection.close() # Conexão própria da thread
+
+        threads = [threading.Thread(target=executar, args=item) for item in enumerate(funcoes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(erros, [])
+        return resultados
+
+    def requisicao(self, url, corpo, metodo='post'):
+        cliente = self.cliente(self.admin)
+        return lambda: getattr(cliente, metodo)(url, corpo, format='json').status_code
+
+    def test_emprestimos_simultaneos_da_mesma_ferramenta(self):
+        for _ in range(self.RODADAS):
+            ferramenta = self.criar_ferramenta(self.deposito_a)
+            status_codes = self.em_paralelo([
+                self.requisicao('/api/emprestimos/', {'ferramenta': ferramenta.id, 'funcionario': funcionario.id})
+                for funcionario in self.funcionarios
+            ])
+            self.assertEqual(sorted(status_codes), [201] + [400] * (self.THREADS - 1))
+            self.assertEqual(Emprestimo.objects.filter(ferramenta=ferramenta, ativo=True).count(), 1)
+            ferramenta.refresh_from_db()
+            self.assertEqual(ferramenta.estado, Ferramenta.EstadoChoices.EMPRESTADA)
+        self.assertContadoresCorretos()
+
+    def test_emprestimo_manutencao_e_lote_disputando_a_mesma_ferramenta(self):
+        for _ in range(self.RODADAS):
+            ferramenta = self.criar_ferramenta(self.deposito_a)
+            funcoes = []
+            for indice, funcionario in enumerate(self.funcionarios):
+                if indice % 3 == 0:
+                    funcoes.append(self.requisicao('/api/manutencoes/', {'ferramenta': ferramenta.id, 'tipo': 'CORRETIVA'}))
+                elif indice % 3 == 1:
+                    item = {'ferramenta': ferramenta.id, 'funcionario': funcionario.id}
+                    funcoes.append(self.requisicao('/api/emprestimos/lote/', {'itens': [item]}))
+                else:
+                    funcoes.append(self.requisicao('/api/emprestimos/', {'ferramenta': ferramenta.id, 'funcionario': funcionario.id}))
+            status_codes = self.em_paralelo(funcoes)
+
+            self.assertEqual(sorted(status_codes), [201] + [400] * (self.THREADS - 1))
+            ativos = (
+                Emprestimo.objects.filter(ferramenta=ferramenta, ativo=True).count()
+                + Manutencao.objects.filter(ferramenta=ferramenta, ativo=True).count()
+            )
+            self.assertEqual(ativos, 1)
+            ferramenta.refresh_from_db()
+            self.assertIn(ferramenta.estado, [Ferramenta.EstadoChoices.EMPRESTADA, Ferramenta.EstadoChoices.EM_MANUTENCAO])
+        self.assertContadoresCorretos()
+
+    def test_devolucoes_simultaneas_liberam_uma_vez(self):
+        ferramenta = self.criar_ferramenta(self.deposito_a)
+        emprestimo = Emprestimo.objects.create(ferramenta=ferramenta, funcionario=self.funcionarios[0])
+        corpo = {'ids': [emprestimo.id]}
+        status_codes = self.em_paralelo([self.requisicao('/api/emprestimos/devolver_lote/', corpo) for _ in range(self.THREADS)])
+
+        self.assertEqual(sorted(status_codes), [200] + [400] * (self.THREADS - 1))
+        ferramenta.refresh_from_db()
+        self.assertEqual(ferramenta.estado, Ferramenta.EstadoChoices.DISPONIVEL)
+        self.assertEqual(Remocao.objects.filter(tabela='emprestimo', objeto_id=emprestimo.id).count(), 1)
+        self.assertContadoresCorretos()
+
+    def test_finalizacoes_individuais_simultaneas(self):
+        ferramentas = [self.criar_ferramenta(self.deposito_a) for _ in range(2)]
+        emprestimo = Emprestimo.objects.create(ferramenta=ferramentas[0], funcionario=self.funcionarios[0])
+        manutencao = Manutencao.objects.create(ferramenta=ferramentas[1], tipo='CORRETIVA')
+        for url, tabela, objeto in [
+            (f'/api/emprestimos/{emprestimo.id}/', 'emprestimo', emprestimo),
+            (f'/api/manutencoes/{manutencao.id}/', 'manutencao', manutencao),
+        ]:
+            with self.subTest(tabela=tabela):
+                status_codes = self.em_paralelo([self.requisicao(url, {'ativo': False}, 'patch') for _ in range(self.THREADS)])
+                self.assertEqual(sorted(status_codes), [200] + [400] * (self.THREADS - 1))
+                self.assertEqual(Remocao.objects.filter(tabela=tabela, objeto_id=objeto.id).count(), 1)
+        for ferramenta in ferramentas:
+            ferramenta.refresh_from_db()
+            self.assertEqual(ferramenta.estado, Ferramenta.EstadoChoices.DISPONIVEL)
+        self.assertContadoresCorretos()
+
+    def test_devolucao_individual_e_em_lote_simultaneas(self):
+        # Os dois caminhos travam o empréstimo antes da ferramenta: sem deadlock (que viraria erro 500)
+        for _ in range(self.RODADAS):
+            emprestimos = [
+                Emprestimo.objects.create(ferramenta=self.criar_ferramenta(self.deposito_a), funcionario=funcionario)
+                for funcionario in self.funcionarios[:2]
+            ]
+            ids = [emprestimo.id for emprestimo in emprestimos]
+            funcoes = []
+            for indice in range(self.THREADS):
+                if indice % 2:
+                    funcoes.append(self.requisicao('/api/emprestimos/devolver_lote/', {'ids': ids if indice % 4 == 1 else ids[::-1]}))
+                else:
+                    funcoes.append(self.requisicao(f'/api/emprestimos/{ids[indice % 4 // 2]}/', {'ativo': False}, 'patch'))
+            status_codes = self.em_paralelo(funcoes)
+
+            self.assertTrue(set(status_codes) <= {200, 400}, status_codes)
+            for emprestimo in emprestimos:
+                self.assertFalse(Emprestimo.objects.get(pk=emprestimo.pk).ativo)
+                self.assertEqual(Remocao.objects.filter(tabela='emprestimo', objeto_id=emprestimo.id).count(), 1)
+        self.assertFalse(Ferramenta.objects.exclude(estado=Ferramenta.EstadoChoices.DISPONIVEL).exists())
+        self.assertContadoresCorretos()
+
+
+class RegistroAtivoUnicoTests(Cenario, TestCase):
+    """ As constraints valem mesmo para escritas que não passam pelo save() """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.ferramenta = cls.criar_ferramenta(cls.deposito_a)
+        cls.funcionario = cls.criar_funcionario(cls.filial_a)
+
+    def test_um_emprestimo_ativo_por_ferramenta(self):
+        Emprestimo.objects.bulk_create([Emprestimo(ferramenta=self.ferramenta, funcionario=self.funcionario)])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Emprestimo.objects.bulk_create([Emprestimo(ferramenta=self.ferramenta, funcionario=self.funcionario)])
+        # Finalizados não contam
+        Emprestimo.objects.bulk_create([Emprestimo(ferramenta=self.ferramenta, funcionario=self.funcionario, ativo=False)])
+
+    def test_copia_velha_nao_libera_ferramenta_de_outro_emprestimo(self):
+        emprestimo = Emprestimo.objects.create(ferramenta=self.ferramenta, funcionario=self.funcionario)
+        copia_a, copia_b = Emprestimo.objects.get(pk=emprestimo.pk), Emprestimo.objects.get(pk=emprestimo.pk)
+        copia_a.ativo = False
+        copia_a.save()
+        self.ferramenta.refresh_from_db()
+        seguinte = Emprestimo.objects.create(ferramenta=self.ferramenta, funcionario=self.funcionario)
+
+        copia_b.ativo = False
+        with self.assertRaises(ValidationError):
+            copia_b.save()
+        self.ferramenta.refresh_from_db()
+        self.assertEqual(self.ferramenta.estado, Ferramenta.EstadoChoices.EMPRESTADA)
+        self.assertTrue(Emprestimo.objects.get(pk=seguinte.pk).ativo)
+        self.assertEqual(Remocao.objects.filter(tabela='emprestimo', objeto_id=emprestimo.id).count(), 1)
+        self.assertContadoresCorretos()
+
+    def test_copia_velha_nao_libera_ferramenta_de_outra_manutencao(self):
+        manutencao = Manutencao.objects.create(ferramenta=self.ferramenta, tipo='PREVENTIVA')
+        copia_a, copia_b = Manutencao.objects.get(pk=manutencao.pk), Manutencao.objects.get(pk=manutencao.pk)
+        copia_a.ativo = False
+        copia_a.save()
+        self.ferramenta.refresh_from_db()
+        Manutencao.objects.create(ferramenta=self.ferramenta, tipo='CORRETIVA')
+
+        copia_b.ativo = False
+        with self.assertRaises(ValidationError):
+            copia_b.save()
+        self.ferramenta.refresh_from_db()
+        self.assertEqual(self.ferramenta.estado, Ferramenta.EstadoChoices.EM_MANUTENCAO)
+        self.assertContadoresCorretos()
+
+    def test_uma_manutencao_ativa_por_ferramenta(self):
+        Manutencao.objects.bulk_create([Manutencao(ferramenta=self.ferramenta, tipo='PREVENTIVA')])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Manutencao.objects.bulk_create([Manutencao(ferramenta=self.ferramenta, tipo='CORRETIVA')])
+        Manutencao.objects.bulk_create([Manutencao(ferramenta=self.ferramenta, tipo='CORRETIVA', ativo=False)])
+
+
+# --- OPERAÇÕES EM LOTE ---
+
+def versoes():
+    return {(versao.tabela, versao.filial_id): versao.versao for versao in VersaoTabela.objects.all()}
+
+
+def versoes_alteradas(antes, depois):
+    return {chave for chave, versao in depois.items() if antes.get(chave) != versao}
+
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class OperacoesEmLoteTests(Cenario, TestCase):
+    """
+    Os endpoints em lote deixam o banco como a operação equivalente linha a linha:
+    mesmo registro, mesmo estado da ferramenta, mesmos contadores, lápides e versões (ETags) invalidadas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.ferramentas = [cls.criar_ferramenta(cls.deposito_a) for _ in range(4)]
+        cls.funcionarios = [cls.criar_funcionario(cls.filial_a) for _ in range(4)]
+        cls.funcionario_b = cls.criar_funcionario(cls.filial_b)
+        cls.hoje = datetime.date.today()
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.api = self.cliente(self.admin)
+
+    def executar(self, funcao):
+        """ Resultado de funcao() e as versões que ela alterou (com os on_commit executados) """
+        antes = versoes()
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = funcao()
+        return resultado, versoes_alteradas(antes, versoes())
+
+    def resumo_emprestimo(self, emprestimo_id, ferramenta, funcionario):
+        """ Campos do empréstimo, com os dados da ferramenta/funcionário trocados por marcadores comparáveis """
+        emprestimo = Emprestimo.objects.get(pk=emprestimo_id)
+        trocas = {
+            ferramenta.id: '<ferramenta>', ferramenta.nome: '<ferramenta.nome>', ferramenta.numero_serie: '<ferramenta.numero_serie>',
+            funcionario.id: '<funcionario>', funcionario.nome: '<funcionario.nome>', funcionario.matricula: '<funcionario.matricula>',
+            f'Empréstimo {emprestimo.id}': '<nome>',
+        }
+        campos = [
+            'nome', 'ferramenta_id', 'funcionario_id', 'data_emprestimo', 'data_devolucao', 'observacoes', 'ativo',
+            'nome_ferramenta_historico', 'numero_serie_ferramenta_historico', 'nome_funcionario_historico', 'matricula_funcionario_historico',
+        ]
+        return {campo: trocas.get(getattr(emprestimo, campo), getattr(emprestimo, campo)) for campo in campos}
+
+    def resumo_manutencao(self, manutencao_id, ferramenta):
+        manutencao = Manutencao.objects.get(pk=manutencao_id)
+        trocas = {
+            ferramenta.id: '<ferramenta>', ferramenta.nome: '<ferramenta.nome>', ferramenta.numero_serie: '<ferramenta.numero_serie>',
+            f'Manutenção {manutencao.id}': '<nome>',
+        }
+        campos = [
+            'nome', 'tipo', 'ferramenta_id', 'data_inicio', 'data_fim', 'observacoes', 'ativo',
+            'nome_ferramenta_historico', 'numero_serie_ferramenta_historico',
+        ]
+        return {campo: trocas.get(getattr(manutencao, campo), getattr(manutencao, campo)) for campo in campos}
+
+    def estado(self, ferramenta):
+        ferramenta.refresh_from_db()
+        return ferramenta.estado
+
+    def emprestar(self, ferramenta, funcionario):
+        return Emprestimo.objects.create(ferramenta=ferramenta, funcionario=funcionario)
+
+    # Empréstimo
+
+    def test_lote_de_emprestimos_igual_ao_emprestimo_individual(self):
+        (ferramenta_1, ferramenta_2), (funcionario_1, funcionario_2) = self.ferramentas[:2], self.funcionarios[:2]
+        individual, versoes_individual = self.executar(lambda: self.api.post(
+            '/api/emprestimos/', {'ferramenta': ferramenta_1.id, 'funcionario': funcionario_1.id, 'observacoes': 'Turno A'}, format='json'
+        ))
+        lote, versoes_lote = self.executar(lambda: self.api.post(
+            '/api/emprestimos/lote/', {'itens': [{'ferramenta': ferramenta_2.id, 'funcionario': funcionario_2.id, 'observacoes': 'Turno A'}]}, format='json'
+        ))
+        self.assertEqual(individual.status_code, 201)
+        self.assertEqual(lote.status_code, 201)
+        dados_lote = lote.json()['resultados'][0]['emprestimo']
+        self.assertEqual(set(dados_lote), set(individual.json()))
+
+        self.assertEqual(
+            self.resumo_emprestimo(individual.json()['id'], ferramenta_1, funcionario_1),
+            self.resumo_emprestimo(dados_lote['id'], ferramenta_2, funcionario_2),
+        )
+        self.assertEqual(self.estado(ferramenta_1), Ferramenta.EstadoChoices.EMPRESTADA)
+        self.assertEqual(self.estado(ferramenta_2), Ferramenta.EstadoChoices.EMPRESTADA)
+        self.assertEqual(versoes_individual, versoes_lote)
+        self.assertContadoresCorretos()
+
+    def test_lote_de_emprestimos_recusa_o_que_o_individual_recusa(self):
+        ferramenta, funcionario = self.ferramentas[0], self.funcionarios[0]
+        self.emprestar(ferramenta, funcionario)
+        livre = self.ferramentas[1]
+        casos = [
+            ('ferramenta', {'ferramenta': ferramenta.id, 'funcionario': self.funcionarios[1].id}), # já emprestada
+            ('funcionario', {'ferramenta': livre.id, 'funcionario': self.funcionario_b.id}), # funcionário de outra filial
+        ]
+        for campo, item in casos:
+            with self.subTest(campo=campo):
+                individual = self.api.post('/api/emprestimos/', item, format='json')
+                lote = self.api.post('/api/emprestimos/lote/', {'itens': [item]}, format='json')
+                self.assertEqual(individual.status_code, 400)
+                self.assertEqual(lote.status_code, 400)
+                self.assertEqual(lote.json()['resultados'][0]['status'], 'erro')
+                self.assertIn(campo, individual.json())
+                self.assertIn(campo, lote.json()['resultados'][0]['erros'])
+        # Mesma mensagem da regra de localização nos dois caminhos
+        self.assertEqual(individual.json()['funcionario'], lote.json()['resultados'][0]['erros']['funcionario'])
+        self.assertEqual(self.estado(livre), Ferramenta.EstadoChoices.DISPONIVEL)
+
+    def test_lote_de_emprestimos_com_a_mesma_ferramenta_duas_vezes(self):
+        ferramenta = self.ferramentas[0]
+        itens = [{'ferramenta': ferramenta.id, 'funcionario': funcionario.id} for funcionario in self.funcionarios[:2]]
+        resposta = self.api.post('/api/emprestimos/lote/', {'itens': itens}, format='json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual((resposta.json()['criados'], resposta.json()['falhas']), (1, 1))
+        self.assertEqual([resultado['status'] for resultado in resposta.json()['resultados']], ['criado', 'erro'])
+        self.assertEqual(Emprestimo.objects.filter(ferramenta=ferramenta, ativo=True).count(), 1)
+        self.assertContadoresCorretos()
+
+    # Devolução
+
+    def test_devolucao_em_lote_igual_a_devolucao_individual(self):
+        (ferramenta_1, ferramenta_2), (funcionario_1, funcionario_2) = self.ferramentas[:2], self.funcionarios[:2]
+        emprestimo_1, emprestimo_2 = self.emprestar(ferramenta_1, funcionario_1), self.emprestar(ferramenta_2, funcionario_2)
+        individual, versoes_individual = self.executar(lambda: self.api.patch(
+            f'/api/emprestimos/{emprestimo_1.id}/', {'ativo': False, 'data_devolucao': self.hoje}, format='json'
+        ))
+        lote, versoes_lote = self.executar(lambda: self.api.post(
+            '/api/emprestimos/devolver_lote/', {'ids': [emprestimo_2.id], 'data_devolucao': self.hoje}, format='json'
+        ))
+        self.assertEqual(individual.status_code, 200)
+        self.assertEqual(lote.status_code, 200)
+
+        self.assertEqual(
+            self.resumo_emprestimo(emprestimo_1.id, ferramenta_1, funcionario_1),
+            self.resumo_emprestimo(emprestimo_2.id, ferramenta_2, funcionario_2),
+        )
+        self.assertEqual(self.estado(ferramenta_1), Ferramenta.EstadoChoices.DISPONIVEL)
+        self.assertEqual(self.estado(ferramenta_2), Ferramenta.EstadoChoices.DISPONIVEL)
+        for emprestimo in (emprestimo_1, emprestimo_2):
+            self.assertTrue(Remocao.objects.filter(tabela='emprestimo', objeto_id=emprestimo.id, filial_id=self.filial_a.id).exists())
+        self.assertEqual(versoes_individual, versoes_lote)
+        self.assertContadoresCorretos()
+
+    def test_devolucao_nao_reativa_ferramenta_desativada_durante_o_emprestimo(self):
+        (ferramenta_1, ferramenta_2), (funcionario_1, funcionario_2) = self.ferramentas[:2], self.funcionarios[:2]
+        emprestimo_1, emprestimo_2 = self.emprestar(ferramenta_1, funcionario_1), self.emprestar(ferramenta_2, funcionario_2)
+        Ferramenta.objects.filter(pk__in=[ferramenta_1.pk, ferramenta_2.pk]).update(estado=Ferramenta.EstadoChoices.INATIVA)
+        ContadorEstoque.recalcular()
+
+        individual = self.api.patch(f'/api/emprestimos/{emprestimo_1.id}/', {'ativo': False, 'data_devolucao': self.hoje}, format='json')
+        lote = self.api.post('/api/emprestimos/devolver_lote/', {'ids': [emprestimo_2.id], 'data_devolucao': self.hoje}, format='json')
+        self.assertEqual(individual.status_code, 200)
+        self.assertEqual(lote.status_code, 200)
+        self.assertEqual(
+            self.resumo_emprestimo(emprestimo_1.id, ferramenta_1, funcionario_1),
+            self.resumo_emprestimo(emprestimo_2.id, ferramenta_2, funcionario_2),
+        )
+        self.assertEqual(self.estado(ferramenta_1), Ferramenta.EstadoChoices.INATIVA)
+        self.assertEqual(self.estado(ferramenta_2), Ferramenta.EstadoChoices.INATIVA)
+        self.assertContadoresCorretos()
+
+    def test_devolucao_em_lote_com_itens_invalidos(self):
+        ferramentas, funcionarios = self.ferramentas, self.funcionarios
+        valido = self.emprestar(ferramentas[0], funcionarios[0])
+        finalizado = self.emprestar(ferramentas[1], funcionarios[1])
+        self.api.post('/api/emprestimos/devolver_lote/', {'ids': [finalizado.id]}, format='json')
+        anterior = self.emprestar(ferramentas[2], funcionarios[2])
+        Emprestimo.objects.filter(pk=anterior.pk).update(data_emprestimo=self.hoje + datetime.timedelta(days=1))
+
+        ids = [valido.id, finalizado.id, 999_999, valido.id, anterior.id]
+        resposta = self.api.post('/api/emprestimos/devolver_lote/', {'ids': ids, 'data_devolucao': self.hoje}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual((dados['finalizados'], dados['falhas']), (1, 3))
+        # Ids repetidos contam uma vez; a ordem de entrada é mantida
+        self.assertEqual([(resultado['id'], resultado['status']) for resultado in dados['resultados']], [
+            (valido.id, 'finalizado'), (finalizado.id, 'erro'), (999_999, 'erro'), (anterior.id, 'erro'),
+        ])
+        self.assertEqual(list(dados['resultados'][1]['erros']), ['ativo'])
+        self.assertEqual(list(dados['resultados'][2]['erros']), ['id'])
+        # Mesma mensagem da devolução individual
+        individual = self.api.patch(f'/api/emprestimos/{anterior.id}/', {'ativo': False, 'data_devolucao': self.hoje}, format='json')
+        self.assertEqual(individual.status_code, 400)
+        self.assertEqual(dados['resultados'][3]['erros']['data_devolucao'], individual.json()['data_devolucao'])
+
+        self.assertEqual(self.estado(ferramentas[2]), Ferramenta.EstadoChoices.EMPRESTADA)
+        self.assertContadoresCorretos()
+
+    def test_devolucao_em_lote_so_com_falhas(self):
+        resposta = self.api.post('/api/emprestimos/devolver_lote/', {'ids': [999_999]}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['finalizados'], 0)
+
+    def test_coordenador_nao_devolve_emprestimo_de_outra_filial(self):
+        emprestimo = self.emprestar(self.ferramentas[0], self.funcionarios[0])
+        resposta = self.cliente(self.coordenador_b).post('/api/emprestimos/devolver_lote/', {'ids': [emprestimo.id]}, format='json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(list(resposta.json()['resultados'][0]['erros']), ['id'])
+        emprestimo.refresh_from_db()
+        self.assertTrue(emprestimo.ativo)
+        self.assertEqual(self.estado(self.ferramentas[0]), Ferramenta.EstadoChoices.EMPRESTADA)
+
+    # Manutenção
+
+    def test_finalizacao_em_lote_igual_a_finalizacao_individual(self):
+        ferramenta_1, ferramenta_2 = self.ferramentas[:2]
+        manutencao_1 = Manutencao.objects.create(ferramenta=ferramenta_1, tipo='CORRETIVA', observacoes='Motor')
+        manutencao_2 = Manutencao.objects.create(ferramenta=ferramenta_2, tipo='CORRETIVA', observacoes='Motor')
+        individual, versoes_individual = self.executar(lambda: self.api.patch(
+            f'/api/manutencoes/{manutencao_1.id}/', {'ativo': False, 'data_fim': self.hoje}, format='json'
+        ))
+        lote, versoes_lote = self.executar(lambda: self.api.post(
+            '/api/manutencoes/finalizar_lote/', {'ids': [manutencao_2.id], 'data_fim': self.hoje}, format='json'
+        ))
+        self.assertEqual(individual.status_code, 200)
+        self.assertEqual(lote.status_code, 200)
+
+        self.assertEqual(self.resumo_manutencao(manutencao_1.id, ferramenta_1), self.resumo_manutencao(manutencao_2.id, ferramenta_2))
+        self.assertEqual(self.estado(ferramenta_1), Ferramenta.EstadoChoices.DISPONIVEL)
+        self.assertEqual(self.estado(ferramenta_2), Ferramenta.EstadoChoices.DISPONIVEL)
+        for manutencao in (manutencao_1, manutencao_2):
+            self.assertTrue(Remocao.objects.filter(tabela='manutencao', objeto_id=manutencao.id, filial_id=self.filial_a.id).exists())
+        self.assertEqual(versoes_individual, versoes_lote)
+        self.assertContadoresCorretos()
+
+    def test_finalizacao_nao_reativa_ferramenta_desativada_durante_a_manutencao(self):
+        manutencao = Manutencao.objects.create(ferramenta=self.ferramentas[0], tipo='PREVENTIVA')
+        Ferramenta.objects.filter(pk=self.ferramentas[0].pk).update(estado=Ferramenta.EstadoChoices.INATIVA)
+        ContadorEstoque.recalcular()
+
+        resposta = self.api.post('/api/manutencoes/finalizar_lote/', {'ids': [manutencao.id, manutencao.id]}, format='json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['finalizados'], 1)
+        manutencao.refresh_from_db()
+        self.assertFalse(manutencao.ativo)
+        self.assertIsNone(manutencao.ferramenta_id)
+        self.assertEqual(manutencao.nome_ferramenta_historico, self.ferramentas[0].nome)
+        self.assertEqual(self.estado(self.ferramentas[0]), Ferramenta.EstadoChoices.INATIVA)
+        self.assertContadoresCorretos()
+
+        repetida = self.api.post('/api/manutencoes/finalizar_lote/', {'ids': [manutencao.id]}, format='json')
+        self.assertEqual(repetida.status_code, 400)
+        self.assertEqual(list(repetida.json()['resultados'][0]['erros']), ['ativo'])
+
+
+# --- ESCOPO DO COORDENADOR ---
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class EscopoConsultasTests(Cenario, TestCase):
+    """
+    As filiais do coordenador vêm do token e são resolvidas uma vez por requisição (escopo.py):
+    a mesma requisição custa as mesmas consultas para o coordenador e para o administrador.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.ferramentas, cls.funcionarios = cls.criar_registros(cls.deposito_a, 4)
+        cls.criar_registros(cls.deposito_b, 3)
+        cls.emprestimo = Emprestimo.objects.get(ferramenta=cls.ferramentas[0])
+        cls.manutencao = Manutencao.objects.get(ferramenta=cls.ferramentas[1])
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def comparar(self, requisicoes):
+        """ Cada requisição (método, url, corpo) feita pelo administrador e pelo coordenador, numa transação desfeita """
+        clientes = {'admin': self.cliente(self.admin), 'coordenador': self.cliente(self.coordenador_a)}
+        for metodo, url, corpo in requisicoes:
+            with self.subTest(metodo=metodo, url=url):
+                contagens = {}
+                for nome, cliente in clientes.items():
+                    caches['referencias'].clear()
+                    with transaction.atomic():
+                        resposta, contagens[nome] = self.consultas(cliente, url, metodo, data=corpo, format='json')
+                        self.assertLess(resposta.status_code, 300, (nome, resposta.content))
+                        transaction.set_rollback(True)
+                self.assertEqual(contagens['coordenador'], contagens['admin'])
+
+    def test_listagens_e_detalhes(self):
+        requisicoes = [('get', url, None) for url in LISTAGENS] + [('get', url + '?page=1', None) for url in LISTAGENS]
+        requisicoes += [
+            ('get', f'/api/ferramentas/{self.ferramentas[2].id}/', None),
+            ('get', f'/api/funcionarios/{self.funcionarios[2].id}/', None),
+            ('get', f'/api/emprestimos/{self.emprestimo.id}/', None),
+            ('get', f'/api/manutencoes/{self.manutencao.id}/', None),
+            ('get', f'/api/depositos/{self.deposito_a.id}/', None),
+            ('get', f'/api/ferramentas/?filial={self.filial_a.id}', None),
+            ('get', '/api/dashboard/', None),
+            ('get', f'/api/dashboard/?filial={self.filial_a.id}', None),
+        ]
+        self.comparar(requisicoes)
+
+    def test_escritas(self):
+        self.comparar([
+            ('post', '/api/ferramentas/', {'nome': 'Furadeira', 'numero_serie': 'FUR-1', 'deposito': self.deposito_a.id}),
+            ('patch', f'/api/ferramentas/{self.ferramentas[2].id}/', {'descricao': 'Revisada', 'deposito': self.deposito_a.id}),
+            ('post', '/api/funcionarios/', {
+                'nome': 'Novo', 'matricula': '99999', 'cpf': gerar_cpf(999_999_990), 'filiais': [self.filial_a.id],
+            }),
+            ('post', '/api/emprestimos/', {'ferramenta': self.ferramentas[2].id, 'funcionario': self.funcionarios[2].id}),
+            ('post', '/api/manutencoes/', {'ferramenta': self.ferramentas[3].id, 'tipo': 'CORRETIVA'}),
+            ('post', '/api/emprestimos/devolver_lote/', {'ids': [self.emprestimo.id]}),
+            ('post', '/api/manutencoes/finalizar_lote/', {'ids': [self.manutencao.id]}),
+        ])
+
+
+# --- ETAG / VERSÕES ---
+
+@override_settings(CACHES=CACHES_DE_TESTE)
+class ETagTests(Cenario, TestCase):
+    """ 304 sem a consulta principal, e ETag nova só para quem enxerga a alteração """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.criar_cenario()
+        cls.ferramentas, cls.funcionarios = cls.criar_registros(cls.deposito_a, 3)
+        cls.criar_registros(cls.deposito_b, 3)
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.api = self.cliente(self.admin)
+
+    def etag(self, cliente, url):
+        resposta = cliente.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta['ETag']
+
+    def revalidar(self, cliente, url, etag):
+        return self.consultas(cliente, url, HTTP_IF_NONE_MATCH=etag)
+
+    def escrever(self, metodo, url, corpo):
+        """ Escrita com os on_commit executados (o incremento das versões acontece depois do commit) """
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = getattr(self.api, metodo)(url, corpo, format='json')
+        self.assertLess(resposta.status_code, 300, resposta.content)
+        return resposta
+
+    def test_304_custa_no_maximo_uma_consulta(self):
+        urls = [
+            '/api/ferramentas/', '/api/funcionarios/', '/api/emprestimos/', '/api/manutencoes/',
+            f'/api/ferramentas/{self.ferramentas[0].id}/', f'/api/emprestimos/?page=1&page_size=2',
+        ]
+        for usuario in (self.admin, self.coordenador_a):
+            cliente = self.cliente(usuario)
+            for url in urls:
+                with self.subTest(tipo=usuario.tipo, url=url):
+                    resposta, consultas = self.revalidar(cliente, url, self.etag(cliente, url))
+                    self.assertEqual(resposta.status_code, 304)
+                    self.assertEqual(resposta.content, b'')
+                    self.assertLessEqual(consultas, 1)
+
+    def test_304_das_referencias_em_cache_sem_consulta(self):
+        for url in ('/api/filiais/', '/api/depositos/', '/api/setores/', '/api/cargos/'):
+            with self.subTest(url=url):
+                resposta, consultas = self.revalidar(self.api, url, self.etag(self.api, url))
+                self.assertEqual(resposta.status_code, 304)
+                self.assertEqual(consultas, 0)
+
+    def test_escrita_muda_a_etag(self):
+        url = '/api/ferramentas/'
+        etag = self.etag(self.api, url)
+        self.escrever('post', url, {'nome': 'Esmerilhadeira', 'numero_serie': 'ESM-1', 'deposito': self.deposito_a.id})
+        resposta, _ = self.revalidar(self.api, url, etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+        self.assertIn('ESM-1', [ferramenta['numero_serie'] for ferramenta in resposta.json()])
+
+    def test_escrita_numa_filial_so_invalida_quem_a_enxerga(self):
+        url = '/api/ferramentas/'
+        cliente_a, cliente_b = self.cliente(self.coordenador_a), self.cliente(self.coordenador_b)
+        etags = {'admin': self.etag(self.api, url), 'a': self.etag(cliente_a, url), 'b': self.etag(cliente_b, url)}
+
+        self.escrever('patch', f'/api/ferramentas/{self.ferramentas[2].id}/', {'descricao': 'Revisada', 'deposito': self.deposito_a.id})
+
+        self.assertEqual(self.revalidar(self.api, url, etags['admin'])[0].status_code, 200) # Soma das versões das filiais
+        self.assertEqual(self.revalidar(cliente_a, url, etags['a'])[0].status_code, 200)
+        self.assertEqual(self.revalidar(cliente_b, url, etags['b'])[0].status_code, 304)
+
+    def test_emprestimo_invalida_emprestimos_e_ferramentas(self):
+        cliente_a = self.cliente(self.coordenador_a)
+        urls = ['/api/emprestimos/', '/api/ferramentas/', f'/api/ferramentas/{self.ferramentas[2].id}/']
+        etags = {url: self.etag(cliente_a, url) for url in urls}
+        self.escrever('post', '/api/emprestimos/lote/', {'itens': [{'ferramenta': self.ferramentas[2].id, 'funcionario': self.funcionarios[2].id}]})
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidar(cliente_a, url, etags[url])[0].status_code, 200)
+
+    def test_finalizacao_individual_invalida_a_filial_da_ferramenta(self):
+        # Ferramenta desativada durante o empréstimo: a devolução não muda o estado dela,
+        # e a saída do empréstimo da listagem da filial tem que mudar a ETag sozinha
+        ferramenta = self.ferramentas[0]
+        emprestimo = Emprestimo.objects.get(ferramenta=ferramenta, ativo=True)
+        Ferramenta.objects.filter(pk=ferramenta.pk).update(estado=Ferramenta.EstadoChoices.INATIVA)
+        ContadorEstoque.recalcular()
+
+        url = '/api/emprestimos/?ativo=true'
+        cliente_a, cliente_b = self.cliente(self.coordenador_a), self.cliente(self.coordenador_b)
+        etag_a, etag_b = self.etag(cliente_a, url), self.etag(cliente_b, url)
+        self.escrever('patch', f'/api/emprestimos/{emprestimo.id}/', {'ativo': False})
+
+        resposta, _ = self.revalidar(cliente_a, url, etag_a)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn(emprestimo.id, [item['id'] for item in resposta.json()])
+        self.assertEqual(self.revalidar(cliente_b, url, etag_b)[0].status_code, 304)
+
+    def test_alteracao_desfeita_nao_muda_a_etag(self):
+        url = '/api/ferramentas/'
+        etag = self.etag(self.api, url)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Ferramenta.objects.create(nome='Serra', numero_serie='SER-1', deposito=self.deposito_a)
+                transaction.set_rollback(True)
+        self.assertEqual(self.revalidar(self.api, url, etag)[0].status_code, 304)
+
+    def test_referencia_em_cache_invalidada_pela_escrita(self):
+        url = '/api/depositos/'
+        etag = self.etag(self.api, url)
+        self.escrever('post', url, {'nome': 'Depósito Novo', 'filial': self.filial_a.id})
+        resposta, _ = self.revalidar(self.api, url, etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('Depósito Novo', [deposito['nome'] for deposito in resposta.json()])
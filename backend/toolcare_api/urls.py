@@ -1,11 +1,11 @@
-from .views import DashboardView
+from .views import DashboardView, SaudeView, servir_midia, exportar_metricas
 from django.contrib import admin
-from django.urls import path, include 
+from django.urls import path, re_path, include 
 from rest_framework.routers import DefaultRouter
 from django.conf import settings
 from .views import CustomTokenObtainPairView
-from django.conf.urls.static import static
 from .views import FilialViewSet, DepositoViewSet, SetorViewSet, CargoViewSet, FuncionarioViewSet, FerramentaViewSet, EmprestimoViewSet, ManutencaoViewSet, UsuarioViewSet
+from .views_async import DashboardAsyncView, FerramentaListaAsyncView, EmprestimoListaAsyncView, EventosAsyncView
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -26,6 +26,14 @@ router.register(r'usuarios', UsuarioViewSet)
 urlpatterns = [
     path('admin/', admin.site.urls),
     
+    # Leitura assíncrona (ASGI): mesmos parâmetros e respostas das rotas equivalentes abaixo
+    path('api/async/dashboard/', DashboardAsyncView.as_view(), name='dashboard_async'),
+    path('api/async/ferramentas/', FerramentaListaAsyncView.as_view(), name='ferramentas_async'),
+    path('api/async/emprestimos/', EmprestimoListaAsyncView.as_view(), name='emprestimos_async'),
+
+    # Mudanças de estado das ferramentas em tempo real (Server-Sent Events, somente ASGI)
+    path('api/eventos/', EventosAsyncView.as_view(), name='eventos'),
+
     path('api/', include(router.urls)),
     
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -34,8 +42,29 @@ urlpatterns = [
     
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
 
-    path('api/dashboard/', DashboardView.as_view(), name='dashboard')
+    path('api/dashboard/', DashboardView.as_view(), name='dashboard'),
+
+    path('api/saude/', SaudeView.as_view(), name='saude')
 ]
 
+# Fotos e variantes, com cabeçalhos de cache (ver servir_midia). Só em desenvolvimento (DEBUG):
+# em produção cada arquivo ocuparia um worker do Django. O nginx serve o MEDIA_ROOT direto,
+# com a mesma regra de cache (nomes pelo hash do conteúdo são imutáveis, ver armazenamento.py):
+#
+#   location /media/ {
+#       root /app;  # MEDIA_ROOT = /app/media na imagem do backend (volume compartilhado com o nginx)
+#       add_header Cache-Control "no-cache";
+#       location ~ "/[0-9a-f]{64}(_[a-z]+)?\.[0-9a-z]+$" {
+#           add_header Cache-Control "public, max-age=31536000, immutable";
+#       }
+#   }
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.*)$', servir_midia, name='midia'),
+    ]
+
+# Métricas para o Prometheus (ver metricas.py)
+if settings.METRICAS:
+    urlpatterns += [
+        path('metrics', exportar_metricas, name='metricas'),
+    ]
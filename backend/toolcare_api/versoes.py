@@ -0,0 +1,114 @@
+import hashlib
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+from .escopo import obter_escopo
+from .models import Cargo, Deposito, Emprestimo, Ferramenta, Filial, Funcionario, Manutencao, Setor, Usuario, VersaoTabela
+
+# --- ETAG POR VERSÃO DAS TABELAS ---
+# Cada listagem/detalhe declara de quais tabelas os seus dados dependem (ex: ferramentas
+# mostram o nome do depósito e da filial). A ETag é o hash das versões dessas tabelas
+# (ver VersaoTabela), do usuário e da URL: se nada mudou, a resposta é 304 e custa
+# uma consulta (a das versões), sem a consulta principal nem o serializer.
+
+# Incrementar ao mudar o formato das respostas (campos dos serializers), para que as
+# ETags emitidas pela versão anterior do sistema deixem de valer
+VERSAO_FORMATO = 1
+
+
+def filiais_da_requisicao(request):
+    """ Filiais que limitam o que a requisição enxerga (lista ordenada), ou None se não houver restrição """
+    escopo = obter_escopo(request)
+    return sorted(escopo.filial_ids) if escopo.restrito else None
+
+
+def _montar_etag(request, versoes):
+    renderizador = getattr(request, 'accepted_renderer', None)
+    partes = [
+        VERSAO_FORMATO, request.user.id, request.get_full_path(), getattr(renderizador, 'format', ''),
+        sorted(versoes.items()),
+    ]
+    return f'W/"{hashlib.sha1(repr(partes).encode()).hexdigest()}"'
+
+
+def etag_da_requisicao(request, tabelas):
+    return _montar_etag(request, VersaoTabela.versoes(tabelas, filiais_da_requisicao(request)))
+
+
+async def aetag_da_requisicao(request, tabelas):
+    escopo = obter_escopo(request)
+    await escopo.acarregar()
+    return _montar_etag(request, await VersaoTabela.aversoes(tabelas, filiais_da_requisicao(request)))
+
+
+def nao_modificado(request, etag):
+    """ True se o cliente já tem a representação com esta ETag (If-None-Match, comparação fraca) """
+    enviadas = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in enviadas or any(enviada.removeprefix('W/') == etag.removeprefix('W/') for enviada in enviadas)
+
+
+def aplicar_etag(resposta, etag):
+    """ ETag + revalidação obrigatória: o navegador guarda a resposta e sempre pergunta se mudou """
+    resposta['ETag'] = etag
+    patch_cache_control(resposta, private=True, no_cache=True)
+    patch_vary_headers(resposta, ['Authorization'])
+    return resposta
+
+
+# --- REGISTRO DAS ALTERAÇÕES (SINAIS) ---
+# save()/delete() de qualquer origem (API, admin, comandos) e alterações de ManyToMany.
+# UPDATEs em massa (QuerySet.update, bulk_create) não disparam sinais: quem os faz
+# chama VersaoTabela.registrar_alteracao diretamente (ver views.py e Ferramenta.transicionar).
+
+def _alteracao(sender, **kwargs):
+    # Tabelas sem filial, e depósitos/funcionários (escritas raras): vale para todas as filiais
+    VersaoTabela.registrar_alteracao(sender._meta.model_name)
+
+
+def _alteracao_ferramenta(sender, instance, **kwargs):
+    # Depósito atual e o gravado antes (ferramenta transferida muda a listagem das duas filiais)
+    depositos = {instance.deposito_id}
+    if instance._contagem_original is not None:
+        depositos.add(instance._contagem_original[0])
+    VersaoTabela.registrar_alteracao('ferramenta', depositos=depositos)
+
+
+def _alteracao_por_ferramenta(sender, instance, **kwargs):
+    # Empréstimo/manutenção: a filial é a da ferramenta vinculada.
+    # Finalizado agora: sai da listagem da filial da ferramenta que acabou de ser desvinculada
+    # (a mesma versão que a devolução/finalização em lote incrementa).
+    # Sem ferramenta nenhuma, o registro só aparece para Admin/Máximo: basta a versão global.
+    tabela = sender._meta.model_name
+    if instance.ferramenta_id is None:
+        VersaoTabela.registrar_alteracao(tabela, depositos=[instance._deposito_da_saida] if instance._deposito_da_saida else ())
+    elif sender.ferramenta.is_cached(instance):
+        VersaoTabela.registrar_alteracao(tabela, depositos=[instance.ferramenta.deposito_id])
+    else:
+        VersaoTabela.registrar_alteracao(tabela)
+
+
+for model, receptor in [
+    (Filial, _alteracao), (Deposito, _alteracao), (Setor, _alteracao), (Cargo, _alteracao),
+    (Usuario, _alteracao), (Funcionario, _alteracao), (Ferramenta, _alteracao_ferramenta),
+    (Emprestimo, _alteracao_por_ferramenta), (Manutencao, _alteracao_por_ferramenta),
+]:
+    post_save.connect(receptor, sender=model, dispatch_uid=f'versao_{model._meta.model_name}_save')
+    post_delete.connect(receptor, sender=model, dispatch_uid=f'versao_{model._meta.model_name}_delete')
+
+
+# Tabela de intermediação das filiais -> tabela cuja listagem muda
+_TABELA_DAS_FILIAIS = {
+    Funcionario.filiais.through: 'funcionario',
+    Usuario.filiais.through: 'usuario',
+}
+
+
+def _alteracao_filiais(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        VersaoTabela.registrar_alteracao(_TABELA_DAS_FILIAIS[sender])
+
+
+for intermediaria, tabela in _TABELA_DAS_FILIAIS.items():
+    m2m_changed.connect(_alteracao_filiais, sender=intermediaria, dispatch_uid=f'versao_{tabela}_filiais')
@@ -1,20 +1,172 @@
 from rest_framework import viewsets, status, filters
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db import transaction
-from django.db.models import Q  
+from django.db import transaction, connection, DatabaseError
+from django.db.models import Q, F, Count, Sum, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Now
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+from django.http import HttpResponse, JsonResponse
+import hmac
 import re
+import datetime
 
-from .models import Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao
+from .models import Usuario, Filial, Deposito, Setor, Cargo, Funcionario, Ferramenta, Emprestimo, Manutencao, ContadorEstoque, VersaoTabela, Remocao, reservar_ids, publicar_estado_ferramentas
 from .serializers import (
     CustomTokenObtainPairSerializer, UsuarioSerializer, FilialSerializer, 
     DepositoSerializer, SetorSerializer, CargoSerializer, FuncionarioSerializer, 
-    FerramentaSerializer, EmprestimoSerializer, ManutencaoSerializer
+    FerramentaSerializer, EmprestimoSerializer, EmprestimoLoteItemSerializer, DevolucaoLoteSerializer,
+    ManutencaoSerializer, FinalizacaoManutencaoLoteSerializer
 )
 from .permissions import IsAdminOrMaximo, UsuarioPermissions, ReadOnly
+from .exportacao import resposta_exportacao
+from .escopo import obter_escopo
+from .armazenamento import eh_imutavel
+from .versoes import etag_da_requisicao, nao_modificado, aplicar_etag, filiais_da_requisicao
+from .cache_referencias import chave_da_listagem, obter_listagem, guardar_listagem
+from .sincronizacao import responder_sincronizacao
+from .metricas import gerar_exposicao
+
+# --- CARREGAMENTO ANTECIPADO (EVITA N+1) ---
+
+class CarregamentoAntecipadoMixin:
+    """
+    Aplica ao queryset da viewset as relações que o serializer declara ler
+    (Meta.select_related / Meta.prefetch_related), para que a listagem não faça
+    uma consulta extra por linha ao acessar chaves estrangeiras e ManyToMany.
+    """
+    def filter_queryset(self, queryset):
+        return self.carregar_relacoes(super().filter_queryset(queryset))
+
+    def carregar_relacoes(self, queryset):
+        meta = self.get_serializer_class().Meta
+        select_related = getattr(meta, 'select_related', None)
+        prefetch_related = getattr(meta, 'prefetch_related', None)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+# --- CACHE HTTP (ETAG) ---
+
+class ETagPorVersaoMixin:
+    """
+    Listagem e detalhe com ETag calculada pelas versões das tabelas em 'tabelas_versionadas'
+    (ver versoes.py). Com If-None-Match igual à ETag atual, responde 304 sem executar
+    a consulta principal nem o serializer: o custo é uma consulta (a das versões).
+    """
+    tabelas_versionadas = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._responder_com_etag(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._responder_com_etag(super().retrieve, request, *args, **kwargs)
+
+    def _responder_com_etag(self, responder, request, *args, **kwargs):
+        # Versões lidas ANTES da consulta principal: uma escrita no meio do caminho
+        # gera, no máximo, uma ETag velha para dados novos (o cliente só busca de novo)
+        etag = etag_da_requisicao(request, self.tabelas_versionadas)
+        if nao_modificado(request, etag):
+            return aplicar_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        resposta = responder(request, *args, **kwargs)
+        if resposta.status_code == status.HTTP_200_OK:
+            aplicar_etag(resposta, etag)
+        return resposta
+
+
+# Cabeçalhos que não vão para o cache de referências: aplicar_etag e o DRF os montam de novo a cada resposta
+CABECALHOS_RECALCULADOS = {'etag', 'cache-control', 'vary', 'content-type', 'allow'}
+
+
+class CacheReferenciaMixin:
+    """
+    Listagem guardada no cache de referências (ver cache_referencias.py), com a ETag da resposta original.
+    Com a listagem no cache não há consulta principal nem serializer (nem consulta alguma, para usuário JWT).
+    Vem antes de ETagPorVersaoMixin: na falta, a listagem segue o caminho normal e é guardada.
+    """
+    def list(self, request, *args, **kwargs):
+        filial_ids = filiais_da_requisicao(request)
+        chave = chave_da_listagem(
+            VersaoTabela.chaves_versoes(self.tabelas_versionadas, filial_ids),
+            filial_ids, request.build_absolute_uri(), request.accepted_renderer.format,
+        )
+        guardada = obter_listagem(chave)
+        if guardada is not None:
+            etag, dados, cabecalhos = guardada
+            if nao_modificado(request, etag):
+                return aplicar_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+            return aplicar_etag(Response(dados, headers=cabecalhos), etag)
+
+        resposta = super().list(request, *args, **kwargs)
+        if resposta.status_code == status.HTTP_200_OK and resposta.has_header('ETag'):
+            # Cabeçalhos da listagem (ex: X-Resultado-Truncado da paginação) voltam junto com os dados
+            cabecalhos = {nome: valor for nome, valor in resposta.items() if nome.lower() not in CABECALHOS_RECALCULADOS}
+            guardar_listagem(chave, resposta['ETag'], resposta.data, cabecalhos)
+        return resposta
+
+
+# --- SINCRONIZAÇÃO INCREMENTAL ---
+
+class SincronizacaoIncrementalMixin:
+    """
+    ?atualizado_desde=<cursor> na listagem: só as linhas alteradas e os ids removidos
+    desde a última sincronização do cliente (ver sincronizacao.py).
+    'caminho_filial': lookup até a filial, para o escopo do coordenador.
+    """
+    caminho_filial = None
+
+    def list(self, request, *args, **kwargs):
+        if 'atualizado_desde' in request.query_params:
+            return responder_sincronizacao(self, request)
+        return super().list(request, *args, **kwargs)
+
+
+# --- OPERAÇÕES EM LOTE ---
+
+def campo_da_ferramenta(campo):
+    """ Subquery: valor de 'campo' na ferramenta vinculada à linha atualizada (para UPDATEs em massa) """
+    return Subquery(Ferramenta.objects.filter(id=OuterRef('ferramenta_id')).values(campo)[:1])
+
+def campo_do_funcionario(campo):
+    return Subquery(Funcionario.objects.filter(id=OuterRef('funcionario_id')).values(campo)[:1])
+
+def liberar_ferramentas(ferramenta_ids, estado_origem):
+    """
+    Libera (estado_origem -> DISPONIVEL) as ferramentas com um UPDATE só e ajusta os contadores de estoque.
+    Mesma trava do Ferramenta.transicionar: só muda as que ainda estão em estado_origem
+    (ex: ferramenta desativada enquanto emprestada continua INATIVA).
+    Deve ser chamada dentro de uma transação. Retorna os ids dos depósitos de todas as ferramentas recebidas.
+    """
+    ferramentas = list(
+        Ferramenta.objects.select_for_update().filter(id__in=ferramenta_ids).only('id', 'deposito_id', 'estado')
+    )
+    # Linhas travadas: o estado lido é o atual, e o UPDATE abaixo altera exatamente estas
+    liberadas = [ferramenta for ferramenta in ferramentas if ferramenta.estado == estado_origem]
+    if liberadas:
+        Ferramenta.objects.filter(id__in=[ferramenta.id for ferramenta in liberadas], estado=estado_origem).update(
+            estado=Ferramenta.EstadoChoices.DISPONIVEL, atualizado_em=Now()
+        )
+        ContadorEstoque.registrar_transicao_em_massa(liberadas, estado_origem, Ferramenta.EstadoChoices.DISPONIVEL)
+        VersaoTabela.registrar_alteracao('ferramenta', depositos={ferramenta.deposito_id for ferramenta in liberadas})
+        publicar_estado_ferramentas(
+            [(ferramenta.id, ferramenta.deposito_id) for ferramenta in liberadas], Ferramenta.EstadoChoices.DISPONIVEL
+        )
+    return {ferramenta.deposito_id for ferramenta in ferramentas}
+
+def resposta_finalizacao_lote(resultados):
+    finalizados = sum(1 for resultado in resultados if resultado['status'] == 'finalizado')
+    return Response(
+        {'finalizados': finalizados, 'falhas': len(resultados) - finalizados, 'resultados': resultados},
+        status=status.HTTP_200_OK if finalizados else status.HTTP_400_BAD_REQUEST
+    )
+
 
 # --- DASHBOARD (VISÃO GERAL) ---
 
@@ -22,77 +174,171 @@ class DashboardView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        
-        # Filtro opcional vindo do frontend
-        filial_id_param = request.query_params.get('filial')
-        
+        escopo_filiais, erro = self.resolver_escopo(obter_escopo(request), request.query_params.get('filial'))
+        if erro:
+            return Response({"error": erro[0]}, status=erro[1])
+
+        # --- CONSULTAS FILTRADAS PELO ESCOPO ---
+        # Duas consultas agregadas no total (uma por tabela), em vez de um COUNT por indicador.
+        consulta_ferramentas, agregados_ferramentas = self.consulta_ferramentas(escopo_filiais)
+        consulta_funcionarios, agregados_funcionarios = self.consulta_funcionarios(escopo_filiais)
+
+        return Response(self.montar_resposta(
+            consulta_ferramentas.aggregate(**agregados_ferramentas),
+            consulta_funcionarios.aggregate(**agregados_funcionarios),
+        ))
+
+    # As etapas abaixo não executam consultas (só montam querysets e o payload);
+    # são compartilhadas com a versão assíncrona (views_async.DashboardAsyncView).
+
+    @staticmethod
+    def resolver_escopo(escopo, filial_id_param):
+        """
+        Filiais consideradas no dashboard.
+        Retorna (queryset_de_filiais, None) ou (None, (mensagem_de_erro, status)).
+        """
         # Define o escopo base de filiais
-        if user.tipo == 'COORDENADOR':
-            filiais_permitidas = user.filiais.all()
+        if escopo.restrito:
+            filiais_permitidas = escopo.filiais
         else:
             # Admin/Maximo vê todas
             filiais_permitidas = Filial.objects.filter(ativo=True)
 
         # Se o usuário escolheu uma filial específica
         if filial_id_param:
+            try:
+                filial_id_param = int(filial_id_param)
+            except ValueError:
+                return None, ("Filial inválida.", status.HTTP_400_BAD_REQUEST)
+
             # Garante que o coordenador não acesse filial alheia
-            if user.tipo == 'COORDENADOR' and not filiais_permitidas.filter(id=filial_id_param).exists():
-                return Response({"error": "Acesso negado a esta filial."}, status=status.HTTP_403_FORBIDDEN)
+            if not escopo.permite_filial(filial_id_param):
+                return None, ("Acesso negado a esta filial.", status.HTTP_403_FORBIDDEN)
             
             # Restringe o escopo para UMA única filial
-            escopo_filiais = Filial.objects.filter(id=filial_id_param)
-        else:
-            # Usa todas as permitidas (Visão Geral)
-            escopo_filiais = filiais_permitidas
-
-        # --- CONSULTAS FILTRADAS PELO ESCOPO ---
-
-        # 1. Total Funcionários (Ativos e vinculados às filiais do escopo)
-        total_funcionarios = Funcionario.objects.filter(
-            filiais__in=escopo_filiais, 
-            ativo=True
-        ).distinct().count()
-
-        # 2. Total Ferramentas (Ativas e nos depósitos das filiais do escopo)
-        queryset_ferramentas = Ferramenta.objects.filter(
-            deposito__filial__in=escopo_filiais
-        ).exclude(estado='INATIVA')
-        
-        total_ferramentas = queryset_ferramentas.count()
+            return Filial.objects.filter(id=filial_id_param), None
 
-        # 3. Status das Ferramentas
-        ferramentas_disponiveis = queryset_ferramentas.filter(estado='DISPONIVEL').count()
-        ferramentas_emprestadas = queryset_ferramentas.filter(estado='EMPRESTADA').count()
-        ferramentas_manutencao = queryset_ferramentas.filter(estado='EM_MANUTENCAO').count()
+        # Usa todas as permitidas (Visão Geral)
+        return filiais_permitidas, None
 
-        # 4. Funcionários com Empréstimo (A LÓGICA CRÍTICA)
-        # Conta quantos funcionários têm empréstimo ativo DE UMA FERRAMENTA DESSAS FILIAIS
-        funcs_com_emprestimo = Emprestimo.objects.filter(
-            ferramenta__deposito__filial__in=escopo_filiais,
-            ativo=True,
-            funcionario__ativo=True
-        ).values('funcionario').distinct().count()
+    @staticmethod
+    def montar_resposta(contagem_ferramentas, contagem_funcionarios):
+        total_funcionarios = contagem_funcionarios['total']
+        funcs_com_emprestimo = contagem_funcionarios['com_emprestimo']
 
-        # 5. Cálculo Matemático
+        # Cálculo Matemático
         funcs_sem_emprestimo = total_funcionarios - funcs_com_emprestimo
         if funcs_sem_emprestimo < 0: funcs_sem_emprestimo = 0
 
-        data = {
+        return {
             'total_funcionarios': total_funcionarios,
-            'total_ferramentas': total_ferramentas,
+            'total_ferramentas': contagem_ferramentas['total'],
             'funcionarios': {
                 'com_emprestimo': funcs_com_emprestimo,
                 'sem_emprestimo': funcs_sem_emprestimo
             },
             'ferramentas': {
-                'disponiveis': ferramentas_disponiveis,
-                'emprestadas': ferramentas_emprestadas,
-                'manutencao': ferramentas_manutencao
+                'disponiveis': contagem_ferramentas['disponiveis'],
+                'emprestadas': contagem_ferramentas['emprestadas'],
+                'manutencao': contagem_ferramentas['manutencao']
             }
         }
-        
-        return Response(data)
+
+    @staticmethod
+    def consulta_ferramentas(escopo_filiais):
+        """
+        Totais de ferramentas (ativas) por estado em UMA consulta sobre o ContadorEstoque:
+        lê uma linha por (depósito, estado) em vez de varrer as ferramentas.
+        Retorna (queryset, agregados) para ser executado com aggregate() / aaggregate().
+        """
+        consulta = ContadorEstoque.objects.filter(deposito__filial__in=escopo_filiais).exclude(estado='INATIVA')
+        return consulta, {
+            'total': Coalesce(Sum('quantidade'), 0),
+            'disponiveis': Coalesce(Sum('quantidade', filter=Q(estado='DISPONIVEL')), 0),
+            'emprestadas': Coalesce(Sum('quantidade', filter=Q(estado='EMPRESTADA')), 0),
+            'manutencao': Coalesce(Sum('quantidade', filter=Q(estado='EM_MANUTENCAO')), 0),
+        }
+
+    @staticmethod
+    def consulta_funcionarios(escopo_filiais):
+        """
+        Total de funcionários ativos do escopo e quantos deles têm empréstimo ativo
+        de uma ferramenta do escopo, em UMA consulta (retorna queryset e agregados).
+        Os EXISTS evitam o JOIN com a tabela de filiais (e o DISTINCT que ele exigiria).
+        """
+        vinculado_ao_escopo = Exists(
+            Funcionario.filiais.through.objects.filter(
+                funcionario_id=OuterRef('pk'),
+                filial__in=escopo_filiais
+            )
+        )
+        # Conta quantos funcionários têm empréstimo ativo DE UMA FERRAMENTA DESSAS FILIAIS
+        tem_emprestimo_no_escopo = Exists(
+            Emprestimo.objects.filter(
+                funcionario_id=OuterRef('pk'),
+                ativo=True,
+                ferramenta__deposito__filial__in=escopo_filiais
+            )
+        )
+        return Funcionario.objects.filter(ativo=True), {
+            'total': Count('id', filter=Q(vinculado_ao_escopo)),
+            'com_emprestimo': Count('id', filter=Q(tem_emprestimo_no_escopo)),
+        }
+
+# --- SAÚDE (HEALTH CHECK) ---
+
+class SaudeView(APIView):
+    """
+    Health check usado pelo Docker/orquestrador: responde sem autenticação
+    e confirma que o processo alcança o banco (SELECT 1).
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return Response({"status": "indisponivel", "error": "Banco de dados inacessível."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"status": "ok"})
+
+
+# --- ARQUIVOS DE MÍDIA ---
+
+# Um ano: o máximo recomendado para 'max-age'
+CACHE_MIDIA_IMUTAVEL = 60 * 60 * 24 * 365
+
+def servir_midia(request, path):
+    """
+    Serve os arquivos de MEDIA_ROOT (fotos e variantes).
+    Arquivos nomeados pelo hash do conteúdo (ver armazenamento.py) nunca mudam:
+    vão com cache 'immutable' de um ano, e o navegador nem revalida.
+    Os demais (fotos padrão e fotos antigas ainda não migradas) seguem com revalidação (If-Modified-Since).
+    Só é roteada com DEBUG: em produção o nginx serve /media/ com a mesma regra (ver urls.py).
+    """
+    resposta = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if eh_imutavel(path):
+        patch_cache_control(resposta, public=True, max_age=CACHE_MIDIA_IMUTAVEL, immutable=True)
+    else:
+        patch_cache_control(resposta, no_cache=True)
+    return resposta
+
+
+# --- MÉTRICAS ---
+
+def exportar_metricas(request):
+    """
+    Métricas no formato texto do Prometheus (ver metricas.py). Fora da autenticação JWT:
+    o coletor usa o token fixo METRICAS_TOKEN, quando definido.
+    """
+    if settings.METRICAS_TOKEN:
+        autorizacao = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(autorizacao.encode(), f'Bearer {settings.METRICAS_TOKEN}'.encode()):
+            return JsonResponse({"error": "Token de métricas inválido."}, status=status.HTTP_401_UNAUTHORIZED)
+    conteudo, tipo = gerar_exposicao()
+    return HttpResponse(conteudo, content_type=tipo)
+
 
 # --- AUTENTICAÇÃO ---
 
@@ -103,7 +349,8 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 # --- VIEWSETS (CRUD) ---
 
-class UsuarioViewSet(viewsets.ModelViewSet):
+class UsuarioViewSet(ETagPorVersaoMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('usuario', 'filial')
     queryset = Usuario.objects.all().order_by('nome')
     serializer_class = UsuarioSerializer
     # Permissões complexas (ver permissions.py): 
@@ -142,20 +389,17 @@ class UsuarioViewSet(viewsets.ModelViewSet):
         return queryset.distinct()
     
 
-class FilialViewSet(viewsets.ModelViewSet):
+class FilialViewSet(CacheReferenciaMixin, ETagPorVersaoMixin, SincronizacaoIncrementalMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('filial',)
+    caminho_filial = 'id'
     serializer_class = FilialSerializer
     permission_classes = [IsAuthenticated, IsAdminOrMaximo|ReadOnly]
     queryset = Filial.objects.all()
     search_fields = ['nome', 'cidade']
 
     def get_queryset(self):
-        user = self.request.user
-        
         # REGRA: Coordenador vê apenas suas próprias filiais
-        if user.tipo == 'COORDENADOR':
-            queryset = user.filiais.all().order_by('nome')
-        else:
-            queryset = Filial.objects.all().order_by('nome')
+        queryset = obter_escopo(self.request).filiais.order_by('nome')
 
         if self.request.query_params.get('somente_ativos') == 'true':
             queryset = queryset.filter(ativo=True)
@@ -199,28 +443,31 @@ class FilialViewSet(viewsets.ModelViewSet):
         with transaction.atomic():
             filial.ativo = False
             filial.save()
-            filial.depositos.update(ativo=False)
+            filial.depositos.update(ativo=False, atualizado_em=Now())
             # Ferramentas disponíveis viram INATIVA
-            Ferramenta.objects.filter(deposito__filial=filial).update(estado='INATIVA')
+            ferramentas = Ferramenta.objects.filter(deposito__filial=filial)
+            publicar_estado_ferramentas(ferramentas.exclude(estado='INATIVA').values_list('id', 'deposito_id'), 'INATIVA')
+            ferramentas.update(estado='INATIVA', atualizado_em=Now())
+            VersaoTabela.registrar_alteracao(['deposito', 'ferramenta'], filiais=[filial.id])
+            # O update em massa não passa pelo save(): recalcula os contadores da filial
+            ContadorEstoque.recalcular(depositos=filial.depositos.all())
             # Funcionários são desvinculados
             filial.funcionarios.clear() 
 
         return Response({"status": "Filial e itens associados desativados com sucesso."})
 
 
-class DepositoViewSet(viewsets.ModelViewSet):
+class DepositoViewSet(CacheReferenciaMixin, ETagPorVersaoMixin, SincronizacaoIncrementalMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('deposito', 'filial')
+    caminho_filial = 'filial'
     serializer_class = DepositoSerializer
     permission_classes = [IsAuthenticated, IsAdminOrMaximo|ReadOnly]
     queryset = Deposito.objects.all()
     search_fields = ['nome', 'filial__nome', 'filial__cidade']
 
     def get_queryset(self):
-        user = self.request.user
-        
-        if user.tipo == 'COORDENADOR':
-            queryset = Deposito.objects.filter(filial__in=user.filiais.all()).order_by('nome')
-        else:
-            queryset = Deposito.objects.all().order_by('nome')
+        # REGRA: Coordenador vê apenas os depósitos das suas filiais
+        queryset = obter_escopo(self.request).filtrar(Deposito.objects.all(), 'filial').order_by('nome')
 
         if self.request.query_params.get('somente_ativos') == 'true':
             queryset = queryset.filter(ativo=True)
@@ -258,12 +505,17 @@ class DepositoViewSet(viewsets.ModelViewSet):
         with transaction.atomic():
             deposito.ativo = False
             deposito.save()
-            Ferramenta.objects.filter(deposito=deposito).update(estado='INATIVA')
+            ferramentas = Ferramenta.objects.filter(deposito=deposito)
+            publicar_estado_ferramentas(ferramentas.exclude(estado='INATIVA').values_list('id', 'deposito_id'), 'INATIVA')
+            ferramentas.update(estado='INATIVA', atualizado_em=Now())
+            ContadorEstoque.recalcular(depositos=[deposito])
+            VersaoTabela.registrar_alteracao('ferramenta', depositos=[deposito.id])
 
         return Response({"status": "Depósito e ferramentas associadas desativados com sucesso."})
 
 
-class SetorViewSet(viewsets.ModelViewSet):
+class SetorViewSet(CacheReferenciaMixin, ETagPorVersaoMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('setor',)
     queryset = Setor.objects.all().order_by('nome_setor')
     serializer_class = SetorSerializer
     permission_classes = [IsAuthenticated, IsAdminOrMaximo|ReadOnly]
@@ -279,7 +531,8 @@ class SetorViewSet(viewsets.ModelViewSet):
             
         return queryset
 
-class CargoViewSet(viewsets.ModelViewSet):
+class CargoViewSet(CacheReferenciaMixin, ETagPorVersaoMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('cargo',)
     queryset = Cargo.objects.all().order_by('nome_cargo')
     serializer_class = CargoSerializer
     permission_classes = [IsAuthenticated, IsAdminOrMaximo|ReadOnly]
@@ -296,7 +549,9 @@ class CargoViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class FuncionarioViewSet(viewsets.ModelViewSet):
+class FuncionarioViewSet(ETagPorVersaoMixin, SincronizacaoIncrementalMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('funcionario', 'filial', 'setor', 'cargo')
+    caminho_filial = 'filiais'
     serializer_class = FuncionarioSerializer
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'put', 'patch', 'head', 'options']
@@ -329,12 +584,12 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
         return Response({"status": "Funcionário reativado com sucesso"})
 
     def get_queryset(self):
-        user = self.request.user
         queryset = Funcionario.objects.all().order_by('nome')
 
         # REGRA: Coordenador só vê funcionários de suas filiais
-        if user.tipo == 'COORDENADOR':
-            queryset = queryset.filter(filiais__in=user.filiais.all()).distinct()
+        escopo = obter_escopo(self.request)
+        if escopo.restrito:
+            queryset = escopo.filtrar(queryset, 'filiais').distinct()
 
         # Filtro de Filial (Dropdown)
         filial_id = self.request.query_params.get('filial')
@@ -346,13 +601,14 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
         search_value = self.request.query_params.get('search_value')
 
         if search_field and search_value:
+            # '__busca' ignora acentos e usa os índices trigrama (ver busca.py)
             campos_map = {
-                'nome': 'nome__icontains',
-                'matricula': 'matricula__icontains',
+                'nome': 'nome__busca',
+                'matricula': 'matricula__busca',
                 'cpf': 'cpf__icontains',
-                'cargo': 'cargo__nome_cargo__icontains',
-                'setor': 'setor__nome_setor__icontains',
-                'filial_nome': 'filiais__nome__icontains'
+                'cargo': 'cargo__nome_cargo__busca',
+                'setor': 'setor__nome_setor__busca',
+                'filial_nome': 'filiais__nome__busca'
             }
 
             # Busca por Nulos ("Sem", "Vazio")
@@ -380,9 +636,9 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         # Passa as filiais do coordenador para o serializer filtrar o cadastro
         context = super().get_serializer_context()
-        user = self.request.user
-        if user.is_authenticated and user.tipo == 'COORDENADOR':
-            context['filial_queryset'] = user.filiais.all()
+        escopo = obter_escopo(self.request)
+        if escopo.restrito:
+            context['filial_queryset'] = escopo.filiais
         return context
 
     def get_permissions(self):
@@ -398,7 +654,9 @@ class FuncionarioViewSet(viewsets.ModelViewSet):
         return methods
 
 
-class FerramentaViewSet(viewsets.ModelViewSet):
+class FerramentaViewSet(ETagPorVersaoMixin, SincronizacaoIncrementalMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('ferramenta', 'deposito', 'filial')
+    caminho_filial = 'deposito__filial'
     serializer_class = FerramentaSerializer
     permission_classes = [IsAuthenticated]
     queryset = Ferramenta.objects.all().order_by('nome')
@@ -414,8 +672,8 @@ class FerramentaViewSet(viewsets.ModelViewSet):
         ferramenta = self.get_object()
         if ferramenta.estado != Ferramenta.EstadoChoices.INATIVA:
              return Response({"error": "Apenas ferramentas inativas podem ser reativadas."}, status=status.HTTP_400_BAD_REQUEST)
-        ferramenta.estado = Ferramenta.EstadoChoices.DISPONIVEL
-        ferramenta.save()
+        if not ferramenta.transicionar(Ferramenta.EstadoChoices.INATIVA, Ferramenta.EstadoChoices.DISPONIVEL):
+             return Response({"error": "Apenas ferramentas inativas podem ser reativadas."}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"status": "Ferramenta reativada com sucesso"})
 
     @action(detail=True, methods=['patch'])
@@ -424,16 +682,14 @@ class FerramentaViewSet(viewsets.ModelViewSet):
         # REGRA: Só desativa se estiver Disponível
         if ferramenta.estado != Ferramenta.EstadoChoices.DISPONIVEL:
              return Response({"error": "Apenas ferramentas disponíveis podem ser desativadas."}, status=status.HTTP_400_BAD_REQUEST)
-        ferramenta.estado = Ferramenta.EstadoChoices.INATIVA
-        ferramenta.save()
+        # UPDATE condicional: falha se um empréstimo/manutenção pegou a ferramenta nesse meio tempo
+        if not ferramenta.transicionar(Ferramenta.EstadoChoices.DISPONIVEL, Ferramenta.EstadoChoices.INATIVA):
+             return Response({"error": "Apenas ferramentas disponíveis podem ser desativadas."}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"status": "Ferramenta inativada com sucesso"})
 
     def get_queryset(self):
-        user = self.request.user
         queryset = Ferramenta.objects.all().order_by('nome')
-
-        if user.tipo == 'COORDENADOR':
-            queryset = queryset.filter(deposito__filial__in=user.filiais.all())
+        queryset = obter_escopo(self.request).filtrar(queryset, 'deposito__filial')
 
         filial_id = self.request.query_params.get('filial')
         if filial_id:
@@ -460,12 +716,12 @@ class FerramentaViewSet(viewsets.ModelViewSet):
 
             else:
                 campos_map = {
-                    'nome': 'nome__icontains',
-                    'numero_serie': 'numero_serie__icontains',
-                    'descricao': 'descricao__icontains',
-                    'deposito': 'deposito__nome__icontains',
-                    'filial_nome': 'deposito__filial__nome__icontains',
-                    'cidade': 'deposito__filial__cidade__icontains'
+                    'nome': 'nome__busca',
+                    'numero_serie': 'numero_serie__busca',
+                    'descricao': 'descricao__busca',
+                    'deposito': 'deposito__nome__busca',
+                    'filial_nome': 'deposito__filial__nome__busca',
+                    'cidade': 'deposito__filial__cidade__busca'
                 }
                 if search_field in campos_map:
                     lookup = campos_map[search_field]
@@ -481,7 +737,9 @@ class FerramentaViewSet(viewsets.ModelViewSet):
         return queryset
 
 
-class EmprestimoViewSet(viewsets.ModelViewSet):
+class EmprestimoViewSet(ETagPorVersaoMixin, SincronizacaoIncrementalMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('emprestimo', 'ferramenta', 'funcionario')
+    caminho_filial = 'ferramenta__deposito__filial'
     serializer_class = EmprestimoSerializer
     permission_classes = [IsAuthenticated]
     queryset = Emprestimo.objects.all()
@@ -492,12 +750,209 @@ class EmprestimoViewSet(viewsets.ModelViewSet):
         'data_emprestimo', 'data_devolucao', 'observacoes'
     ]
 
+    # Limite de itens por requisição nas operações em lote
+    max_itens_lote = 200
+
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """
+        Empréstimo em lote (ex: retirada de várias ferramentas no início do turno).
+        Corpo: {"itens": [{"ferramenta": 1, "funcionario": 2, "data_emprestimo": "2025-01-01", "observacoes": "..."}, ...]}
+
+        As regras do EmprestimoSerializer são checadas para o lote inteiro com poucas consultas
+        e os empréstimos válidos são gravados numa única transação.
+        Itens inválidos não impedem os demais: a resposta traz o resultado de cada item.
+        """
+        itens = request.data.get('itens') if isinstance(request.data, dict) else None
+        if not isinstance(itens, list) or not itens:
+            return Response({"error": "Envie uma lista não vazia em 'itens'."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(itens) > self.max_itens_lote:
+            return Response({"error": f"O lote aceita no máximo {self.max_itens_lote} itens."}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados = [None] * len(itens)
+        validos = []
+        for indice, item in enumerate(itens):
+            item_serializer = EmprestimoLoteItemSerializer(data=item)
+            if item_serializer.is_valid():
+                validos.append((indice, item_serializer.validated_data))
+            else:
+                resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': item_serializer.errors}
+
+        with transaction.atomic():
+            # Trava as ferramentas do lote (evita que outro balcão empreste a mesma ao mesmo tempo)
+            ferramentas_queryset = Ferramenta.objects.select_for_update(of=('self',)).select_related('deposito__filial')
+            ferramentas_queryset = obter_escopo(request).filtrar(ferramentas_queryset, 'deposito__filial')
+            ferramentas = ferramentas_queryset.in_bulk([dados['ferramenta'] for _, dados in validos])
+
+            funcionario_ids = [dados['funcionario'] for _, dados in validos]
+            funcionarios = Funcionario.objects.in_bulk(funcionario_ids)
+            vinculos = set(
+                Funcionario.filiais.through.objects.filter(funcionario_id__in=funcionario_ids)
+                .values_list('funcionario_id', 'filial_id')
+            )
+
+            novos = []
+            ferramentas_usadas = set()
+            for indice, dados in validos:
+                ferramenta = ferramentas.get(dados['ferramenta'])
+                funcionario = funcionarios.get(dados['funcionario'])
+                erros = {}
+
+                if ferramenta is None:
+                    erros['ferramenta'] = ["Ferramenta não encontrada."]
+                elif ferramenta.id in ferramentas_usadas:
+                    erros['ferramenta'] = [f"A ferramenta '{ferramenta.nome}' aparece mais de uma vez no lote."]
+                # REGRA: Ferramenta deve estar DISPONIVEL
+                elif ferramenta.estado != Ferramenta.EstadoChoices.DISPONIVEL:
+                    erros['ferramenta'] = [f"A ferramenta '{ferramenta.nome}' não está disponível. Estado atual: {ferramenta.get_estado_display()}."]
+
+                if funcionario is None:
+                    erros['funcionario'] = ["Funcionário não encontrado."]
+                # REGRA DE LOCALIZAÇÃO: Funcionário deve ser da mesma filial da ferramenta
+                elif ferramenta is not None and (funcionario.id, ferramenta.deposito.filial_id) not in vinculos:
+                    erros['funcionario'] = [f"O funcionário {funcionario.nome} não pertence à filial '{ferramenta.deposito.filial.nome}'."]
+
+                if erros:
+                    resultados[indice] = {'indice': indice, 'status': 'erro', 'erros': erros}
+                    continue
+
+                ferramentas_usadas.add(ferramenta.id)
+                emprestimo = Emprestimo(
+                    ferramenta=ferramenta,
+                    funcionario=funcionario,
+                    observacoes=dados.get('observacoes'),
+                )
+                if dados.get('data_emprestimo'):
+                    emprestimo.data_emprestimo = dados['data_emprestimo']
+                novos.append((indice, emprestimo))
+
+            if novos:
+                emprestimos = [emprestimo for _, emprestimo in novos]
+                # Nome automático (mesma regra do Emprestimo.save): ids reservados antes do INSERT
+                ids = reservar_ids(Emprestimo, len(emprestimos))
+                if ids is not None:
+                    for emprestimo, emprestimo_id in zip(emprestimos, ids):
+                        emprestimo.pk = emprestimo_id
+                        emprestimo.nome = f"Empréstimo {emprestimo_id}"
+                emprestimos = Emprestimo.objects.bulk_create(emprestimos)
+                if ids is None:
+                    for emprestimo in emprestimos:
+                        emprestimo.nome = f"Empréstimo {emprestimo.id}"
+                    Emprestimo.objects.bulk_update(emprestimos, ['nome'])
+
+                # Início de Empréstimo: muda o estado de todas as ferramentas com um UPDATE só
+                ferramentas_emprestadas = [emprestimo.ferramenta for emprestimo in emprestimos]
+                Ferramenta.objects.filter(id__in=[f.id for f in ferramentas_emprestadas]).update(estado=Ferramenta.EstadoChoices.EMPRESTADA, atualizado_em=Now())
+                ContadorEstoque.registrar_transicao_em_massa(
+                    ferramentas_emprestadas, Ferramenta.EstadoChoices.DISPONIVEL, Ferramenta.EstadoChoices.EMPRESTADA
+                )
+                for ferramenta in ferramentas_emprestadas:
+                    ferramenta.estado = Ferramenta.EstadoChoices.EMPRESTADA
+                # bulk_create/update não passam pelos sinais: registra as versões aqui
+                depositos = {ferramenta.deposito_id for ferramenta in ferramentas_emprestadas}
+                VersaoTabela.registrar_alteracao(['emprestimo', 'ferramenta'], depositos=depositos)
+                publicar_estado_ferramentas(
+                    [(ferramenta.id, ferramenta.deposito_id) for ferramenta in ferramentas_emprestadas],
+                    Ferramenta.EstadoChoices.EMPRESTADA
+                )
+
+        contexto = self.get_serializer_context()
+        for indice, emprestimo in novos:
+            resultados[indice] = {
+                'indice': indice,
+                'status': 'criado',
+                'emprestimo': EmprestimoSerializer(emprestimo, context=contexto).data
+            }
+
+        criados = len(novos)
+        return Response(
+            {'criados': criados, 'falhas': len(itens) - criados, 'resultados': resultados},
+            status=status.HTTP_201_CREATED if criados else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['post'])
+    def devolver_lote(self, request):
+        """
+        Devolução em lote (ex: fim de turno).
+        Corpo: {"ids": [1, 2, 3], "data_devolucao": "2025-01-01"} (data padrão: hoje)
+
+        Faz o mesmo que a finalização de um empréstimo no Emprestimo.save (snapshot do histórico,
+        liberação da ferramenta e quebra dos vínculos), mas com um UPDATE por tabela.
+        """
+        entrada = DevolucaoLoteSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(entrada.validated_data['ids']))
+        data_devolucao = entrada.validated_data.get('data_devolucao', datetime.date.today())
+
+        resultados = []
+        with transaction.atomic():
+            emprestimos = self.get_queryset().select_for_update(of=('self',)).in_bulk(ids)
+            validos = []
+            for emprestimo_id in ids:
+                emprestimo = emprestimos.get(emprestimo_id)
+                if emprestimo is None:
+                    erros = {"id": ["Empréstimo não encontrado."]}
+                elif not emprestimo.ativo:
+                    erros = {"ativo": ["O empréstimo já está finalizado."]}
+                # REGRA: Data de devolução >= Data empréstimo
+                elif data_devolucao < emprestimo.data_emprestimo:
+                    erros = {"data_devolucao": ["A data de devolução não pode ser anterior à data do empréstimo."]}
+                else:
+                    validos.append(emprestimo)
+                    resultados.append({'id': emprestimo_id, 'status': 'finalizado'})
+                    continue
+                resultados.append({'id': emprestimo_id, 'status': 'erro', 'erros': erros})
+
+            if validos:
+                # Snapshot + finalização + quebra dos vínculos num único UPDATE:
+                # as expressões do SET enxergam os valores antigos de ferramenta_id/funcionario_id.
+                Emprestimo.objects.filter(id__in=[emprestimo.id for emprestimo in validos]).update(
+                    ativo=False,
+                    data_devolucao=data_devolucao,
+                    nome_ferramenta_historico=Coalesce(campo_da_ferramenta('nome'), F('nome_ferramenta_historico')),
+                    numero_serie_ferramenta_historico=Coalesce(campo_da_ferramenta('numero_serie'), F('numero_serie_ferramenta_historico')),
+                    nome_funcionario_historico=Coalesce(campo_do_funcionario('nome'), F('nome_funcionario_historico')),
+                    matricula_funcionario_historico=Coalesce(campo_do_funcionario('matricula'), F('matricula_funcionario_historico')),
+                    ferramenta=None,
+                    funcionario=None,
+                    atualizado_em=Now(),
+                )
+                Remocao.registrar_saida_por_ferramenta('emprestimo', {
+                    emprestimo.id: emprestimo.ferramenta_id for emprestimo in validos if emprestimo.ferramenta_id
+                })
+                depositos = liberar_ferramentas(
+                    [emprestimo.ferramenta_id for emprestimo in validos if emprestimo.ferramenta_id], Ferramenta.EstadoChoices.EMPRESTADA
+                )
+                VersaoTabela.registrar_alteracao('emprestimo', depositos=depositos)
+
+        return resposta_finalizacao_lote(resultados)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Exporta o histórico de empréstimos (CSV ou NDJSON) em streaming.
+        Aceita os mesmos filtros da listagem. Ex: ?formato=ndjson&filial=1&ativo=false
+        """
+        formato = request.query_params.get('formato', 'csv')
+        # Dado ativo (relacionamento) ou histórico (snapshot), como no serializer
+        queryset = self.filter_queryset(self.get_queryset()).annotate(
+            ferramenta_nome=Coalesce('ferramenta__nome', 'nome_ferramenta_historico'),
+            ferramenta_numero_serie=Coalesce('ferramenta__numero_serie', 'numero_serie_ferramenta_historico'),
+            funcionario_nome=Coalesce('funcionario__nome', 'nome_funcionario_historico'),
+            funcionario_matricula=Coalesce('funcionario__matricula', 'matricula_funcionario_historico'),
+        )
+        colunas = [
+            'id', 'nome', 'ferramenta_nome', 'ferramenta_numero_serie', 'funcionario_nome', 'funcionario_matricula',
+            'data_emprestimo', 'data_devolucao', 'observacoes', 'ativo'
+        ]
+        response = resposta_exportacao(request, queryset, colunas, formato, 'emprestimos')
+        if response is None:
+            return Response({"error": "Formato inválido. Use 'csv' ou 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+        return response
+
     def get_queryset(self):
-        user = self.request.user
         queryset = Emprestimo.objects.all().order_by('-data_emprestimo')
-
-        if user.tipo == 'COORDENADOR':
-            queryset = queryset.filter(ferramenta__deposito__filial__in=user.filiais.all())
+        queryset = obter_escopo(self.request).filtrar(queryset, 'ferramenta__deposito__filial')
 
         filial_id = self.request.query_params.get('filial')
         if filial_id:
@@ -553,28 +1008,28 @@ class EmprestimoViewSet(viewsets.ModelViewSet):
                 # Busca Híbrida (Texto e Histórico)
                 if search_field == 'ferramenta': 
                     queryset = queryset.filter(
-                        Q(ferramenta__nome__icontains=search_value) | 
-                        Q(nome_ferramenta_historico__icontains=search_value)
+                        Q(ferramenta__nome__busca=search_value) | 
+                        Q(nome_ferramenta_historico__busca=search_value)
                     )
                 elif search_field == 'serial': 
                     queryset = queryset.filter(
-                        Q(ferramenta__numero_serie__icontains=search_value) | 
-                        Q(numero_serie_ferramenta_historico__icontains=search_value)
+                        Q(ferramenta__numero_serie__busca=search_value) | 
+                        Q(numero_serie_ferramenta_historico__busca=search_value)
                     )
                 elif search_field == 'funcionario':
                     queryset = queryset.filter(
-                        Q(funcionario__nome__icontains=search_value) | 
-                        Q(nome_funcionario_historico__icontains=search_value)
+                        Q(funcionario__nome__busca=search_value) | 
+                        Q(nome_funcionario_historico__busca=search_value)
                     )
                 elif search_field == 'matricula':
                     queryset = queryset.filter(
-                        Q(funcionario__matricula__icontains=search_value) | 
-                        Q(matricula_funcionario_historico__icontains=search_value)
+                        Q(funcionario__matricula__busca=search_value) | 
+                        Q(matricula_funcionario_historico__busca=search_value)
                     )
                 else:
                     campos_map = {
-                        'nome': 'nome__icontains',
-                        'observacoes': 'observacoes__icontains'
+                        'nome': 'nome__busca',
+                        'observacoes': 'observacoes__busca'
                     }
                     if search_field in campos_map:
                         queryset = queryset.filter(**{campos_map[search_field]: search_value})
@@ -589,15 +1044,15 @@ class EmprestimoViewSet(viewsets.ModelViewSet):
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        user = self.request.user
         ferramenta_queryset = Ferramenta.objects.filter(estado=Ferramenta.EstadoChoices.DISPONIVEL)
-        if user.is_authenticated and user.tipo == 'COORDENADOR':
-            ferramenta_queryset = ferramenta_queryset.filter(deposito__filial__in=user.filiais.all())
+        ferramenta_queryset = obter_escopo(self.request).filtrar(ferramenta_queryset, 'deposito__filial')
         context['ferramenta_queryset'] = ferramenta_queryset
         return context
 
 
-class ManutencaoViewSet(viewsets.ModelViewSet):
+class ManutencaoViewSet(ETagPorVersaoMixin, SincronizacaoIncrementalMixin, CarregamentoAntecipadoMixin, viewsets.ModelViewSet):
+    tabelas_versionadas = ('manutencao', 'ferramenta')
+    caminho_filial = 'ferramenta__deposito__filial'
     serializer_class = ManutencaoSerializer
     permission_classes = [IsAuthenticated]
     queryset = Manutencao.objects.all()
@@ -606,12 +1061,74 @@ class ManutencaoViewSet(viewsets.ModelViewSet):
         'tipo', 'data_inicio', 'data_fim', 'observacoes'
     ]
 
+    @action(detail=False, methods=['post'])
+    def finalizar_lote(self, request):
+        """
+        Finalização de manutenções em lote.
+        Corpo: {"ids": [1, 2, 3], "data_fim": "2025-01-01"} (data padrão: hoje)
+        Equivale ao Manutencao.save com ativo=False, com um UPDATE por tabela.
+        """
+        entrada = FinalizacaoManutencaoLoteSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(entrada.validated_data['ids']))
+        data_fim = entrada.validated_data.get('data_fim', datetime.date.today())
+
+        resultados = []
+        with transaction.atomic():
+            manutencoes = self.get_queryset().select_for_update(of=('self',)).in_bulk(ids)
+            validas = []
+            for manutencao_id in ids:
+                manutencao = manutencoes.get(manutencao_id)
+                if manutencao is None:
+                    resultados.append({'id': manutencao_id, 'status': 'erro', 'erros': {"id": ["Manutenção não encontrada."]}})
+                elif not manutencao.ativo:
+                    resultados.append({'id': manutencao_id, 'status': 'erro', 'erros': {"ativo": ["A manutenção já está finalizada."]}})
+                else:
+                    validas.append(manutencao)
+                    resultados.append({'id': manutencao_id, 'status': 'finalizado'})
+
+            if validas:
+                Manutencao.objects.filter(id__in=[manutencao.id for manutencao in validas]).update(
+                    ativo=False,
+                    data_fim=data_fim,
+                    nome_ferramenta_historico=Coalesce(campo_da_ferramenta('nome'), F('nome_ferramenta_historico')),
+                    numero_serie_ferramenta_historico=Coalesce(campo_da_ferramenta('numero_serie'), F('numero_serie_ferramenta_historico')),
+                    ferramenta=None,
+                    atualizado_em=Now(),
+                )
+                Remocao.registrar_saida_por_ferramenta('manutencao', {
+                    manutencao.id: manutencao.ferramenta_id for manutencao in validas if manutencao.ferramenta_id
+                })
+                depositos = liberar_ferramentas(
+                    [manutencao.ferramenta_id for manutencao in validas if manutencao.ferramenta_id], Ferramenta.EstadoChoices.EM_MANUTENCAO
+                )
+                VersaoTabela.registrar_alteracao('manutencao', depositos=depositos)
+
+        return resposta_finalizacao_lote(resultados)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Exporta o histórico de manutenções (CSV ou NDJSON) em streaming.
+        Aceita os mesmos filtros da listagem. Ex: ?formato=csv&search_field=data_inicio&search_value=xx/05/2025
+        """
+        formato = request.query_params.get('formato', 'csv')
+        queryset = self.filter_queryset(self.get_queryset()).annotate(
+            ferramenta_nome=Coalesce('ferramenta__nome', 'nome_ferramenta_historico'),
+            ferramenta_numero_serie=Coalesce('ferramenta__numero_serie', 'numero_serie_ferramenta_historico'),
+        )
+        colunas = [
+            'id', 'nome', 'tipo', 'ferramenta_nome', 'ferramenta_numero_serie',
+            'observacoes', 'data_inicio', 'data_fim', 'ativo'
+        ]
+        response = resposta_exportacao(request, queryset, colunas, formato, 'manutencoes')
+        if response is None:
+            return Response({"error": "Formato inválido. Use 'csv' ou 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+        return response
+
     def get_queryset(self):
-        user = self.request.user
         queryset = Manutencao.objects.all().order_by('-data_inicio')
-
-        if user.tipo == 'COORDENADOR':
-            queryset = queryset.filter(ferramenta__deposito__filial__in=user.filiais.all())
+        queryset = obter_escopo(self.request).filtrar(queryset, 'ferramenta__deposito__filial')
 
         filial_id = self.request.query_params.get('filial')
         if filial_id:
@@ -651,18 +1168,18 @@ class ManutencaoViewSet(viewsets.ModelViewSet):
             else:
                 if search_field == 'ferramenta':
                     queryset = queryset.filter(
-                        Q(ferramenta__nome__icontains=search_value) | 
-                        Q(nome_ferramenta_historico__icontains=search_value)
+                        Q(ferramenta__nome__busca=search_value) | 
+                        Q(nome_ferramenta_historico__busca=search_value)
                     )
                 elif search_field == 'serial':
                     queryset = queryset.filter(
-                        Q(ferramenta__numero_serie__icontains=search_value) | 
-                        Q(numero_serie_ferramenta_historico__icontains=search_value)
+                        Q(ferramenta__numero_serie__busca=search_value) | 
+                        Q(numero_serie_ferramenta_historico__busca=search_value)
                     )
                 else:
                     campos_map = {
-                        'nome': 'nome__icontains',
-                        'observacoes': 'observacoes__icontains'
+                        'nome': 'nome__busca',
+                        'observacoes': 'observacoes__busca'
                     }
                     if search_field in campos_map:
                         queryset = queryset.filter(**{campos_map[search_field]: search_value})
@@ -677,9 +1194,7 @@ class ManutencaoViewSet(viewsets.ModelViewSet):
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        user = self.request.user
         ferramenta_queryset = Ferramenta.objects.filter(estado=Ferramenta.EstadoChoices.DISPONIVEL)
-        if user.is_authenticated and user.tipo == 'COORDENADOR':
-            ferramenta_queryset = ferramenta_queryset.filter(deposito__filial__in=user.filiais.all())
+        ferramenta_queryset = obter_escopo(self.request).filtrar(ferramenta_queryset, 'deposito__filial')
         context['ferramenta_queryset'] = ferramenta_queryset
         return context
\ No newline at end of file
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.settings import api_settings
+
+from .autenticacao import CLAIM_VERSAO, JWTEventosAuthentication, JWTSemConsultaAuthentication, aversao_token_vigente
+from .escopo import obter_escopo
+from .eventos import obter_broker
+from .sincronizacao import responder_sincronizacao
+from .versoes import aetag_da_requisicao, nao_modificado, aplicar_etag
+from .views import DashboardView, FerramentaViewSet, EmprestimoViewSet
+
+# --- VIEWS ASSÍNCRONAS (LEITURA) ---
+# Versões assíncronas dos endpoints de leitura mais acessados (dashboard e listagens).
+# Servidas por um servidor ASGI (ver asgi.py), um único processo atende muitas conexões
+# lentas ao mesmo tempo (ex: tablets das filiais em rede ruim): enquanto uma requisição
+# espera o banco ou a rede, o processo segue atendendo as outras.
+# Mesmos parâmetros, regras de escopo e formato de resposta das views síncronas.
+# Autenticação somente por token JWT (JWTSemConsultaAuthentication).
+
+# No ASGI, cada requisição em andamento usa a própria thread e a própria conexão com o banco.
+# O limite abaixo (por processo) evita que uma rajada de clientes esgote o max_connections do Postgres:
+# as demais requisições esperam a vez sem ocupar conexão. Com DB_POOL=true, use o mesmo valor de DB_POOL_MAX.
+LIMITE_REQUISICOES_NO_BANCO = 20
+
+_vagas_por_loop = weakref.WeakKeyDictionary()
+
+
+def _vagas_no_banco():
+    loop = asyncio.get_running_loop()
+    if loop not in _vagas_por_loop:
+        _vagas_por_loop[loop] = asyncio.Semaphore(LIMITE_REQUISICOES_NO_BANCO)
+    return _vagas_por_loop[loop]
+
+
+def _resposta_json(dados, status_code=status.HTTP_200_OK, headers=None):
+    return HttpResponse(JSONRenderer().render(dados), content_type='application/json', status=status_code, headers=headers)
+
+
+class VisaoAssincrona(View):
+    """
+    Base das views assíncronas: autentica pelo token, monta o Request do DRF
+    (query_params, contexto dos serializers) e converte exceções do DRF em JSON.
+    As subclasses implementam 'responder(request)', que devolve (dados, status, headers).
+    """
+    http_method_names = ['get', 'options']
+    autenticacao = JWTSemConsultaAuthentication()
+    etag = None # Definida pelas subclasses que suportam requisição condicional (ver ListaAssincrona)
+
+    async def get(self, request, *args, **kwargs):
+        async with _vagas_no_banco():
+            try:
+                return await self._atender(request)
+            finally:
+                # Devolve a conexão (ao pool, se DB_POOL=true) antes de liberar a vaga;
+                # sem isso ela só seria fechada no fim da resposta
+                await sync_to_async(connections.close_all)()
+
+    async def _atender(self, request):
+        try:
+            drf_request = await self._autenticar(request)
+            resposta = _resposta_json(*await self.responder(drf_request))
+            if self.etag and resposta.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                aplicar_etag(resposta, self.etag)
+            return resposta
+        except APIException as erro:
+            return self._resposta_erro(request, erro)
+
+    async def _autenticar(self, request):
+        """ Request do DRF com o usuário do token; NotAuthenticated se não houver token """
+        autenticado = await self.autenticacao.aauthenticate(request)
+        if autenticado is None:
+            raise NotAuthenticated()
+
+        drf_request = Request(request)
+        drf_request.user, drf_request.auth = autenticado
+        return drf_request
+
+    def _resposta_erro(self, request, erro):
+        dados = erro.detail if isinstance(erro.detail, (list, dict)) else {'detail': erro.detail}
+        headers = None
+        if erro.status_code == status.HTTP_401_UNAUTHORIZED:
+            headers = {'WWW-Authenticate': self.autenticacao.authenticate_header(request)}
+        return _resposta_json(dados, erro.status_code, headers)
+
+    async def responder(self, request):
+        raise NotImplementedError
+
+
+class DashboardAsyncView(VisaoAssincrona):
+    """ Mesmo payload do DashboardView, com as duas agregações feitas pelo ORM assíncrono """
+
+    async def responder(self, request):
+        escopo = obter_escopo(request)
+        await escopo.acarregar()
+
+        escopo_filiais, erro = DashboardView.resolver_escopo(escopo, request.query_params.get('filial'))
+        if erro:
+            return {"error": erro[0]}, erro[1], None
+
+        consulta_ferramentas, agregados_ferramentas = DashboardView.consulta_ferramentas(escopo_filiais)
+        consulta_funcionarios, agregados_funcionarios = DashboardView.consulta_funcionarios(escopo_filiais)
+        dados = DashboardView.montar_resposta(
+            await consulta_ferramentas.aaggregate(**agregados_ferramentas),
+            await consulta_funcionarios.aaggregate(**agregados_funcionarios),
+        )
+        return dados, status.HTTP_200_OK, None
+
+
+class ListaAssincrona(VisaoAssincrona):
+    """
+    Listagem assíncrona reaproveitando a viewset síncrona: get_queryset, filtros, busca,
+    paginação (PaginacaoSobDemanda.apaginate_queryset) e serializer são os mesmos.
+    """
+    viewset_class = None
+
+    async def responder(self, request):
+        viewset = self.viewset_class(request=request, args=(), kwargs={}, format_kwarg=None, action='list')
+        viewset.headers = {}
+        viewset.check_permissions(request)
+
+        # Requisição condicional: mesmas tabelas/versões da viewset (ver ETagPorVersaoMixin)
+        self.etag = await aetag_da_requisicao(request, viewset.tabelas_versionadas)
+        if nao_modificado(request, self.etag):
+            return None, status.HTTP_304_NOT_MODIFIED, None
+
+        # Sincronização incremental: mesmo caminho síncrono da viewset (consultas pequenas e pontuais)
+        if 'atualizado_desde' in request.query_params:
+            resposta = await sync_to_async(responder_sincronizacao)(viewset, request)
+            return resposta.data, resposta.status_code, None
+
+        # get_queryset pode consultar o banco ao montar filtros (ex: filtro por funcionário
+        # em EmprestimoViewSet), por isso roda na thread síncrona; a listagem em si é assíncrona.
+        queryset = await sync_to_async(lambda: viewset.filter_queryset(viewset.get_queryset()))()
+
+        paginador = viewset.paginator
+        pagina = await paginador.apaginate_queryset(queryset, request, view=viewset)
+        dados = viewset.get_serializer(pagina, many=True).data
+        resposta = paginador.get_paginated_response(dados)
+        headers = {nome: valor for nome, valor in resposta.items() if nome.lower() != 'content-type'}
+        return resposta.data, resposta.status_code, headers
+
+
+class FerramentaListaAsyncView(ListaAssincrona):
+    viewset_class = FerramentaViewSet
+
+
+class EmprestimoListaAsyncView(ListaAssincrona):
+    viewset_class = EmprestimoViewSet
+
+
+# --- EVENTOS EM TEMPO REAL (SSE) ---
+
+# Intervalo do comentário "ping": mantém a conexão viva em proxies e reconfere a sessão
+INTERVALO_PING = 15
+
+# Espera sugerida ao navegador antes de reconectar, em milissegundos
+ESPERA_RECONEXAO_CLIENTE = 3000
+
+
+def _evento_sse(tipo, dados):
+    return f'event: {tipo}\ndata: {json.dumps(dados)}\n\n'
+
+
+class EventosAsyncView(VisaoAssincrona):
+    """
+    Server-Sent Events com as mudanças de estado das ferramentas das filiais do usuário
+    (ver eventos.py), no lugar de recarregar as listagens periodicamente. No navegador:
+        new EventSource('/api/eventos/?token=<access>')
+    Eventos: 'conectado' (também a cada reconexão: buscar o que mudou com ?atualizado_desde=),
+    'estado_ferramenta', 'resincronizar' (eventos perdidos: buscar de novo) e 'encerrado'
+    (token revogado ou expirado: renovar o token e reconectar).
+    O banco só é usado na autenticação: a conexão aberta não ocupa vaga nem conexão do pool.
+    """
+    autenticacao = JWTEventosAuthentication()
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            # Sob WSGI a resposta só sairia no fim, e cada conexão prenderia um worker
+            return _resposta_json(
+                {"error": "Eventos em tempo real disponíveis apenas com o servidor ASGI."},
+                status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        async with _vagas_no_banco():
+            try:
+                drf_request = await self._autenticar(request)
+                escopo = obter_escopo(drf_request)
+                await escopo.acarregar()
+            except APIException as erro:
+                return self._resposta_erro(request, erro)
+            finally:
+                await sync_to_async(connections.close_all)()
+
+        resposta = StreamingHttpResponse(
+            self._transmitir(drf_request.auth, escopo.filial_ids), content_type='text/event-stream'
+        )
+        resposta['Cache-Control'] = 'no-cache'
+        resposta['X-Accel-Buffering'] = 'no' # nginx: entrega cada evento na hora
+        return resposta
+
+    async def _transmitir(self, token, filial_ids):
+        assinatura = obter_broker().assinar(filial_ids)
+        try:
+            yield f'retry: {ESPERA_RECONEXAO_CLIENTE}\n\n'
+            yield _evento_sse('conectado', {'filiais': sorted(filial_ids) if filial_ids is not None else None})
+            while True:
+                try:
+                    evento = await asyncio.wait_for(assinatura.proximo(), INTERVALO_PING)
+                except asyncio.TimeoutError:
+                    if not await self._sessao_valida(token):
+                        yield _evento_sse('encerrado', {'detail': 'Sessão expirada. Faça login novamente.'})
+                        return
+                    yield ': ping\n\n'
+                    continue
+                yield _evento_sse(evento['tipo'], evento)
+        finally:
+            assinatura.cancelar()
+
+    async def _sessao_valida(self, token):
+        """ A conexão pode durar mais que o token: confere expiração e revogação (versão) a cada ping """
+        if token['exp'] <= time.time():
+            return False
+        if CLAIM_VERSAO not in token:
+            return True
+        async with _vagas_no_banco():
+            try:
+                return await aversao_token_vigente(int(token[api_settings.USER_ID_CLAIM])) == token[CLAIM_VERSAO]
+            finally:
+                await sync_to_async(connections.close_all)()
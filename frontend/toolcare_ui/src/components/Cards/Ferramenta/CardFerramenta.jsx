@@ -8,16 +8,19 @@ const CardFerramenta = ({ ferramenta, onUpdate }) => {
     const [showModal, setShowModal] = useState(false);
     const [imageSrc, setImageSrc] = useState(defaultImg);
 
+    // Listagem usa a miniatura (WebP reduzido); o modal usa a versão média
+    const foto = ferramenta.foto_miniatura || ferramenta.foto;
+
     useEffect(() => {
-        if (ferramenta.foto) {
+        if (foto) {
             const img = new Image();
-            img.src = ferramenta.foto;
-            img.onload = () => setImageSrc(ferramenta.foto);
+            img.src = foto;
+            img.onload = () => setImageSrc(foto);
             img.onerror = () => setImageSrc(defaultImg);
         } else {
             setImageSrc(defaultImg);
         }
-    }, [ferramenta.foto]);
+    }, [foto]);
 
     const formatStatus = (status) => {
         const map = {
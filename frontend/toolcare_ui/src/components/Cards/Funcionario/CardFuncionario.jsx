@@ -8,16 +8,19 @@ const CardFuncionario = ({ funcionario, onUpdate }) => {
     const [showModal, setShowModal] = useState(false);
     const [imageSrc, setImageSrc] = useState(defaultImg);
 
+    // Listagem usa a miniatura (WebP reduzido); o modal usa a versão média
+    const foto = funcionario.foto_miniatura || funcionario.foto;
+
     useEffect(() => {
-        if (funcionario.foto) {
+        if (foto) {
             const img = new Image();
-            img.src = funcionario.foto;
-            img.onload = () => setImageSrc(funcionario.foto);
+            img.src = foto;
+            img.onload = () => setImageSrc(foto);
             img.onerror = () => setImageSrc(defaultImg);
         } else {
             setImageSrc(defaultImg);
         }
-    }, [funcionario.foto]);
+    }, [foto]);
 
     const listaFiliais = funcionario.filiais_detalhes
         ? funcionario.filiais_detalhes.map(f => f.nome).join(', ')
@@ -46,9 +46,9 @@ const ModalFerramenta = ({ ferramenta, onClose, onUpdate }) => {
     });
 
     const [fileName, setFileName] = useState('');
-    const [imagePreview, setImagePreview] = useState(ferramenta.foto || defaultImg);
+    const [imagePreview, setImagePreview] = useState(ferramenta.foto_media || ferramenta.foto || defaultImg);
 
-    useEffect(() => { setImagePreview(ferramenta.foto || defaultImg); }, [ferramenta.foto]);
+    useEffect(() => { setImagePreview(ferramenta.foto_media || ferramenta.foto || defaultImg); }, [ferramenta.foto_media, ferramenta.foto]);
     useEffect(() => { if (editData.foto) setImagePreview(URL.createObjectURL(editData.foto)); }, [editData.foto]);
 
     useEffect(() => {
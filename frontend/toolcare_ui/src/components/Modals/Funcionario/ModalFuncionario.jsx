@@ -79,7 +79,7 @@ const ModalFuncionario = ({ funcionario, onClose, onUpdate }) => {
     });
 
     const [fileName, setFileName] = useState('');
-    const imagePreview = editData.foto ? URL.createObjectURL(editData.foto) : (funcionario.foto || defaultImg);
+    const imagePreview = editData.foto ? URL.createObjectURL(editData.foto) : (funcionario.foto_media || funcionario.foto || defaultImg);
 
     // Carregar opções ao editar
     useEffect(() => {